@@ -1,14 +1,347 @@
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event, bindparam, select
+from sqlalchemy.exc import DataError, IntegrityError
+
 from extensions import db
-from models import ActivityLog
+from models import ActivityLog, ActivityUnread, CompanyActivity, User
 
+logger = logging.getLogger(__name__)
 
-def log_activity(actor_id, action, detail="", company_id=None):
-    log = ActivityLog(
-        actor_id=actor_id,
-        company_id=company_id,
-        action=action,
-        detail=detail
+PENDING_KEY = 'company_activity_events'
+BELL_ROLES = ('admin', 'manager', 'buyer')
+
+# ActivityLog categories, matched against the action name in this order.
+ACTION_CATEGORIES = (
+    ('money', ('PAY', 'TRANSFER', 'WITHDRAW')),
+    ('auth', ('LOGIN', 'PASSWORD')),
+)
+DEFAULT_CATEGORY = 'other'
+
+
+def action_category(action):
+    """The category an ActivityLog ``action`` is filed under."""
+    action = (action or '').upper()
+    for category, markers in ACTION_CATEGORIES:
+        if any(marker in action for marker in markers):
+            return category
+    return DEFAULT_CATEGORY
+
+
+def _role_ids(role, **filters):
+    query = select(User.id).where(User.role == role)
+    for column, value in filters.items():
+        query = query.where(getattr(User, column) == value)
+    return query
+
+
+def bump_unread(executor, entries):
+    """Add freshly written activity rows to their viewers' unread counts.
+
+    Admins see every CompanyActivity row, managers those of their company,
+    and buyers their own ActivityLog rows. Only existing counter rows are
+    bumped; a viewer without one is counted from scratch on first read.
+    ``executor`` is the session or connection that wrote the rows.
+    """
+    per_company = {}
+    per_actor = {}
+    for table_name, row in entries:
+        if table_name == CompanyActivity.__table__.name:
+            per_company[row.get('company_id')] = per_company.get(row.get('company_id'), 0) + 1
+        elif table_name == ActivityLog.__table__.name and row.get('actor_id') is not None:
+            per_actor[row['actor_id']] = per_actor.get(row['actor_id'], 0) + 1
+
+    unread = ActivityUnread.__table__
+    increment = {unread.c.unread: unread.c.unread + bindparam('n')}
+    if per_company:
+        executor.execute(
+            unread.update().where(unread.c.user_id.in_(_role_ids('admin'))).values(unread=unread.c.unread + sum(per_company.values()))
+        )
+        managers = [{'b_company_id': company_id, 'n': n} for company_id, n in per_company.items() if company_id is not None]
+        if managers:
+            executor.execute(
+                unread.update().where(unread.c.user_id.in_(_role_ids('manager', company_id=bindparam('b_company_id')))).values(increment),
+                managers
+            )
+    if per_actor:
+        executor.execute(
+            unread.update().where(
+                unread.c.user_id == bindparam('b_user_id'),
+                unread.c.user_id.in_(_role_ids('buyer'))
+            ).values(increment),
+            [{'b_user_id': actor_id, 'n': n} for actor_id, n in per_actor.items()]
+        )
+
+
+def _count_since(user, seen_at):
+    if user.role == 'admin':
+        query = CompanyActivity.query
+    elif user.role == 'manager':
+        query = CompanyActivity.query.filter(CompanyActivity.company_id == user.company_id)
+    else:
+        query = ActivityLog.query.filter(ActivityLog.actor_id == user.id)
+    if seen_at is not None:
+        model = ActivityLog if user.role == 'buyer' else CompanyActivity
+        query = query.filter(model.created_at > seen_at)
+    return query.count()
+
+
+def unread_count(user):
+    """The bell badge count for ``user``: one primary-key lookup once seeded."""
+    if user.role not in BELL_ROLES:
+        return 0
+    counter = db.session.get(ActivityUnread, user.id)
+    if counter is not None:
+        return counter.unread
+    unread = _count_since(user, None)
+    try:
+        # Seeded on its own connection so rendering never commits the caller's session.
+        with db.engine.begin() as conn:
+            conn.execute(ActivityUnread.__table__.insert(), {'user_id': user.id, 'unread': unread})
+    except IntegrityError:
+        pass
+    return unread
+
+
+def mark_activity_seen(user):
+    """Zero ``user``'s unread count; the caller commits."""
+    now = datetime.utcnow()
+    updated = ActivityUnread.query.filter_by(user_id=user.id).update(
+        {ActivityUnread.unread: 0, ActivityUnread.seen_at: now}, synchronize_session=False
     )
-    db.session.add(log)
-    db.session.commit()
-    return log
+    if not updated:
+        db.session.add(ActivityUnread(user_id=user.id, unread=0, seen_at=now))
+
+
+def recount_unread(user):
+    """Recount ``user``'s badge from scratch, e.g. after a role change."""
+    counter = db.session.get(ActivityUnread, user.id)
+    if counter is not None:
+        counter.unread = _count_since(user, counter.seen_at)
+
+
+class ActivityWriter:
+    """Write CompanyActivity and ActivityLog rows in batches off the request path.
+
+    ``record`` stages a company event on the current session. Once that
+    session commits, its events join an in-process buffer; rolled-back
+    events are dropped with the rest of their transaction. ``enqueue`` adds
+    a row to the buffer straight away. A daemon thread bulk-inserts the
+    buffer, one executemany per table, every ``ACTIVITY_FLUSH_INTERVAL_MS``
+    or once ``ACTIVITY_FLUSH_BATCH`` rows are waiting.
+
+    At exit the buffer is flushed. Rows the database refuses go to a JSONL
+    spool, which is replayed by the next flusher to start. Events still
+    buffered when a process is killed outright are lost. With
+    ``ACTIVITY_BUFFER_ENABLED`` off, rows are written in the request as
+    they used to be.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.interval = 0.5
+        self.batch_size = 100
+        self.spool_path = None
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('ACTIVITY_BUFFER_ENABLED', True)
+        self.interval = app.config.get('ACTIVITY_FLUSH_INTERVAL_MS', 500) / 1000.0
+        self.batch_size = app.config.get('ACTIVITY_FLUSH_BATCH', 100)
+        self.spool_path = app.config.get('ACTIVITY_SPOOL_PATH') or os.path.join(app.instance_path, 'activity_spool.jsonl')
+        if not event.contains(db.session, 'after_commit', self._after_commit):
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+            atexit.register(self.shutdown)
+
+    def record(self, company_id, action, description):
+        if not self.enabled:
+            db.session.add(CompanyActivity(company_id=company_id, action=action, description=description))
+            bump_unread(db.session, [(CompanyActivity.__table__.name, {'company_id': company_id})])
+            return
+        session = db.session()
+        if not session.in_transaction():
+            # Tie the events to a transaction so a rollback is seen even if nothing else was written.
+            session.begin()
+        session.info.setdefault(PENDING_KEY, []).append((CompanyActivity.__table__.name, {
+            'company_id': company_id,
+            'action': action,
+            'description': description,
+            'created_at': datetime.utcnow(),
+        }))
+
+    def _after_commit(self, session):
+        events = session.info.pop(PENDING_KEY, None)
+        if events:
+            self._extend(events)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop(PENDING_KEY, None)
+
+    def enqueue(self, table, row):
+        """Buffer ``row`` for ``table`` without waiting on any transaction."""
+        row.setdefault('created_at', datetime.utcnow())
+        self._extend([(table.name, row)])
+
+    def _extend(self, entries):
+        with self._lock:
+            self._buffer.extend(entries)
+            size = len(self._buffer)
+        self._ensure_thread()
+        if size >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        # A forked worker inherits the buffer but not the parent's thread.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        self._replay_spool()
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _take(self):
+        with self._lock:
+            entries = list(self._buffer)
+            self._buffer.clear()
+        return entries
+
+    def _insert_table(self, conn, table, rows):
+        """Insert ``rows`` into ``table``; returns the rows actually written."""
+        try:
+            with conn.begin_nested():
+                conn.execute(table.insert(), rows)
+            return rows
+        except (IntegrityError, DataError):
+            pass
+        # One bad row (say, an actor deleted meanwhile) must not sink the batch.
+        written = []
+        for row in rows:
+            try:
+                with conn.begin_nested():
+                    conn.execute(table.insert(), row)
+                written.append(row)
+            except (IntegrityError, DataError):
+                logger.warning("Dropping %s row that cannot be inserted: %r", table.name, row)
+        return written
+
+    def _insert(self, entries):
+        by_table = {}
+        for table_name, row in entries:
+            by_table.setdefault(table_name, []).append(row)
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                written = []
+                for table_name, rows in by_table.items():
+                    written.extend(
+                        (table_name, row)
+                        for row in self._insert_table(conn, db.metadata.tables[table_name], rows)
+                    )
+                bump_unread(conn, written)
+
+    def flush(self):
+        """Insert everything buffered so far; returns the number of rows written."""
+        entries = self._take()
+        if not entries:
+            return 0
+        try:
+            self._insert(entries)
+        except Exception:
+            logger.exception("Could not write %d activity rows; spooling them", len(entries))
+            self._spool(entries)
+            return 0
+        return len(entries)
+
+    def _spool(self, entries):
+        try:
+            os.makedirs(os.path.dirname(self.spool_path) or '.', exist_ok=True)
+            with open(self.spool_path, 'a', encoding='utf-8') as spool:
+                for table_name, row in entries:
+                    row = dict(row, created_at=row['created_at'].isoformat())
+                    spool.write(json.dumps({'table': table_name, 'row': row}) + '\n')
+        except OSError:
+            logger.exception("Could not spool %d activity rows", len(entries))
+
+    def _replay_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        claimed = f"{self.spool_path}.{os.getpid()}"
+        try:
+            # Renaming first means only one worker replays a given spool.
+            os.replace(self.spool_path, claimed)
+        except OSError:
+            return
+        entries = []
+        with open(claimed, encoding='utf-8') as spool:
+            for line in spool:
+                if line.strip():
+                    item = json.loads(line)
+                    item['row']['created_at'] = datetime.fromisoformat(item['row']['created_at'])
+                    if item['table'] == ActivityLog.__table__.name:
+                        # Spooled before the category column existed.
+                        item['row'].setdefault('category', action_category(item['row'].get('action')))
+                    entries.append((item['table'], item['row']))
+        try:
+            if entries:
+                self._insert(entries)
+        except Exception:
+            logger.exception("Could not replay %d spooled activity rows", len(entries))
+            self._spool(entries)
+        os.remove(claimed)
+
+    def shutdown(self):
+        if self.app is not None:
+            self.flush()
+
+
+activity_writer = ActivityWriter()
+
+
+def record_company_activity(company_id, action, description):
+    """Log a CompanyActivity row once the current transaction commits."""
+    activity_writer.record(company_id, action, description)
+
+
+def log_activity(actor_id, action, detail="", company_id=None):
+    """Append to the ActivityLog without a transaction of its own.
+
+    The row is buffered and written in the background, so it never commits
+    (or flushes) anything the caller left pending.
+    """
+    if not activity_writer.enabled:
+        log = ActivityLog(
+            actor_id=actor_id, company_id=company_id, action=action,
+            category=action_category(action), detail=detail
+        )
+        db.session.add(log)
+        bump_unread(db.session, [(ActivityLog.__table__.name, {'actor_id': actor_id})])
+        db.session.commit()
+        return
+    activity_writer.enqueue(ActivityLog.__table__, {
+        'actor_id': actor_id,
+        'company_id': company_id,
+        'action': action,
+        'category': action_category(action),
+        'detail': detail,
+    })
@@ -0,0 +1,132 @@
+import gzip
+import json
+import os
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, or_, func, select
+
+from extensions import db
+from models import ActivityLog, CompanyActivity
+
+ARCHIVED_MODELS = (ActivityLog, CompanyActivity)
+BATCH_SIZE = 1000
+
+
+def month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(moment, months):
+    years, month = divmod(moment.month - 1 + months, 12)
+    return moment.replace(year=moment.year + years, month=month + 1)
+
+
+def retention_cutoff(now=None):
+    """Start of the oldest month still kept in the activity tables."""
+    months = current_app.config.get('ACTIVITY_RETENTION_MONTHS', 6)
+    return add_months(month_start(now or datetime.utcnow()), -months)
+
+
+def archive_dir():
+    return current_app.config.get('ACTIVITY_ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'activity_archive')
+
+
+def expired_months(model, cutoff):
+    """Starts of the months before ``cutoff`` that still have rows in ``model``."""
+    with db.engine.connect() as conn:
+        oldest = conn.execute(select(func.min(model.created_at)).where(model.created_at < cutoff)).scalar()
+    months = []
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot archive {type(value).__name__} value")
+
+
+def _month_rows(conn, table, start, end, max_id):
+    """Yield the month's rows in ``(created_at, id)`` order, one batch in memory at a time."""
+    in_month = and_(table.c.created_at >= start, table.c.created_at < end, table.c.id <= max_id)
+    position = None
+    while True:
+        query = select(table).where(in_month)
+        if position:
+            query = query.where(or_(
+                table.c.created_at > position[0],
+                and_(table.c.created_at == position[0], table.c.id > position[1])
+            ))
+        rows = conn.execute(query.order_by(table.c.created_at, table.c.id).limit(BATCH_SIZE)).mappings().all()
+        if not rows:
+            return
+        yield from rows
+        position = rows[-1]['created_at'], rows[-1]['id']
+
+
+def _delete_month(table, start, end, max_id):
+    in_month = and_(table.c.created_at >= start, table.c.created_at < end, table.c.id <= max_id)
+    deleted = 0
+    while True:
+        # Small batches keep each delete's locks and WAL short on a live table.
+        with db.engine.begin() as conn:
+            ids = conn.execute(select(table.c.id).where(in_month).order_by(table.c.id).limit(BATCH_SIZE)).scalars().all()
+            if not ids:
+                return deleted
+            conn.execute(table.delete().where(table.c.id.in_(ids)))
+        deleted += len(ids)
+
+
+def archive_month(model, start, directory=None):
+    """Stream one month of ``model`` rows to a gzipped JSONL file, then delete them.
+
+    Rows are removed only once the file is complete on disk. Only rows that
+    existed when the run began are touched, so a row written meanwhile is
+    never deleted unarchived; it is picked up by the next run. Returns
+    ``(path, rows)``, with ``path`` None when the month was empty.
+    """
+    table = model.__table__
+    end = add_months(start, 1)
+    directory = directory or archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{table.name}-{start:%Y-%m}-{datetime.utcnow():%Y%m%dT%H%M%S}.jsonl.gz")
+    partial = f"{path}.partial"
+
+    with db.engine.connect() as conn:
+        max_id = conn.execute(select(func.max(table.c.id))).scalar()
+        if max_id is None:
+            return None, 0
+        count = 0
+        with gzip.open(partial, 'wt', encoding='utf-8') as archive:
+            for row in _month_rows(conn, table, start, end, max_id):
+                archive.write(json.dumps(dict(row), default=_json_default) + '\n')
+                count += 1
+    if not count:
+        os.remove(partial)
+        return None, 0
+    with open(partial, 'rb') as archive:
+        os.fsync(archive.fileno())
+    os.replace(partial, path)
+
+    _delete_month(table, start, end, max_id)
+    return path, count
+
+
+def archive_expired_activity(now=None):
+    """Move activity rows older than ``ACTIVITY_RETENTION_MONTHS`` into the archive.
+
+    Each expired month becomes one file per table under
+    ``ACTIVITY_ARCHIVE_DIR``. Returns a list of ``(table, path, rows)``.
+    """
+    cutoff = retention_cutoff(now)
+    archived = []
+    for model in ARCHIVED_MODELS:
+        for start in expired_months(model, cutoff):
+            path, count = archive_month(model, start)
+            if path:
+                archived.append((model.__table__.name, path, count))
+    return archived
@@ -1,19 +1,30 @@
 # admin.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app
 from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from extensions import db
-from models import User, Company, Product, Order, CompanyActivity, PayoutRequest, DailyReport, Payment, DiscountRequest, ActivityLog, BankTransfer, ReferralWithdrawalRequest, ReferralWallet, ManagerAccountRequest, CartItem, WalletTransaction, PasswordResetToken, OtpVerification, Referral
+from models import User, Company, Product, Order, PayoutRequest, DailyReport, Payment, DiscountRequest, ActivityLog, BankTransfer, ReferralWithdrawalRequest, ReferralWallet, ManagerAccountRequest, CartItem, WalletTransaction, PasswordResetToken, OtpVerification, Referral, ShippingRate, ActivityUnread
 from finance import distribute_order_amount
-from activity import log_activity
+from inventory import confirm_stock, release_stock, stock_changed
+from checkout import sync_checkout_status
+from shipping import shipping_quotes
+from activity import ACTION_CATEGORIES, log_activity, record_company_activity, mark_activity_seen, recount_unread
+from feeds import company_activity_feed, manager_activity_feed
+from stats import dashboard_stats
+from pagination import keyset_page
+from orders import ORDER_STATUSES, PAYMENT_PROVIDERS, parse_order_filters, order_filter_args, order_listing
+from resolver import user_names, user_contacts, company_names, forget_user
+from reports import report_pdf_response, release_report_blobs
+from sales import record_order_paid, record_payout, daily_sales, company_sales, recent_days, summary_line
 from notifications import notify_user, send_email
 from flask import send_file
 from io import BytesIO
 from reportlab.pdfgen import canvas
 from datetime import datetime, timedelta
 from opay_api import query_status as opay_query_status, refund as opay_refund
-from sqlalchemy import func
+from sqlalchemy import func, or_
+from sqlalchemy.orm import load_only
 from sqlalchemy.exc import IntegrityError
 import re
 import uuid
@@ -38,43 +49,26 @@ def dashboard():
         return redirect(url_for('auth.login'))
 
     company_id_filter = request.args.get('company_id', '').strip()
-    last_seen_raw = session.get('admin_last_seen_activity')
-    last_seen = None
-    if last_seen_raw:
-        try:
-            last_seen = datetime.fromisoformat(last_seen_raw)
-        except ValueError:
-            session.pop('admin_last_seen_activity', None)
-    companies = Company.query.all()
-    products = Product.query.all()
-    orders = Order.query.all()
-    activities_query = CompanyActivity.query.order_by(CompanyActivity.created_at.desc())
+    company_id_value = None
     if company_id_filter:
         try:
             company_id_value = int(company_id_filter)
-            activities_query = activities_query.filter(CompanyActivity.company_id == company_id_value)
         except ValueError:
             flash('Company ID must be a number.', 'danger')
-    activities = activities_query.limit(20).all()
-    if last_seen:
-        unread_count = CompanyActivity.query.filter(CompanyActivity.created_at > last_seen).count()
-    else:
-        unread_count = CompanyActivity.query.count()
-
-    total_sales = sum(order.total_amount for order in orders)
-    total_payments = sum(payment.amount for payment in Payment.query.all())
-    total_company_balance = sum(company.wallet_balance for company in companies)
+    activities, next_cursor = company_activity_feed(company_id_value, request.args.get('cursor'), page_size=20)
+    totals = dashboard_stats.admin_totals()
 
     return render_template(
         'admin_dashboard.html',
-        companies=companies,
-        products=products,
-        orders=orders,
+        companies=totals.top_companies,
+        company_count=totals.company_count,
+        product_count=totals.product_count,
+        order_count=totals.order_count,
         activities=activities,
-        unread_count=unread_count,
-        total_sales=total_sales,
-        total_payments=total_payments,
-        total_company_balance=total_company_balance,
+        next_cursor=next_cursor,
+        total_sales=totals.total_sales,
+        total_payments=totals.total_payments,
+        total_company_balance=totals.total_company_balance,
         company_id_filter=company_id_filter
     )
 
@@ -95,7 +89,8 @@ def mark_activities_seen():
         flash('Access denied', 'danger')
         return redirect(url_for('auth.login'))
 
-    session['admin_last_seen_activity'] = datetime.utcnow().isoformat()
+    mark_activity_seen(current_user)
+    db.session.commit()
     return redirect(url_for('admin.dashboard'))
 
 
@@ -176,6 +171,7 @@ def confirm_admin_email_change():
 
     current_user.email = new_email
     db.session.commit()
+    forget_user(current_user.id)
     session.pop('admin_email_change', None)
     log_activity(current_user.id, "ADMIN_EMAIL_CHANGED", f"Admin email changed to {new_email}")
     flash("Admin email updated successfully.", "success")
@@ -203,11 +199,11 @@ def create_company():
 
         company = Company(name=name, description=description)
         db.session.add(company)
-        db.session.add(CompanyActivity(
+        record_company_activity(
             company_id=None,
             action='COMPANY_CREATED',
             description=f'Admin created company {name}'
-        ))
+        )
         db.session.commit()
         flash('Company created successfully!', 'success')
         return redirect(url_for('admin.dashboard'))
@@ -252,11 +248,11 @@ def create_manager():
             commission_rate=commission_rate
         )
         db.session.add(manager)
-        db.session.add(CompanyActivity(
+        record_company_activity(
             company_id=company_id,
             action='MANAGER_CREATED',
             description=f'Manager {username} assigned to company ID {company_id}'
-        ))
+        )
         db.session.commit()
         log_activity(current_user.id, "MANAGER_CREATED", f"Manager {username} created", company_id=company_id)
         flash('Manager created successfully!', 'success')
@@ -276,7 +272,7 @@ def manager_requests():
         return redirect(url_for('auth.login'))
 
     requests_list = ManagerAccountRequest.query.order_by(ManagerAccountRequest.created_at.desc()).all()
-    user_map = {u.id: u for u in User.query.all()}
+    user_map = user_contacts.lookup(req.user_id for req in requests_list)
     return render_template('admin_manager_requests.html', requests=requests_list, user_map=user_map)
 
 
@@ -320,16 +316,17 @@ def approve_manager_request(request_id):
     user.company_id = company.id
     user.commission_rate = commission_rate
     user.is_verified = True
+    recount_unread(user)
 
     req.status = 'approved'
     req.commission_rate = commission_rate
     req.admin_id = current_user.id
 
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=company.id,
         action='MANAGER_REQUEST_APPROVED',
         description=f'Admin approved manager request for {user.username}'
-    ))
+    )
     db.session.commit()
     notify_user(
         user,
@@ -426,10 +423,21 @@ def orders():
         flash('Access denied', 'danger')
         return redirect(url_for('auth.login'))
 
-    all_orders = Order.query.all()
-    payments = {p.order_id: p for p in Payment.query.all()}
-    company_map = {c.id: c.name for c in Company.query.all()}
-    return render_template('admin_orders.html', orders=all_orders, payments=payments, company_map=company_map)
+    filters = parse_order_filters(request.args)
+    rows, next_cursor = order_listing(
+        filters, request.args.get('cursor'), current_app.config.get('ADMIN_ORDERS_PAGE_SIZE', 50)
+    )
+    companies = db.session.query(Company.id, Company.name).order_by(Company.name).all()
+    return render_template(
+        'admin_orders.html',
+        rows=rows,
+        next_cursor=next_cursor,
+        filters=filters,
+        filter_args=order_filter_args(filters),
+        companies=companies,
+        statuses=ORDER_STATUSES,
+        providers=PAYMENT_PROVIDERS
+    )
 
 
 # =========================================
@@ -495,6 +503,7 @@ def delete_user(user_id):
     PasswordResetToken.query.filter_by(user_id=user.id).delete(synchronize_session=False)
     Referral.query.filter((Referral.referrer_id == user.id) | (Referral.referred_id == user.id)).delete(synchronize_session=False)
     OtpVerification.query.filter((OtpVerification.user_id == user.id) | (OtpVerification.referrer_id == user.id)).delete(synchronize_session=False)
+    ActivityUnread.query.filter_by(user_id=user.id).delete(synchronize_session=False)
     ManagerAccountRequest.query.filter((ManagerAccountRequest.user_id == user.id) | (ManagerAccountRequest.admin_id == user.id)).delete(synchronize_session=False)
 
     Product.query.filter_by(manager_id=user.id).update({Product.manager_id: None}, synchronize_session=False)
@@ -518,6 +527,7 @@ def delete_user(user_id):
             flash('Cannot delete user: this account is linked to existing records.', 'danger')
         return redirect(url_for('admin.users'))
 
+    forget_user(user.id)
     log_activity(current_user.id, "USER_DELETED", f"Deleted user {user.email}", company_id=user.company_id)
     flash('User deleted successfully.', 'success')
     return redirect(url_for('admin.users'))
@@ -534,8 +544,8 @@ def payouts():
         return redirect(url_for('auth.login'))
 
     payouts = PayoutRequest.query.order_by(PayoutRequest.created_at.desc()).all()
-    company_map = {c.id: c.name for c in Company.query.all()}
-    user_map = {u.id: u.username for u in User.query.all()}
+    company_map = company_names.lookup(payout.company_id for payout in payouts)
+    user_map = user_names.lookup(payout.manager_id for payout in payouts)
     return render_template('admin_payouts.html', payouts=payouts, company_map=company_map, user_map=user_map)
 
 
@@ -558,11 +568,12 @@ def approve_payout(payout_id):
 
     company.wallet_balance -= payout.amount
     payout.status = 'approved'
-    db.session.add(CompanyActivity(
+    record_payout(payout)
+    record_company_activity(
         company_id=company.id,
         action='PAYOUT_APPROVED',
         description=f'Admin approved payout #{payout.id} for company {company.name}'
-    ))
+    )
     db.session.commit()
     log_activity(current_user.id, "PAYOUT_APPROVED", f"Payout #{payout.id} approved for company {company.id}", company_id=company.id)
     flash('Payout approved.', 'success')
@@ -595,8 +606,8 @@ def reports():
         return redirect(url_for('auth.login'))
 
     reports = DailyReport.query.order_by(DailyReport.created_at.desc()).all()
-    company_map = {c.id: c.name for c in Company.query.all()}
-    user_map = {u.id: u.username for u in User.query.all()}
+    company_map = company_names.lookup(report.company_id for report in reports)
+    user_map = user_names.lookup(report.manager_id for report in reports)
     return render_template('admin_reports.html', reports=reports, company_map=company_map, user_map=user_map)
 
 
@@ -608,16 +619,11 @@ def download_report(report_id):
         return redirect(url_for('auth.login'))
 
     report = DailyReport.query.get_or_404(report_id)
-    if not report.pdf_data:
+    response = report_pdf_response(report)
+    if response is None:
         flash('No PDF available for this report.', 'danger')
         return redirect(url_for('admin.reports'))
-
-    return send_file(
-        BytesIO(report.pdf_data),
-        as_attachment=True,
-        download_name=report.pdf_filename or "daily_report.pdf",
-        mimetype=report.pdf_mimetype or "application/pdf"
-    )
+    return response
 
 
 @admin_bp.route('/reports/<int:report_id>/delete', methods=['POST'])
@@ -628,8 +634,10 @@ def delete_report(report_id):
         return redirect(url_for('auth.login'))
 
     report = DailyReport.query.get_or_404(report_id)
+    blob_key = report.pdf_blob_key
     db.session.delete(report)
     db.session.commit()
+    release_report_blobs([blob_key])
     flash('Report deleted.', 'success')
     return redirect(url_for('admin.reports'))
 
@@ -642,8 +650,11 @@ def delete_old_reports():
         return redirect(url_for('auth.login'))
 
     today = datetime.utcnow().date()
-    deleted = DailyReport.query.filter(DailyReport.created_at < datetime(today.year, today.month, today.day)).delete(synchronize_session=False)
+    old_reports = DailyReport.query.filter(DailyReport.created_at < datetime(today.year, today.month, today.day))
+    blob_keys = [key for (key,) in old_reports.with_entities(DailyReport.pdf_blob_key).distinct()]
+    deleted = old_reports.delete(synchronize_session=False)
     db.session.commit()
+    release_report_blobs(blob_keys)
     flash(f'Deleted {deleted} reports before today.', 'success')
     return redirect(url_for('admin.reports'))
 
@@ -659,7 +670,7 @@ def referrals():
         return redirect(url_for('auth.login'))
 
     requests_list = ReferralWithdrawalRequest.query.order_by(ReferralWithdrawalRequest.created_at.desc()).all()
-    user_map = {u.id: u.username for u in User.query.all()}
+    user_map = user_names.lookup(req.user_id for req in requests_list)
     return render_template('admin_referrals.html', requests=requests_list, user_map=user_map)
 
 
@@ -708,11 +719,79 @@ def discount_requests():
         return redirect(url_for('auth.login'))
 
     requests_list = DiscountRequest.query.order_by(DiscountRequest.created_at.desc()).all()
-    company_map = {c.id: c.name for c in Company.query.all()}
-    user_map = {u.id: u.username for u in User.query.all()}
+    company_map = company_names.lookup(req.company_id for req in requests_list)
+    user_map = user_names.lookup(req.buyer_id for req in requests_list)
     return render_template('admin_discount_requests.html', requests=requests_list, company_map=company_map, user_map=user_map)
 
 
+# =========================================
+# SHIPPING RATES
+# =========================================
+def _optional_float(value):
+    value = (value or '').strip()
+    return float(value) if value else None
+
+
+@admin_bp.route('/shipping-rates', methods=['GET', 'POST'])
+@login_required
+def shipping_rates():
+    if current_user.role != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('auth.login'))
+
+    if request.method == 'POST':
+        try:
+            max_weight = _optional_float(request.form.get('max_weight_grams'))
+            max_distance = _optional_float(request.form.get('max_distance_km'))
+            base_fee = float(request.form.get('base_fee') or 0)
+            rate_per_gram = float(request.form.get('rate_per_gram') or 0)
+            rate_per_km = float(request.form.get('rate_per_km') or 0)
+        except ValueError:
+            flash('Invalid shipping rate.', 'danger')
+            return redirect(url_for('admin.shipping_rates'))
+
+        values = [base_fee, rate_per_gram, rate_per_km, max_weight or 0, max_distance or 0]
+        if not all(0 <= value < float('inf') for value in values):
+            flash('Shipping rates and limits must be zero or more.', 'danger')
+            return redirect(url_for('admin.shipping_rates'))
+
+        db.session.add(ShippingRate(
+            max_weight_grams=int(max_weight) if max_weight is not None else None,
+            max_distance_km=max_distance,
+            base_fee=base_fee,
+            rate_per_gram=rate_per_gram,
+            rate_per_km=rate_per_km
+        ))
+        db.session.commit()
+        shipping_quotes.rates_changed()
+        log_activity(current_user.id, "SHIPPING_RATE_ADDED", "Shipping rate tier added")
+        flash('Shipping rate added.', 'success')
+        return redirect(url_for('admin.shipping_rates'))
+
+    rates = ShippingRate.query.all()
+    rates.sort(key=lambda rate: (
+        rate.max_weight_grams if rate.max_weight_grams is not None else float('inf'),
+        rate.max_distance_km if rate.max_distance_km is not None else float('inf'),
+    ))
+    return render_template('admin_shipping_rates.html', rates=rates, flat_rate=shipping_quotes.flat_rate)
+
+
+@admin_bp.route('/shipping-rates/<int:rate_id>/delete', methods=['POST'])
+@login_required
+def delete_shipping_rate(rate_id):
+    if current_user.role != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('auth.login'))
+
+    rate = ShippingRate.query.get_or_404(rate_id)
+    db.session.delete(rate)
+    db.session.commit()
+    shipping_quotes.rates_changed()
+    log_activity(current_user.id, "SHIPPING_RATE_DELETED", f"Shipping rate tier #{rate_id} deleted")
+    flash('Shipping rate deleted.', 'success')
+    return redirect(url_for('admin.shipping_rates'))
+
+
 # =========================================
 # BANK TRANSFER APPROVALS
 # =========================================
@@ -723,8 +802,8 @@ def bank_transfers():
         flash('Access denied', 'danger')
         return redirect(url_for('auth.login'))
     transfers = BankTransfer.query.order_by(BankTransfer.created_at.desc()).all()
-    company_map = {c.id: c.name for c in Company.query.all()}
-    user_map = {u.id: u.username for u in User.query.all()}
+    company_map = company_names.lookup(transfer.company_id for transfer in transfers)
+    user_map = user_names.lookup(transfer.buyer_id for transfer in transfers)
     return render_template('admin_bank_transfers.html', transfers=transfers, company_map=company_map, user_map=user_map)
 
 
@@ -738,13 +817,18 @@ def approve_bank_transfer(transfer_id):
     if transfer.status != 'pending':
         return redirect(url_for('admin.bank_transfers'))
     transfer.status = 'approved'
+    order = Order.query.get(transfer.order_id)
     company = Company.query.get(transfer.company_id)
     if company:
         distribute_order_amount(order)
-    order = Order.query.get(transfer.order_id)
+    restocked = []
     if order:
+        restocked = confirm_stock(order)
         order.status = 'paid'
+        record_order_paid(order)
+        sync_checkout_status([order])
     db.session.commit()
+    stock_changed(restocked)
     log_activity(current_user.id, "BANK_TRANSFER_APPROVED", f"Transfer #{transfer.id} approved", company_id=transfer.company_id)
     buyer = User.query.get(transfer.buyer_id)
     if buyer:
@@ -767,9 +851,13 @@ def reject_bank_transfer(transfer_id):
     transfer = BankTransfer.query.get_or_404(transfer_id)
     transfer.status = 'rejected'
     order = Order.query.get(transfer.order_id)
+    restocked = []
     if order and order.status == 'pending_verification':
+        restocked = release_stock(order, status='payment_failed')
         order.status = 'payment_failed'
+        sync_checkout_status([order])
     db.session.commit()
+    stock_changed(restocked)
     log_activity(current_user.id, "BANK_TRANSFER_REJECTED", f"Transfer #{transfer.id} rejected", company_id=transfer.company_id)
     buyer = User.query.get(transfer.buyer_id)
     if buyer:
@@ -783,6 +871,29 @@ def reject_bank_transfer(transfer_id):
     return redirect(url_for('admin.bank_transfers'))
 
 
+# =========================================
+# ALL COMPANIES
+# =========================================
+@admin_bp.route('/companies')
+@login_required
+def companies():
+    if current_user.role != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('auth.login'))
+
+    search = request.args.get('q', '').strip()
+    query = Company.query.options(load_only(Company.id, Company.name, Company.wallet_balance, Company.created_at))
+    if search.isdigit():
+        query = query.filter(or_(Company.id == int(search), Company.name.ilike(f'%{search}%')))
+    elif search:
+        query = query.filter(Company.name.ilike(f'%{search}%'))
+    rows, next_cursor = keyset_page(
+        query, Company.created_at, Company.id, request.args.get('cursor'),
+        current_app.config.get('ADMIN_COMPANIES_PAGE_SIZE', 50)
+    )
+    return render_template('admin_companies.html', companies=rows, next_cursor=next_cursor, search=search)
+
+
 # =========================================
 # ADMIN WITHDRAW FROM COMPANY
 # =========================================
@@ -792,24 +903,28 @@ def withdraw_company(company_id):
     if current_user.role != 'admin':
         flash('Access denied', 'danger')
         return redirect(url_for('auth.login'))
+    # Withdrawals are made from the dashboard and from the full company list.
+    next_url = request.form.get('next', '')
+    back = redirect(next_url if next_url.startswith('/') and not next_url.startswith('//') else url_for('admin.dashboard'))
     amount_raw = request.form.get('amount', '').strip()
     if not amount_raw:
         flash('Please enter a withdrawal amount.', 'danger')
-        return redirect(url_for('admin.dashboard'))
+        return back
     try:
         amount = float(amount_raw)
     except ValueError:
         flash('Invalid amount format.', 'danger')
-        return redirect(url_for('admin.dashboard'))
+        return back
     company = Company.query.get_or_404(company_id)
     if amount <= 0 or company.wallet_balance < amount:
         flash('Invalid amount or insufficient balance.', 'danger')
-        return redirect(url_for('admin.dashboard'))
+        return back
     company.wallet_balance -= amount
     db.session.commit()
+    dashboard_stats.invalidate()
     log_activity(current_user.id, "ADMIN_WITHDRAW", f"Withdrew {amount} from company {company.id}", company_id=company.id)
     flash('Withdrawal successful.', 'success')
-    return redirect(url_for('admin.dashboard'))
+    return back
 
 
 # =========================================
@@ -822,17 +937,14 @@ def activities():
         flash('Access denied', 'danger')
         return redirect(url_for('auth.login'))
     filter_type = request.args.get('type', 'all')
-    query = ActivityLog.query.join(User, ActivityLog.actor_id == User.id).filter(User.role == 'manager')
-    if filter_type == 'money':
-        query = query.filter(ActivityLog.action.like('%PAY%') | ActivityLog.action.like('%TRANSFER%') | ActivityLog.action.like('%WITHDRAW%'))
-    elif filter_type == 'auth':
-        query = query.filter(ActivityLog.action.like('%LOGIN%') | ActivityLog.action.like('%PASSWORD%'))
-    logs = query.order_by(ActivityLog.created_at.desc()).limit(200).all()
-    company_map = {c.id: c.name for c in Company.query.all()}
-    user_map = {u.id: u.username for u in User.query.filter_by(role='manager').all()}
+    category = filter_type if filter_type in {category for category, _ in ACTION_CATEGORIES} else None
+    logs, next_cursor = manager_activity_feed(category, request.args.get('cursor'))
+    company_map = company_names.lookup(log.company_id for log in logs)
+    user_map = user_names.lookup(log.actor_id for log in logs)
     return render_template(
         'admin_activities.html',
         logs=logs,
+        next_cursor=next_cursor,
         filter_type=filter_type,
         company_map=company_map,
         user_map=user_map
@@ -848,7 +960,21 @@ def analytics():
     companies = Company.query.all()
     labels = [c.name for c in companies]
     values = [c.wallet_balance for c in companies]
-    return render_template('admin_analytics.html', labels=labels, values=values)
+    days = current_app.config.get('ANALYTICS_DAYS', 30)
+    start = recent_days(days)
+    daily = daily_sales(start)
+    company_map = {c.id: c.name for c in companies}
+    return render_template(
+        'admin_analytics.html',
+        labels=labels,
+        values=values,
+        days=days,
+        sales_labels=[row.day.isoformat() for row in daily],
+        sales_gmv=[row.gmv for row in daily],
+        sales_paid=[row.paid_amount for row in daily],
+        company_totals=company_sales(start),
+        company_map=company_map
+    )
 
 
 # =========================================
@@ -904,9 +1030,19 @@ def daily_statement_pdf():
     buffer = BytesIO()
     p = canvas.Canvas(buffer)
     p.setFont("Helvetica-Bold", 14)
-    p.drawString(50, 800, f"Daily Statement - {datetime.utcnow().date()}")
+    today = datetime.utcnow().date()
+    p.drawString(50, 800, f"Daily Statement - {today}")
     y = 770
     p.setFont("Helvetica", 11)
+    sales = company_sales(today, today)
+    company_map = company_names.lookup(row.company_id for row in sales)
+    for row in sales:
+        p.drawString(50, y, f"{company_map.get(row.company_id, row.company_id)}: {summary_line(row)}")
+        y -= 15
+        if y < 50:
+            p.showPage()
+            y = 800
+    y -= 10
     for log in ActivityLog.query.order_by(ActivityLog.created_at.desc()).limit(50).all():
         p.drawString(50, y, f"{log.created_at} - {log.action} - {log.detail}")
         y -= 15
@@ -0,0 +1,150 @@
+# api.py
+import hashlib
+from flask import Blueprint, jsonify, request, current_app
+
+from models import Product, Company
+from images import load_variants, image_url as static_image_url
+from catalog import catalog_query, catalog_version, catalog_page_size, product_detail_query, product_listing
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+PRODUCT_FIELDS = (
+    "id", "name", "description", "price", "sale_price", "effective_price", "stock",
+    "image_url", "images", "is_new", "is_hot", "weight_grams", "size_desc", "rating_avg",
+    "rating_count", "company_id", "company_name", "created_at",
+)
+
+
+def _image_url(product):
+    return static_image_url(product.image_url)
+
+
+def _image_variants(product):
+    return {
+        name: {key: (value if key == "width" else static_image_url(value)) for key, value in paths.items()}
+        for name, paths in load_variants(product).items()
+    }
+
+
+def _field_value(product, field):
+    if field == "effective_price":
+        return product.sale_price or product.price
+    if field == "image_url":
+        return _image_url(product)
+    if field == "images":
+        return _image_variants(product)
+    if field == "company_name":
+        return product.company.name if product.company else None
+    if field == "created_at":
+        return product.created_at.isoformat() if product.created_at else None
+    return getattr(product, field)
+
+
+def _requested_fields():
+    raw = request.args.get('fields', '').strip()
+    if not raw:
+        return PRODUCT_FIELDS, None
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+    if unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}"
+    return fields, None
+
+
+def _serialize(product, fields):
+    return {field: _field_value(product, field) for field in fields}
+
+
+def _catalog_etag():
+    # The catalog version moves on every product or review change, so one
+    # primary-key lookup decides whether any representation can be stale.
+    return hashlib.sha1(f"{catalog_version()}:{request.full_path}".encode()).hexdigest()
+
+
+def _not_modified(etag):
+    if not request.if_none_match.contains(etag):
+        return None
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+def _respond(payload, etag):
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+def _error(message, status):
+    return jsonify({"status": "error", "message": message}), status
+
+
+# =========================================
+# PRODUCT LIST
+# =========================================
+@api_bp.route('/products')
+def products():
+    fields, error = _requested_fields()
+    if error:
+        return _error(error, 400)
+    etag = _catalog_etag()
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+
+    page_size = catalog_page_size()
+    items, next_cursor = product_listing(request.args.get('cursor'), page_size)
+    return _respond({
+        "products": [_serialize(product, fields) for product in items],
+        "next_cursor": next_cursor,
+    }, etag)
+
+
+# =========================================
+# PRODUCT DETAIL
+# =========================================
+@api_bp.route('/products/<int:product_id>')
+def product_detail(product_id):
+    fields, error = _requested_fields()
+    if error:
+        return _error(error, 400)
+    etag = _catalog_etag()
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+
+    product = product_detail_query().filter(Product.id == product_id).first()
+    if not product:
+        return _error("Product not found", 404)
+    return _respond({"product": _serialize(product, fields)}, etag)
+
+
+# =========================================
+# PRODUCTS BY COMPANY
+# =========================================
+@api_bp.route('/companies/<int:company_id>/products')
+def company_products(company_id):
+    fields, error = _requested_fields()
+    if error:
+        return _error(error, 400)
+    etag = _catalog_etag()
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+
+    company = Company.query.get(company_id)
+    if not company:
+        return _error("Company not found", 404)
+    page_size = catalog_page_size()
+    items, next_cursor = product_listing(
+        request.args.get('cursor'),
+        page_size,
+        base_query=catalog_query().filter(Product.company_id == company_id)
+    )
+    return _respond({
+        "company": {"id": company.id, "name": company.name},
+        "products": [_serialize(product, fields) for product in items],
+        "next_cursor": next_cursor,
+    }, etag)
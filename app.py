@@ -1,4 +1,4 @@
-from flask import Flask, render_template, redirect, url_for, request, flash
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify
 from extensions import db, login_manager
 from flask_login import current_user
 from datetime import timedelta
@@ -11,6 +11,23 @@ from admin import admin_bp
 from manager import manager_bp
 from shop import shop_bp
 from payments import payments_bp
+from api import api_bp
+from search import ensure_search_index, search_products, match_condition
+from catalog import (
+    catalog_query, catalog_page_size, product_listing, page_tags, ensure_catalog_state, catalog_version,
+    parse_filters, apply_filters, filter_args, facet_counts
+)
+from cache import page_cache
+from images import product_image
+from static_assets import static_assets
+from avatars import avatar_resolver
+from shipping import shipping_quotes
+from pagination import decode_cursor
+from idempotency import new_idempotency_key
+from activity import activity_writer, unread_count
+from stats import dashboard_stats
+from resolver import user_names, user_contacts, company_names
+from blobstore import blob_store
 
 
 def _ensure_schema_columns():
@@ -20,11 +37,21 @@ def _ensure_schema_columns():
     tables = set(inspector.get_table_names())
 
     alter_map = {
+        "user": [
+            ("avatar_exists", 'ALTER TABLE "user" ADD COLUMN avatar_exists BOOLEAN'),
+        ],
         "product": [
             ("weight_grams", "ALTER TABLE product ADD COLUMN weight_grams INTEGER DEFAULT 0"),
             ("size_desc", "ALTER TABLE product ADD COLUMN size_desc VARCHAR(120)"),
             ("rating_avg", "ALTER TABLE product ADD COLUMN rating_avg DOUBLE PRECISION DEFAULT 4.0"),
             ("rating_count", "ALTER TABLE product ADD COLUMN rating_count INTEGER DEFAULT 0"),
+            ("rating_sum", "ALTER TABLE product ADD COLUMN rating_sum INTEGER DEFAULT 0"),
+            ("rating_1_count", "ALTER TABLE product ADD COLUMN rating_1_count INTEGER DEFAULT 0"),
+            ("rating_2_count", "ALTER TABLE product ADD COLUMN rating_2_count INTEGER DEFAULT 0"),
+            ("rating_3_count", "ALTER TABLE product ADD COLUMN rating_3_count INTEGER DEFAULT 0"),
+            ("rating_4_count", "ALTER TABLE product ADD COLUMN rating_4_count INTEGER DEFAULT 0"),
+            ("rating_5_count", "ALTER TABLE product ADD COLUMN rating_5_count INTEGER DEFAULT 0"),
+            ("image_variants", "ALTER TABLE product ADD COLUMN image_variants TEXT"),
         ],
         "order": [
             ("delivery_country", 'ALTER TABLE "order" ADD COLUMN delivery_country VARCHAR(120)'),
@@ -36,7 +63,20 @@ def _ensure_schema_columns():
             ("delivery_map_url", 'ALTER TABLE "order" ADD COLUMN delivery_map_url VARCHAR(500)'),
             ("delivery_distance_km", 'ALTER TABLE "order" ADD COLUMN delivery_distance_km DOUBLE PRECISION'),
             ("shipping_fee", 'ALTER TABLE "order" ADD COLUMN shipping_fee DOUBLE PRECISION DEFAULT 0.0'),
+            ("discount_amount", 'ALTER TABLE "order" ADD COLUMN discount_amount DOUBLE PRECISION DEFAULT 0.0'),
             ("total_weight_grams", 'ALTER TABLE "order" ADD COLUMN total_weight_grams INTEGER DEFAULT 0'),
+            ("reserved_until", 'ALTER TABLE "order" ADD COLUMN reserved_until TIMESTAMP'),
+            ("checkout_session_id", 'ALTER TABLE "order" ADD COLUMN checkout_session_id INTEGER REFERENCES checkout_session (id)'),
+        ],
+        "activity_log": [
+            ("category", "ALTER TABLE activity_log ADD COLUMN category VARCHAR(20)"),
+        ],
+        "daily_report": [
+            ("pdf_blob_key", "ALTER TABLE daily_report ADD COLUMN pdf_blob_key VARCHAR(64)"),
+            ("pdf_size", "ALTER TABLE daily_report ADD COLUMN pdf_size INTEGER"),
+        ],
+        "payment": [
+            ("checkout_session_id", "ALTER TABLE payment ADD COLUMN checkout_session_id INTEGER REFERENCES checkout_session (id)"),
         ],
         "company": [
             ("pickup_country", "ALTER TABLE company ADD COLUMN pickup_country VARCHAR(120)"),
@@ -50,7 +90,24 @@ def _ensure_schema_columns():
         ],
     }
 
+    # Run once, in the same transaction, when the column is first added to a
+    # table that already holds data.
+    review_filter = "FROM product_review WHERE product_review.product_id = product.id"
+    backfill_map = {
+        ("product", "rating_sum"): (
+            "UPDATE product SET "
+            f"rating_count = (SELECT COUNT(*) {review_filter}), "
+            f"rating_sum = (SELECT COALESCE(SUM(rating), 0) {review_filter}), "
+            + ", ".join(
+                f"rating_{stars}_count = (SELECT COUNT(*) {review_filter} AND rating = {stars})"
+                for stars in range(1, 6)
+            )
+            + " WHERE id IN (SELECT product_id FROM product_review)"
+        ),
+    }
+
     with engine.begin() as conn:
+        added = set()
         for table_name, patches in alter_map.items():
             if table_name not in tables:
                 continue
@@ -58,6 +115,59 @@ def _ensure_schema_columns():
             for col_name, alter_sql in patches:
                 if col_name not in existing_cols:
                     conn.execute(text(alter_sql))
+                    added.add((table_name, col_name))
+        for column, backfill_sql in backfill_map.items():
+            if column in added:
+                conn.execute(text(backfill_sql))
+
+
+def _ensure_indexes():
+    """Indexes backing the catalog listing order, facet filters, activity feeds and admin consoles."""
+    engine = db.engine
+    tables = set(inspect(engine).get_table_names())
+
+    index_map = {
+        "product": [
+            "CREATE INDEX IF NOT EXISTS ix_product_created ON product (created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_product_company_created ON product (company_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_product_effective_price ON product ((COALESCE(sale_price, price)))",
+            "CREATE INDEX IF NOT EXISTS ix_product_new_created ON product (is_new, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_product_hot_created ON product (is_hot, created_at)",
+            "CREATE INDEX IF NOT EXISTS ix_product_rating ON product (rating_avg)",
+        ],
+        "order": [
+            'CREATE INDEX IF NOT EXISTS ix_order_checkout_session_id ON "order" (checkout_session_id)',
+            'CREATE INDEX IF NOT EXISTS ix_order_created ON "order" (created_at, id)',
+            'CREATE INDEX IF NOT EXISTS ix_order_company_created ON "order" (company_id, created_at, id)',
+            'CREATE INDEX IF NOT EXISTS ix_order_status_created ON "order" (status, created_at, id)',
+        ],
+        "company": [
+            "CREATE INDEX IF NOT EXISTS ix_company_created ON company (created_at, id)",
+        ],
+        "daily_report": [
+            "CREATE INDEX IF NOT EXISTS ix_daily_report_pdf_blob_key ON daily_report (pdf_blob_key)",
+        ],
+        "payment": [
+            "CREATE INDEX IF NOT EXISTS ix_payment_order_id ON payment (order_id)",
+            "CREATE INDEX IF NOT EXISTS ix_payment_checkout_session_id ON payment (checkout_session_id)",
+        ],
+        "activity_log": [
+            "CREATE INDEX IF NOT EXISTS ix_activity_log_actor_created ON activity_log (actor_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_activity_log_category_created ON activity_log (category, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_activity_log_created ON activity_log (created_at, id)",
+        ],
+        "company_activity": [
+            "CREATE INDEX IF NOT EXISTS ix_company_activity_company_created ON company_activity (company_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS ix_company_activity_created ON company_activity (created_at, id)",
+        ],
+    }
+
+    with engine.begin() as conn:
+        for table_name, statements in index_map.items():
+            if table_name not in tables:
+                continue
+            for index_sql in statements:
+                conn.execute(text(index_sql))
 
 
 def create_app():
@@ -94,38 +204,85 @@ def create_app():
     app.config['BANK_TRANSFER_ACCOUNT_NUMBER'] = os.getenv('BANK_TRANSFER_ACCOUNT_NUMBER', '0000000000')
     app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'static/uploads')
     app.config['AVATAR_MAX_BYTES'] = int(os.getenv('AVATAR_MAX_BYTES', str(2 * 1024 * 1024)))
+    app.config['AVATAR_CACHE_MAX_ENTRIES'] = int(os.getenv('AVATAR_CACHE_MAX_ENTRIES', '4096'))
+    app.config['AVATAR_CACHE_TTL'] = int(os.getenv('AVATAR_CACHE_TTL', '300'))
+    app.config['STATIC_DIGEST_CACHE_MAX_ENTRIES'] = int(os.getenv('STATIC_DIGEST_CACHE_MAX_ENTRIES', '4096'))
     app.config['RESET_URL_BASE'] = os.getenv('RESET_URL_BASE', 'http://127.0.0.1:5000')
+    app.config['SEARCH_RESULT_LIMIT'] = int(os.getenv('SEARCH_RESULT_LIMIT', '50'))
+    app.config['CATALOG_PAGE_SIZE'] = int(os.getenv('CATALOG_PAGE_SIZE', '24'))
+    app.config['PAGE_CACHE_ENABLED'] = os.getenv('PAGE_CACHE_ENABLED', '1') == '1'
+    app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.getenv('PAGE_CACHE_MAX_ENTRIES', '512'))
+    app.config['STOCK_RESERVATION_MINUTES'] = int(os.getenv('STOCK_RESERVATION_MINUTES', '30'))
+    app.config['IDEMPOTENCY_KEY_TTL_HOURS'] = int(os.getenv('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+    app.config['ACTIVITY_BUFFER_ENABLED'] = os.getenv('ACTIVITY_BUFFER_ENABLED', '1') == '1'
+    app.config['ACTIVITY_FLUSH_INTERVAL_MS'] = int(os.getenv('ACTIVITY_FLUSH_INTERVAL_MS', '500'))
+    app.config['ACTIVITY_FLUSH_BATCH'] = int(os.getenv('ACTIVITY_FLUSH_BATCH', '100'))
+    app.config['ACTIVITY_SPOOL_PATH'] = os.getenv('ACTIVITY_SPOOL_PATH', '')
+    app.config['ACTIVITY_PAGE_SIZE'] = int(os.getenv('ACTIVITY_PAGE_SIZE', '50'))
+    app.config['ACTIVITY_RETENTION_MONTHS'] = int(os.getenv('ACTIVITY_RETENTION_MONTHS', '6'))
+    app.config['ACTIVITY_ARCHIVE_DIR'] = os.getenv('ACTIVITY_ARCHIVE_DIR', '')
+    app.config['ADMIN_STATS_TTL'] = int(os.getenv('ADMIN_STATS_TTL', '30'))
+    app.config['ADMIN_DASHBOARD_TOP_COMPANIES'] = int(os.getenv('ADMIN_DASHBOARD_TOP_COMPANIES', '20'))
+    app.config['ANALYTICS_DAYS'] = int(os.getenv('ANALYTICS_DAYS', '30'))
+    app.config['ADMIN_ORDERS_PAGE_SIZE'] = int(os.getenv('ADMIN_ORDERS_PAGE_SIZE', '50'))
+    app.config['ADMIN_COMPANIES_PAGE_SIZE'] = int(os.getenv('ADMIN_COMPANIES_PAGE_SIZE', '50'))
+    app.config['NAME_CACHE_MAX_ENTRIES'] = int(os.getenv('NAME_CACHE_MAX_ENTRIES', '10000'))
+    app.config['NAME_CACHE_TTL'] = int(os.getenv('NAME_CACHE_TTL', '300'))
+    app.config['BLOB_STORE_PATH'] = os.getenv('BLOB_STORE_PATH', '')
+    app.config['SHIPPING_RATE_PER_GRAM'] = float(os.getenv('SHIPPING_RATE_PER_GRAM', '0.5') or 0.5)
+    app.config['SHIPPING_RATE_PER_KM'] = float(os.getenv('SHIPPING_RATE_PER_KM', '10') or 10)
+    app.config['SHIPPING_RATES_TTL'] = int(os.getenv('SHIPPING_RATES_TTL', '60'))
+    app.config['SHIPPING_GEOHASH_PRECISION'] = int(os.getenv('SHIPPING_GEOHASH_PRECISION', '7'))
+    app.config['SHIPPING_WEIGHT_BAND_GRAMS'] = int(os.getenv('SHIPPING_WEIGHT_BAND_GRAMS', '100'))
+    app.config['SHIPPING_QUOTE_CACHE_MAX_ENTRIES'] = int(os.getenv('SHIPPING_QUOTE_CACHE_MAX_ENTRIES', '4096'))
+    app.config['SHIPPING_QUOTE_CACHE_TTL'] = int(os.getenv('SHIPPING_QUOTE_CACHE_TTL', '600'))
 
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
     db.init_app(app)
     login_manager.init_app(app)
+    page_cache.init_app(app, version=catalog_version)
+    static_assets.init_app(app)
+    avatar_resolver.init_app(app)
+    shipping_quotes.init_app(app)
+    activity_writer.init_app(app)
+    dashboard_stats.init_app(app)
+    user_names.init_app(app)
+    user_contacts.init_app(app)
+    company_names.init_app(app)
+    blob_store.init_app(app)
 
     with app.app_context():
         db.create_all()
         _ensure_schema_columns()
+        _ensure_indexes()
+        ensure_search_index()
+        ensure_catalog_state()
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(manager_bp, url_prefix='/manager')
     app.register_blueprint(shop_bp, url_prefix='/shop')
     app.register_blueprint(payments_bp, url_prefix='/payments')
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
 
     @app.context_processor
     def inject_avatar_url():
-        def avatar_url(user):
-            default_path = url_for('static', filename='images/default_avatar.svg')
-            avatar_path = getattr(user, 'avatar_path', None)
-            if not avatar_path:
-                return default_path
+        return {'avatar_url': avatar_resolver.url}
+
+    @app.context_processor
+    def inject_product_image():
+        return {'product_image': product_image}
 
-            normalized = str(avatar_path).replace('\\', '/').strip('/')
-            candidate = os.path.join(app.root_path, 'static', normalized)
-            if not os.path.isfile(candidate):
-                return default_path
-            return url_for('static', filename=normalized)
+    @app.context_processor
+    def inject_unread_count():
+        if not current_user.is_authenticated:
+            return {}
+        return {'unread_count': unread_count(current_user)}
 
-        return {'avatar_url': avatar_url}
+    @app.context_processor
+    def inject_idempotency_key():
+        return {'idempotency_key': new_idempotency_key}
 
     @app.route('/')
     def home():
@@ -133,16 +290,48 @@ def create_app():
 
     @app.route('/marketplace')
     def marketplace():
-        from models import Product
         query = request.args.get('q', '').strip()
-        products_query = Product.query
+        if not query:
+            cached = page_cache.lookup()
+            if cached is not None:
+                return cached
+
+        filters = parse_filters(request.args)
+        base_query = apply_filters(catalog_query(), filters)
+        head = decode_cursor(request.args.get('cursor')) is None
+        page_size = catalog_page_size()
+        next_cursor = None
+        facets = None
         if query:
-            like = f"%{query}%"
-            products_query = products_query.filter(
-                Product.name.ilike(like) | Product.description.ilike(like)
-            )
-        products = products_query.order_by(Product.created_at.desc()).all()
-        return render_template('marketplace.html', products=products, search_query=query)
+            products = search_products(query, base_query=base_query)
+            facets = facet_counts(filters, match=match_condition(query))
+        else:
+            products, next_cursor = product_listing(request.args.get('cursor'), page_size, base_query=base_query)
+            if head:
+                facets = facet_counts(filters)
+        html = render_template(
+            'marketplace.html',
+            products=products,
+            search_query=query,
+            next_cursor=next_cursor,
+            per_page=page_size,
+            filters=filters,
+            filter_args=filter_args(filters),
+            facets=facets
+        )
+        if query:
+            return html
+        return page_cache.store(html, page_tags(products, head=head))
+
+    @app.route('/marketplace/feed')
+    def marketplace_feed():
+        filters = parse_filters(request.args)
+        products, next_cursor = product_listing(
+            request.args.get('cursor'),
+            base_query=apply_filters(catalog_query(), filters)
+        )
+        html = render_template('marketplace_product_cards.html', products=products)
+        return jsonify({"html": html, "next_cursor": next_cursor})
 
     @app.route('/about')
     def about():
@@ -191,14 +380,6 @@ def create_app():
             return redirect('/manager')
         return redirect('/shop')
 
-    @app.after_request
-    def disable_static_cache(response):
-        if request.path.startswith('/static/'):
-            response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-        return response
-
     return app
 
 
@@ -0,0 +1,16 @@
+from app import create_app
+from activity_archive import archive_expired_activity
+
+
+def main():
+    """Archive activity older than ACTIVITY_RETENTION_MONTHS to gzipped JSONL; run from cron."""
+    app = create_app()
+    with app.app_context():
+        archived = archive_expired_activity()
+        for table_name, path, rows in archived:
+            print(f"Archived {rows} {table_name} rows to {path}.")
+        print(f"Archived {sum(rows for _, _, rows in archived)} activity rows in {len(archived)} files.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,20 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import re
 from PIL import Image
 from extensions import db
-from models import User, Company, Referral, ReferralWallet, ReferralWithdrawalRequest, CompanyActivity, OtpVerification, ActivityLog, ManagerAccountRequest
+from models import User, Company, Referral, ReferralWallet, ReferralWithdrawalRequest, OtpVerification, ManagerAccountRequest
 from notifications import notify_user, send_email, send_sms
 import os
 import uuid
 from datetime import datetime, timedelta
 from models import PasswordResetToken
-from activity import log_activity
+from activity import log_activity, record_company_activity, mark_activity_seen
+from feeds import user_activity_feed
+from avatars import avatar_resolver
+from resolver import forget_user
 
 auth_bp = Blueprint('auth', __name__, template_folder='templates')
 ALLOWED_AVATAR_EXTS = {"png", "jpg", "jpeg", "gif", "webp"}
@@ -257,48 +260,32 @@ def profile():
                 old_full = os.path.join(current_app.root_path, 'static', current_user.avatar_path)
                 if os.path.isfile(old_full):
                     os.remove(old_full)
+            avatar_resolver.forget(current_user.avatar_path)
 
             current_user.avatar_path = f"uploads/{unique_name}"
+            current_user.avatar_exists = True
         elif remove_avatar:
             if current_user.avatar_path and current_user.avatar_path.startswith("uploads/"):
                 old_full = os.path.join(current_app.root_path, 'static', current_user.avatar_path)
                 if os.path.isfile(old_full):
                     os.remove(old_full)
+            avatar_resolver.forget(current_user.avatar_path)
             current_user.avatar_path = None
+            current_user.avatar_exists = None
 
         db.session.commit()
+        forget_user(current_user.id)
         log_activity(current_user.id, "PROFILE_UPDATED", "Updated profile and notification preferences", company_id=current_user.company_id)
         flash("Profile updated.", "success")
         return redirect(url_for('auth.profile'))
 
     activities = []
-    unread_count = None
     manager_request = None
     if current_user.role == 'buyer':
         manager_request = ManagerAccountRequest.query.filter_by(user_id=current_user.id).order_by(ManagerAccountRequest.created_at.desc()).first()
-        last_seen_raw = session.get('buyer_last_seen_activity')
-        last_seen = None
-        if last_seen_raw:
-            try:
-                last_seen = datetime.fromisoformat(last_seen_raw)
-            except ValueError:
-                session.pop('buyer_last_seen_activity', None)
-
-        activities_query = ActivityLog.query.filter(
-            ActivityLog.actor_id == current_user.id
-        ).order_by(ActivityLog.created_at.desc())
-        activities = activities_query.limit(20).all()
-        if last_seen:
-            unread_count = ActivityLog.query.filter(
-                ActivityLog.actor_id == current_user.id,
-                ActivityLog.created_at > last_seen
-            ).count()
-        else:
-            unread_count = ActivityLog.query.filter(
-                ActivityLog.actor_id == current_user.id
-            ).count()
+        activities, _ = user_activity_feed(current_user.id, page_size=20)
 
-    return render_template('profile.html', activities=activities, unread_count=unread_count, manager_request=manager_request)
+    return render_template('profile.html', activities=activities, manager_request=manager_request)
 
 
 @auth_bp.route('/request-manager-account', methods=['POST'])
@@ -360,29 +347,9 @@ def activities():
         flash("Access denied.", "danger")
         return redirect(url_for('auth.profile'))
 
-    last_seen_raw = session.get('buyer_last_seen_activity')
-    last_seen = None
-    if last_seen_raw:
-        try:
-            last_seen = datetime.fromisoformat(last_seen_raw)
-        except ValueError:
-            session.pop('buyer_last_seen_activity', None)
-
-    activities_query = ActivityLog.query.filter(
-        ActivityLog.actor_id == current_user.id
-    ).order_by(ActivityLog.created_at.desc())
-    activities_list = activities_query.limit(200).all()
-    if last_seen:
-        unread_count = ActivityLog.query.filter(
-            ActivityLog.actor_id == current_user.id,
-            ActivityLog.created_at > last_seen
-        ).count()
-    else:
-        unread_count = ActivityLog.query.filter(
-            ActivityLog.actor_id == current_user.id
-        ).count()
-
-    return render_template('buyer_activities.html', activities=activities_list, unread_count=unread_count)
+    activities_list, next_cursor = user_activity_feed(current_user.id, request.args.get('cursor'))
+
+    return render_template('buyer_activities.html', activities=activities_list, next_cursor=next_cursor)
 
 
 @auth_bp.route('/activities/mark-seen', methods=['POST'])
@@ -392,7 +359,8 @@ def mark_buyer_activities_seen():
         flash("Access denied.", "danger")
         return redirect(url_for('auth.profile'))
 
-    session['buyer_last_seen_activity'] = datetime.utcnow().isoformat()
+    mark_activity_seen(current_user)
+    db.session.commit()
     return redirect(url_for('auth.activities'))
 
 
@@ -471,11 +439,11 @@ def verify_otp(user_id):
                 wallet.token_balance += REFERRAL_REWARD_TOKENS
                 wallet.total_earned += REFERRAL_REWARD_TOKENS
                 if referrer:
-                    db.session.add(CompanyActivity(
+                    record_company_activity(
                         company_id=referrer.company_id,
                         action='REFERRAL_REWARD',
                         description=f'Referral reward: {REFERRAL_REWARD_TOKENS} tokens for {referrer.username}'
-                    ))
+                    )
         db.session.delete(otp_record)
         db.session.commit()
         flash("Account verified. Please log in.", "success")
@@ -547,11 +515,11 @@ def referral_withdraw():
         status='pending'
     )
     db.session.add(request_item)
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=current_user.company_id,
         action='REFERRAL_WITHDRAW_REQUESTED',
         description=f'Referral withdrawal requested: {tokens} tokens by {current_user.username}'
-    ))
+    )
     db.session.commit()
     flash("Withdrawal request submitted.", "success")
     return redirect(url_for('auth.referrals'))
@@ -0,0 +1,52 @@
+import os
+
+from flask import url_for
+
+from cache import LRUCache
+
+DEFAULT_AVATAR = "images/default_avatar.svg"
+
+
+class AvatarResolver:
+    """Resolve ``User.avatar_path`` to a URL without a filesystem check per call.
+
+    Users with ``avatar_exists`` set skip the ``isfile`` check and older rows
+    are checked once; either way the built URL is kept in a bounded LRU keyed
+    by path, since ``url_for('static')`` itself can touch the filesystem.
+    """
+
+    def __init__(self, maxsize=4096, ttl=300):
+        self.static_folder = None
+        self._urls = LRUCache(maxsize, ttl=ttl)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self._urls.maxsize = app.config.get('AVATAR_CACHE_MAX_ENTRIES', 4096)
+        self._urls.ttl = app.config.get('AVATAR_CACHE_TTL', 300)
+
+    def url(self, user):
+        avatar_path = getattr(user, 'avatar_path', None)
+        if not avatar_path or getattr(user, 'avatar_exists', None) is False:
+            return url_for('static', filename=DEFAULT_AVATAR)
+
+        normalized = str(avatar_path).replace('\\', '/').strip('/')
+        cached = self._urls.get(normalized)
+        if cached is None:
+            if getattr(user, 'avatar_exists', None):
+                filename = normalized
+            else:
+                candidate = os.path.join(self.static_folder, normalized)
+                filename = normalized if os.path.isfile(candidate) else DEFAULT_AVATAR
+            cached = url_for('static', filename=filename)
+            self._urls.set(normalized, cached)
+        return cached
+
+    def forget(self, avatar_path):
+        if avatar_path:
+            self._urls.pop(str(avatar_path).replace('\\', '/').strip('/'))
+
+    def clear(self):
+        self._urls.clear()
+
+
+avatar_resolver = AvatarResolver()
@@ -0,0 +1,43 @@
+from sqlalchemy import case, or_
+
+from app import create_app
+from extensions import db
+from models import ActivityLog
+from activity import ACTION_CATEGORIES, DEFAULT_CATEGORY
+
+BATCH_SIZE = 5000
+
+
+def category_expression():
+    """SQL twin of ``activity.action_category``."""
+    action = db.func.upper(db.func.coalesce(ActivityLog.action, ''))
+    return case(
+        *[
+            (or_(*[action.like(f'%{marker}%') for marker in markers]), category)
+            for category, markers in ACTION_CATEGORIES
+        ],
+        else_=DEFAULT_CATEGORY
+    )
+
+
+def main():
+    """Fill in ActivityLog.category for rows written before the column existed."""
+    app = create_app()
+    with app.app_context():
+        table = ActivityLog.__table__
+        last_id = db.session.query(db.func.max(ActivityLog.id)).scalar() or 0
+        updated = 0
+        # Walk the primary key in ranges so no single transaction locks the whole table.
+        for start in range(0, last_id, BATCH_SIZE):
+            result = db.session.execute(
+                table.update()
+                .where(table.c.id > start, table.c.id <= start + BATCH_SIZE, table.c.category.is_(None))
+                .values(category=category_expression())
+            )
+            db.session.commit()
+            updated += result.rowcount
+        print(f"Categorised {updated} activity log rows.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+import os
+
+from app import create_app
+from extensions import db
+from models import User
+
+
+def main():
+    """Record whether each stored avatar file exists so pages can skip the check."""
+    app = create_app()
+    with app.app_context():
+        users = User.query.filter(User.avatar_path.isnot(None), User.avatar_exists.is_(None)).all()
+        missing = 0
+        for user in users:
+            normalized = str(user.avatar_path).replace('\\', '/').strip('/')
+            user.avatar_exists = os.path.isfile(os.path.join(app.static_folder, normalized))
+            if not user.avatar_exists:
+                missing += 1
+        db.session.commit()
+        print(f"Checked {len(users)} avatars; {missing} missing.")
+
+
+if __name__ == "__main__":
+    main()
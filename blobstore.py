@@ -0,0 +1,130 @@
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+from flask import send_file
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _lock_file(handle):
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        return
+    handle.seek(0)
+    while True:
+        try:
+            # LK_LOCK gives up after ten one-second retries; keep waiting.
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock_file(handle):
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        return
+    handle.seek(0)
+    msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class LocalBlobStore:
+    """Content-addressed blobs under a directory, named by their SHA-256.
+
+    Identical uploads share one file, and a key never changes meaning, so
+    it doubles as a strong ETag. An object-storage backend only needs the
+    same ``put``/``exists``/``open``/``delete``/``lock``/``response`` methods.
+
+    ``durable`` is only true when ``BLOB_STORE_PATH`` is set explicitly; the
+    ``instance/blobs`` default is wiped on every Render deploy.
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+        self.durable = root is not None
+
+    def init_app(self, app):
+        configured = app.config.get('BLOB_STORE_PATH')
+        root = configured or os.path.join(app.instance_path, 'blobs')
+        self.root = root if os.path.isabs(root) else os.path.join(app.root_path, root)
+        self.durable = bool(configured)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put(self, stream):
+        """Copy a binary stream into the store; returns ``(key, size)``."""
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            key = digest.hexdigest()
+            path = self._path(key)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return key, size
+
+    def exists(self, key):
+        return os.path.isfile(self._path(key))
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock(self):
+        """Exclusive store-wide lock, shared by every process on this host.
+
+        Hold it from checking a blob exists until the row pointing at it is
+        committed, and from checking nothing points at a blob until it is
+        deleted, so the two can never interleave.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'a+b') as handle:
+            _lock_file(handle)
+            try:
+                yield
+            finally:
+                _unlock_file(handle)
+
+    def response(self, key, download_name, mimetype):
+        """A download response that answers ``Range`` and ``If-None-Match`` requests."""
+        return send_file(
+            self._path(key),
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=key,
+        )
+
+
+blob_store = LocalBlobStore()
@@ -0,0 +1,18 @@
+import json
+import os
+
+from static_assets import MANIFEST_NAME, build_manifest
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+def main():
+    """Write static/manifest.json; run on deploy so workers skip hashing at startup."""
+    manifest = build_manifest(STATIC_FOLDER)
+    with open(os.path.join(STATIC_FOLDER, MANIFEST_NAME), "w") as handle:
+        json.dump(manifest, handle, indent=2, sort_keys=True)
+    print(f"Hashed {len(manifest)} static files into {MANIFEST_NAME}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import g, request, session
+from flask_login import current_user
+
+
+class LRUCache:
+    """Thread-safe mapping bounded to ``maxsize`` entries, with an optional TTL in seconds."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store ``value`` and return the ``(key, value)`` pairs evicted to make room."""
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            evicted = []
+            while len(self._data) > self.maxsize:
+                old_key, (old_value, _) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+            return evicted
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class PageCache:
+    """Rendered anonymous pages keyed by path and query string.
+
+    Each entry carries tags (e.g. ``product:12``) naming the data it was rendered
+    from, so a mutation drops exactly the pages that showed it. Tags only reach
+    this process; when ``version`` is set, each entry also records the catalog
+    version it was rendered at and is served only while that is still current,
+    so changes committed by other workers and cron scripts are picked up on the
+    next request.
+    """
+
+    def __init__(self, maxsize=512):
+        self.enabled = True
+        self.version = None
+        self._entries = LRUCache(maxsize)
+        self._tags = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app, version=None):
+        self.enabled = app.config.get('PAGE_CACHE_ENABLED', True)
+        self._entries.maxsize = app.config.get('PAGE_CACHE_MAX_ENTRIES', 512)
+        self.version = version
+
+    def _cacheable(self):
+        if not self.enabled or request.method != 'GET':
+            return False
+        if current_user.is_authenticated:
+            return False
+        # Pending flash messages are rendered into the page once.
+        return not session.get('_flashes')
+
+    def lookup(self):
+        if not self._cacheable():
+            return None
+        # Remember which invalidations this render has already seen; see store().
+        g.page_cache_generation = self._generation
+        g.page_cache_version = self.version() if self.version else None
+        entry = self._entries.get(request.full_path)
+        if entry is None or entry[2] != g.page_cache_version:
+            return None
+        return entry[0]
+
+    def store(self, body, tags):
+        if not self._cacheable():
+            return body
+        key = request.full_path
+        tags = frozenset(tags)
+        with self._lock:
+            # A mutation committed while this page was rendering may not be in it.
+            if g.get('page_cache_generation') != self._generation:
+                return body
+            previous = self._entries.pop(key)
+            if previous:
+                self._forget(key, previous[1])
+            entry = (body, tags, g.get('page_cache_version'))
+            for old_key, (_, old_tags, _) in self._entries.set(key, entry):
+                self._forget(old_key, old_tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+        return body
+
+    def _forget(self, key, tags):
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    entry = self._entries.pop(key)
+                    self._forget(key, entry[1] if entry else (tag,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+page_cache = PageCache()
@@ -0,0 +1,93 @@
+from sqlalchemy.orm import contains_eager
+
+from models import CartItem, Product, Company
+
+CART_PRODUCT_COLUMNS = (
+    Product.id, Product.company_id, Product.name, Product.price, Product.sale_price,
+    Product.stock, Product.weight_grams, Product.image_url, Product.image_variants,
+)
+CART_COMPANY_COLUMNS = (
+    Company.id, Company.name, Company.pickup_address, Company.pickup_lat, Company.pickup_lng,
+)
+
+
+class CartLine:
+    """One cart row with its price and weight worked out once."""
+
+    def __init__(self, item):
+        self.item = item
+        self.id = item.id
+        self.product_id = item.product_id
+        self.product = item.product
+        self.quantity = item.quantity or 0
+        self.unit_price = self.product.sale_price or self.product.price
+        self.line_total = self.unit_price * self.quantity
+        self.weight_grams = (self.product.weight_grams or 0) * self.quantity
+
+
+class CartGroup:
+    """Cart lines sold by one company."""
+
+    def __init__(self, company):
+        self.company = company
+        self.lines = []
+        self.subtotal = 0.0
+        self.total_weight_grams = 0
+
+    def add(self, line):
+        self.lines.append(line)
+        self.subtotal += line.line_total
+        self.total_weight_grams += line.weight_grams
+
+    @property
+    def pickup(self):
+        """The store's pickup point for the checkout map; empty if the store is gone."""
+        company = self.company
+        return {
+            "lat": company.pickup_lat if company else None,
+            "lng": company.pickup_lng if company else None,
+            "address": (company.pickup_address if company else None) or "",
+        }
+
+
+class CartSummary:
+    def __init__(self, items):
+        self.lines = [CartLine(item) for item in items]
+        self.groups = {}
+        for line in self.lines:
+            company_id = line.product.company_id
+            if company_id not in self.groups:
+                self.groups[company_id] = CartGroup(line.product.company)
+            self.groups[company_id].add(line)
+        self.subtotal = sum(group.subtotal for group in self.groups.values())
+        self.total_weight_grams = sum(group.total_weight_grams for group in self.groups.values())
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    @property
+    def company(self):
+        """The selling company when the whole cart comes from one, else None."""
+        if len(self.groups) != 1:
+            return None
+        return next(iter(self.groups.values())).company
+
+    @property
+    def company_id(self):
+        return next(iter(self.groups)) if len(self.groups) == 1 else None
+
+
+def cart_query(user_id):
+    """Cart rows with product and company loaded in the same SELECT.
+
+    The company is outer-joined: a product whose store row is gone still
+    shows up in the cart, with ``product.company`` as None.
+    """
+    return CartItem.query.join(CartItem.product).outerjoin(Product.company).options(
+        contains_eager(CartItem.product).load_only(*CART_PRODUCT_COLUMNS),
+        contains_eager(CartItem.product, Product.company).load_only(*CART_COMPANY_COLUMNS),
+    ).filter(CartItem.user_id == user_id).order_by(CartItem.id)
+
+
+def load_cart(user_id):
+    return CartSummary(cart_query(user_id).all())
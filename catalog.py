@@ -0,0 +1,280 @@
+import math
+from datetime import datetime
+from flask import current_app, request
+from sqlalchemy import Numeric, and_, case, cast, func, true
+from sqlalchemy.orm import joinedload, load_only
+
+from extensions import db
+from models import Product, Company, CatalogState
+from pagination import keyset_page
+from cache import page_cache
+
+MAX_PAGE_SIZE = 96
+# First listing pages: they show new products and the facet counts.
+CATALOG_HEAD_TAG = "catalog:head"
+PRICE_BUCKETS = ((None, 5000), (5000, 20000), (20000, 50000), (50000, 100000), (100000, None))
+RATING_THRESHOLDS = (4, 3, 2)
+FLAG_FILTERS = ("is_new", "is_hot", "in_stock")
+FILTER_ARGS = ("min_price", "max_price", "company", "min_rating") + FLAG_FILTERS
+
+# Columns rendered by the product cards (grid, lightbox data attributes).
+GRID_COLUMNS = (
+    Product.id, Product.company_id, Product.name, Product.description,
+    Product.price, Product.sale_price, Product.stock, Product.image_url, Product.image_variants,
+    Product.is_new, Product.is_hot, Product.weight_grams, Product.size_desc,
+    Product.rating_avg, Product.rating_count, Product.created_at,
+)
+
+
+def catalog_query():
+    """Product query for grids: company name joined in, unused columns skipped."""
+    return Product.query.options(
+        load_only(*GRID_COLUMNS),
+        joinedload(Product.company).load_only(Company.id, Company.name)
+    )
+
+
+def product_detail_query():
+    return Product.query.options(
+        joinedload(Product.company).load_only(
+            Company.id, Company.name, Company.description, Company.pickup_address
+        )
+    )
+
+
+def effective_price():
+    # Matches the ix_product_effective_price expression index.
+    return func.coalesce(Product.sale_price, Product.price)
+
+
+def parse_filters(args):
+    """Read the facet filters from request args, silently dropping invalid values."""
+    filters = {}
+    for key in ("min_price", "max_price", "min_rating"):
+        try:
+            value = float(args.get(key, ""))
+        except ValueError:
+            continue
+        if math.isfinite(value):
+            filters[key] = value
+    company = args.get("company", "")
+    if company.isdigit():
+        filters["company"] = int(company)
+    for key in FLAG_FILTERS:
+        if args.get(key) == "1":
+            filters[key] = True
+    return filters
+
+
+def filter_args(filters):
+    """Filters as URL args, for links and the infinite-scroll feed."""
+    args = {}
+    for key, value in filters.items():
+        if value is True:
+            value = "1"
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        args[key] = value
+    return args
+
+
+def _facet_conditions(filters):
+    """Filter conditions keyed by the facet that sets them."""
+    price = effective_price()
+    conditions = {}
+    price_bounds = []
+    if "min_price" in filters:
+        price_bounds.append(price >= filters["min_price"])
+    if "max_price" in filters:
+        price_bounds.append(price < filters["max_price"])
+    if price_bounds:
+        conditions["price"] = price_bounds
+    if "company" in filters:
+        conditions["company"] = [Product.company_id == filters["company"]]
+    if filters.get("is_new"):
+        conditions["is_new"] = [Product.is_new.is_(True)]
+    if filters.get("is_hot"):
+        conditions["is_hot"] = [Product.is_hot.is_(True)]
+    if filters.get("in_stock"):
+        conditions["in_stock"] = [Product.stock > 0]
+    if "min_rating" in filters:
+        conditions["rating"] = [Product.rating_avg >= filters["min_rating"]]
+    return conditions
+
+
+def _filter_conditions(filters, skip=None):
+    return [
+        condition
+        for facet, conditions in _facet_conditions(filters).items() if facet != skip
+        for condition in conditions
+    ]
+
+
+def apply_filters(query, filters):
+    return query.filter(*_filter_conditions(filters))
+
+
+def _count_if(*conditions):
+    return func.coalesce(func.sum(case((and_(true(), *conditions), 1), else_=0)), 0)
+
+
+def facet_counts(filters, match=None):
+    """Bucket counts for the catalog from one GROUP BY company query.
+
+    Each facet is counted with every other active filter applied but not its
+    own, so the alternatives to a selected store or price band keep their
+    counts and buyers can switch between them. ``match`` narrows everything
+    to a search's matches.
+    """
+    price = effective_price()
+
+    def count(facet, *conditions):
+        return _count_if(*_filter_conditions(filters, skip=facet), *conditions)
+
+    price_columns = []
+    for low, high in PRICE_BUCKETS:
+        bounds = []
+        if low is not None:
+            bounds.append(price >= low)
+        if high is not None:
+            bounds.append(price < high)
+        price_columns.append(count("price", *bounds))
+    rating_columns = [count("rating", Product.rating_avg >= threshold) for threshold in RATING_THRESHOLDS]
+    flag_columns = [
+        count("is_new", Product.is_new.is_(True)),
+        count("is_hot", Product.is_hot.is_(True)),
+        count("in_stock", Product.stock > 0),
+    ]
+
+    query = db.session.query(
+        Product.company_id,
+        Company.name,
+        count("company"),
+        *price_columns,
+        *rating_columns,
+        *flag_columns
+    ).join(Company, Company.id == Product.company_id)
+    if match is not None:
+        query = query.filter(match)
+    rows = query.group_by(Product.company_id, Company.name).all()
+
+    price_start = 3
+    rating_start = price_start + len(PRICE_BUCKETS)
+    flag_start = rating_start + len(RATING_THRESHOLDS)
+    facets = {
+        "total": sum(row[2] for row in rows),
+        "company": sorted(
+            (
+                {"id": row[0], "name": row[1], "count": row[2]}
+                for row in rows if row[2] or row[0] == filters.get("company")
+            ),
+            key=lambda item: (-item["count"], item["name"])
+        ),
+        "price": [
+            {"min": low, "max": high, "count": sum(row[price_start + i] for row in rows)}
+            for i, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        "rating": [
+            {"min": threshold, "count": sum(row[rating_start + i] for row in rows)}
+            for i, threshold in enumerate(RATING_THRESHOLDS)
+        ],
+    }
+    for i, key in enumerate(FLAG_FILTERS):
+        facets[key] = sum(row[flag_start + i] for row in rows)
+    return facets
+
+
+def catalog_page_size():
+    default = current_app.config.get('CATALOG_PAGE_SIZE', 24)
+    try:
+        size = int(request.args.get('per_page', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def product_listing(cursor=None, page_size=None, base_query=None):
+    """Return one page of the catalog, newest first, plus the next-page token."""
+    base_query = base_query if base_query is not None else catalog_query()
+    return keyset_page(
+        base_query,
+        Product.created_at,
+        Product.id,
+        cursor=cursor,
+        page_size=page_size or catalog_page_size()
+    )
+
+
+def ensure_catalog_state():
+    if not CatalogState.query.get(1):
+        db.session.add(CatalogState(id=1, version=0))
+        db.session.commit()
+
+
+def catalog_version():
+    # Always read the row: get() would answer from the session's identity map.
+    return db.session.query(CatalogState.version).filter(CatalogState.id == 1).scalar() or 0
+
+
+def bump_catalog_version():
+    """Advance the catalog version inside the caller's transaction."""
+    CatalogState.query.filter_by(id=1).update(
+        {CatalogState.version: CatalogState.version + 1, CatalogState.updated_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+
+
+def catalog_changed():
+    """Advance the catalog version in a short transaction of its own.
+
+    For hot paths such as checkout: called after the caller commits, the one
+    catalog_state row is locked for this UPDATE only, not for the caller's
+    whole transaction.
+    """
+    with db.engine.begin() as conn:
+        conn.execute(
+            CatalogState.__table__.update()
+            .where(CatalogState.id == 1)
+            .values(version=CatalogState.version + 1, updated_at=datetime.utcnow())
+        )
+
+
+def record_rating(product_id, rating, previous=None):
+    """Fold one new or edited review into the product's running aggregates.
+
+    A single UPDATE inside the caller's transaction; ``previous`` is the old
+    rating when an existing review is edited.
+    """
+    sum_delta = rating - (previous or 0)
+    count_delta = 0 if previous is not None else 1
+    new_sum = func.coalesce(Product.rating_sum, 0) + sum_delta
+    new_count = func.coalesce(Product.rating_count, 0) + count_delta
+    values = {
+        Product.rating_sum: new_sum,
+        Product.rating_count: new_count,
+        Product.rating_avg: func.round(cast(new_sum * 1.0 / new_count, Numeric), 1),
+    }
+    if previous != rating:
+        column = getattr(Product, f"rating_{rating}_count")
+        values[column] = func.coalesce(column, 0) + 1
+        if previous is not None:
+            old_column = getattr(Product, f"rating_{previous}_count")
+            values[old_column] = func.coalesce(old_column, 0) - 1
+    Product.query.filter_by(id=product_id).update(values, synchronize_session=False)
+
+
+def product_tag(product_id):
+    return f"product:{product_id}"
+
+
+def page_tags(products, head=False):
+    """Cache tags for a rendered page; ``head`` marks the first listing page."""
+    tags = {product_tag(product.id) for product in products}
+    if head:
+        tags.add(CATALOG_HEAD_TAG)
+    return tags
+
+
+def product_changed(product_id):
+    """Drop cached pages that show the product, plus first pages (new items, facet counts)."""
+    page_cache.invalidate(product_tag(product_id), CATALOG_HEAD_TAG)
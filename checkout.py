@@ -0,0 +1,186 @@
+from extensions import db
+from models import CheckoutSession, Order, OrderItem, CartItem, DiscountCustomer
+from activity import record_company_activity
+from inventory import reserve_stock, reservation_deadline, confirm_stock, release_stock
+from finance import distribute_order_amount
+from shipping import shipping_quotes
+from sales import record_order_placed, record_order_paid
+
+DELIVERY_FIELDS = (
+    ("delivery_country", "country"),
+    ("delivery_state", "state"),
+    ("delivery_area", "area"),
+    ("delivery_bus_stop", "bus_stop"),
+    ("delivery_address", "address"),
+    ("delivery_phone", "delivery_phone"),
+    ("delivery_map_url", "map_url"),
+)
+
+
+def _float_or_none(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def delivery_point(values):
+    """The ``delivery_lat``/``delivery_lng`` pair from a form, or ``(None, None)``."""
+    lat = _float_or_none(values.get('delivery_lat'))
+    lng = _float_or_none(values.get('delivery_lng'))
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None, None
+    return lat, lng
+
+
+def manual_distance_km(values):
+    distance_km = _float_or_none(values.get('distance_km'))
+    return distance_km if distance_km is not None and 0 < distance_km < float('inf') else 0.0
+
+
+def quote_shipping(summary, lat, lng, fallback_km=0.0):
+    """Shipping quote per company in the cart, keyed by company id."""
+    groups = summary.groups
+    quotes = shipping_quotes.quote_many(
+        [(group.company, group.total_weight_grams) for group in groups.values()],
+        lat, lng, fallback_km
+    )
+    return dict(zip(groups, quotes))
+
+
+def _discount_rates(buyer_id, company_ids):
+    rows = DiscountCustomer.query.filter(
+        DiscountCustomer.buyer_id == buyer_id,
+        DiscountCustomer.company_id.in_(company_ids),
+        DiscountCustomer.approved.is_(True)
+    ).all()
+    return {row.company_id: row.discount_rate or 0.0 for row in rows}
+
+
+def place_orders(buyer, summary, form):
+    """Turn a cart into one CheckoutSession with an Order per company.
+
+    Everything, including the stock reservation, is staged in the current
+    transaction for the caller to commit. Raises ``inventory.OutOfStock``.
+    """
+    delivery_lat, delivery_lng = delivery_point(form)
+    quotes = quote_shipping(summary, delivery_lat, delivery_lng, manual_distance_km(form))
+    delivery = {column: form.get(field, '').strip() for column, field in DELIVERY_FIELDS}
+    discounts = _discount_rates(buyer.id, list(summary.groups))
+    deadline = reservation_deadline()
+
+    checkout_session = CheckoutSession(buyer_id=buyer.id)
+    orders = []
+    for company_id, group in summary.groups.items():
+        quote = quotes[company_id]
+        discount = group.subtotal * (discounts.get(company_id, 0.0) / 100.0)
+        orders.append(Order(
+            buyer_id=buyer.id,
+            company_id=company_id,
+            checkout_session=checkout_session,
+            total_amount=max(group.subtotal - discount, 0) + quote.fee,
+            discount_amount=discount,
+            delivery_distance_km=quote.distance_km,
+            shipping_fee=quote.fee,
+            total_weight_grams=group.total_weight_grams,
+            reserved_until=deadline,
+            **delivery
+        ))
+    checkout_session.total_amount = sum(order.total_amount for order in orders)
+    db.session.add(checkout_session)
+    db.session.add_all(orders)
+
+    reserve_stock((line.product_id, line.quantity) for line in summary.lines)
+    db.session.flush()
+
+    db.session.bulk_insert_mappings(OrderItem, [
+        {"order_id": order.id, "product_id": line.product_id, "quantity": line.quantity, "price": line.unit_price}
+        for order, group in zip(orders, summary.groups.values())
+        for line in group.lines
+    ])
+    CartItem.query.filter(CartItem.id.in_([line.id for line in summary.lines])).delete(synchronize_session=False)
+    for order in orders:
+        record_order_placed(order)
+        record_company_activity(
+            company_id=order.company_id,
+            action='ORDER_PLACED',
+            description=f'User {buyer.username} placed order #{order.id}'
+        )
+    return checkout_session, orders
+
+
+def payable_orders(checkout_session):
+    return Order.query.filter_by(checkout_session_id=checkout_session.id, status='pending').order_by(Order.id).all()
+
+
+def payment_orders(payment):
+    """Orders covered by a payment: the whole checkout or a single order."""
+    if payment.checkout_session_id:
+        return Order.query.filter_by(checkout_session_id=payment.checkout_session_id).order_by(Order.id).all()
+    order = Order.query.get(payment.order_id) if payment.order_id else None
+    return [order] if order else []
+
+
+def _checkout_status(statuses):
+    if statuses == {'paid'}:
+        return 'paid'
+    if 'paid' in statuses:
+        return 'partially_paid'
+    for status in ('pending_verification', 'pending'):
+        if status in statuses:
+            return status
+    return statuses.pop() if len(statuses) == 1 else 'payment_failed'
+
+
+def sync_checkout_status(orders):
+    """Recompute the status of the checkouts these orders belong to from all of their orders.
+
+    Call it after changing order statuses in the current transaction; a
+    checkout with some orders paid and others not is ``partially_paid``.
+    """
+    session_ids = {order.checkout_session_id for order in orders if order.checkout_session_id}
+    if not session_ids:
+        return
+    statuses = {}
+    rows = db.session.query(Order.checkout_session_id, Order.status).filter(
+        Order.checkout_session_id.in_(session_ids)
+    )
+    for session_id, status in rows:
+        statuses.setdefault(session_id, set()).add(status)
+    for session_id, order_statuses in statuses.items():
+        CheckoutSession.query.filter_by(id=session_id).update(
+            {CheckoutSession.status: _checkout_status(order_statuses)}, synchronize_session=False
+        )
+
+
+def settle_orders(orders, payer_name, provider):
+    """Mark orders paid and fan the money out to each company.
+
+    Orders already paid are skipped so a replayed confirmation is harmless.
+    Returns the product ids whose stock changed.
+    """
+    restocked = []
+    for order in orders:
+        if order.status == 'paid':
+            continue
+        restocked.extend(confirm_stock(order))
+        order.status = 'paid'
+        distribute_order_amount(order)
+        record_order_paid(order)
+        record_company_activity(
+            company_id=order.company_id,
+            action="PAYMENT_SUCCESS",
+            description=f"{payer_name} paid order #{order.id} via {provider}"
+        )
+    sync_checkout_status(orders)
+    return restocked
+
+
+def fail_orders(orders):
+    """Release stock for unpaid orders after a failed payment."""
+    restocked = []
+    for order in orders:
+        if order.status == 'pending':
+            restocked.extend(release_stock(order, status='payment_failed'))
+    sync_checkout_status(orders)
+    return restocked
@@ -0,0 +1,38 @@
+from flask import current_app
+
+from models import ActivityLog, CompanyActivity, User
+from pagination import keyset_page
+
+
+def activity_page_size():
+    return current_app.config.get('ACTIVITY_PAGE_SIZE', 50)
+
+
+def _page(query, model, cursor, page_size):
+    return keyset_page(query, model.created_at, model.id, cursor, page_size or activity_page_size())
+
+
+def company_activity_feed(company_id=None, cursor=None, page_size=None):
+    """One newest-first page of CompanyActivity, optionally for a single company.
+
+    Returns ``(rows, next_cursor)``. Pages are fetched by keyset on
+    ``(created_at, id)``, so an old page costs the same as the first.
+    """
+    query = CompanyActivity.query
+    if company_id is not None:
+        query = query.filter(CompanyActivity.company_id == company_id)
+    return _page(query, CompanyActivity, cursor, page_size)
+
+
+def user_activity_feed(actor_id, cursor=None, page_size=None):
+    """One newest-first page of the ActivityLog rows ``actor_id`` wrote."""
+    query = ActivityLog.query.filter(ActivityLog.actor_id == actor_id)
+    return _page(query, ActivityLog, cursor, page_size)
+
+
+def manager_activity_feed(category=None, cursor=None, page_size=None):
+    """One newest-first page of ActivityLog rows written by managers, optionally of one category."""
+    query = ActivityLog.query.join(User, ActivityLog.actor_id == User.id).filter(User.role == 'manager')
+    if category is not None:
+        query = query.filter(ActivityLog.category == category)
+    return _page(query, ActivityLog, cursor, page_size)
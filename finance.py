@@ -1,5 +1,5 @@
-from extensions import db
-from models import User, Company, Order, OrderItem, Product, CompanyActivity
+from models import User, Company, Order, OrderItem, Product
+from activity import record_company_activity
 
 
 def distribute_order_amount(order):
@@ -35,8 +35,8 @@ def distribute_order_amount(order):
         if manager:
             manager.wallet_balance += manager_share
 
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=order.company_id,
         action="PAYMENT_DISTRIBUTED",
         description=f"Distributed payment for order #{order.id}"
-    ))
+    )
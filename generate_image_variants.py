@@ -0,0 +1,37 @@
+import os
+
+from app import create_app
+from extensions import db
+from models import Product
+from images import render_variants, save_variants_local, dump_variants
+from catalog import bump_catalog_version
+
+
+def main():
+    """Build resized variants for locally stored product images that predate the pipeline."""
+    app = create_app()
+    with app.app_context():
+        products = Product.query.filter(
+            Product.image_url.like('uploads/%'),
+            Product.image_variants.is_(None)
+        ).all()
+        done = 0
+        for product in products:
+            source = os.path.join(app.root_path, 'static', product.image_url)
+            if not os.path.isfile(source):
+                continue
+            with open(source, 'rb') as handle:
+                rendered = render_variants(handle.read())
+            if rendered is None:
+                print(f"Skipping unreadable image for product {product.id}: {product.image_url}")
+                continue
+            product.image_variants = dump_variants(save_variants_local(rendered))
+            done += 1
+        if done:
+            bump_catalog_version()
+        db.session.commit()
+        print(f"Generated image variants for {done} of {len(products)} products.")
+
+
+if __name__ == "__main__":
+    main()
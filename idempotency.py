@@ -0,0 +1,142 @@
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, request, abort, Response
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+KEY_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def request_idempotency_key():
+    """The key sent with this request as a header, form field or query arg."""
+    key = request.headers.get(HEADER) or request.form.get(FIELD) or request.args.get(FIELD)
+    if not key:
+        return None
+    if not KEY_RE.match(key):
+        abort(400)
+    return key
+
+
+def _claim(key):
+    """Insert the in-progress row for ``key``; returns the existing row if another request owns it."""
+    now = datetime.utcnow()
+    db.session.add(IdempotencyKey(
+        key=key,
+        user_id=current_user.id,
+        request_path=request.path,
+        expires_at=now + timedelta(hours=current_app.config.get('IDEMPOTENCY_KEY_TTL_HOURS', 24)),
+    ))
+    try:
+        db.session.commit()
+        return None
+    except IntegrityError:
+        db.session.rollback()
+
+    record = IdempotencyKey.query.filter_by(key=key).first()
+    if record is None:
+        return _claim(key)
+    lock_seconds = current_app.config.get('IDEMPOTENCY_LOCK_SECONDS', 60)
+    abandoned = record.status_code is None and record.created_at < now - timedelta(seconds=lock_seconds)
+    if record.expires_at < now or abandoned:
+        # Delete only the row we looked at, so two retries cannot both take it over.
+        deleted = IdempotencyKey.query.filter_by(id=record.id).delete(synchronize_session=False)
+        db.session.commit()
+        if deleted:
+            return _claim(key)
+        return IdempotencyKey.query.filter_by(key=key).first() or _claim(key)
+    return record
+
+
+def _wait_for_response(record):
+    """Poll until the request holding ``record`` has stored its response."""
+    deadline = time.monotonic() + current_app.config.get('IDEMPOTENCY_WAIT_SECONDS', 10)
+    record_id = record.id
+    while record is not None and record.status_code is None and time.monotonic() < deadline:
+        time.sleep(0.1)
+        db.session.rollback()
+        record = IdempotencyKey.query.get(record_id)
+    return record
+
+
+def _replay(record):
+    response = Response(record.response_body or '', status=record.status_code, mimetype=record.response_mimetype)
+    if record.response_location:
+        response.headers['Location'] = record.response_location
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _release(key):
+    db.session.rollback()
+    IdempotencyKey.query.filter_by(key=key, status_code=None).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def _store(key, response):
+    db.session.rollback()
+    IdempotencyKey.query.filter_by(key=key).update({
+        IdempotencyKey.status_code: response.status_code,
+        IdempotencyKey.response_location: response.headers.get('Location'),
+        IdempotencyKey.response_body: response.get_data(as_text=True),
+        IdempotencyKey.response_mimetype: response.mimetype,
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+def idempotent(view):
+    """Run ``view`` at most once per idempotency key; retries get the first response.
+
+    Requests without a key run as usual. A retry that arrives while the first
+    request is still running waits for its response rather than racing it.
+    Server errors and exceptions release the key so the client may try again.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request_idempotency_key()
+        if key is None or not current_user.is_authenticated:
+            return view(*args, **kwargs)
+
+        record = _claim(key)
+        if record is not None:
+            if record.user_id != current_user.id or record.request_path != request.path:
+                abort(422)
+            record = _wait_for_response(record)
+            if record is not None:
+                if record.status_code is None:
+                    abort(409)
+                return _replay(record)
+            # The first request failed and released the key; run it here instead.
+            if _claim(key) is not None:
+                abort(409)
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            _release(key)
+            raise
+        if response.status_code >= 500 or response.direct_passthrough:
+            _release(key)
+        else:
+            _store(key, response)
+        return response
+    return wrapper
+
+
+def purge_expired_keys(now=None):
+    now = now or datetime.utcnow()
+    deleted = IdempotencyKey.query.filter(IdempotencyKey.expires_at < now).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
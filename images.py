@@ -0,0 +1,113 @@
+import json
+import os
+import uuid
+from io import BytesIO
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest edge in pixels, largest first so each variant is reduced from the previous one.
+IMAGE_VARIANTS = (("detail", 1200), ("card", 480), ("thumb", 160))
+IMAGE_FORMATS = (("webp", "WEBP"), ("jpeg", "JPEG"))
+IMAGE_QUALITY = {"webp": 78, "jpeg": 82}
+DEFAULT_PRODUCT_IMAGE = "images/headphones.jpg"
+
+
+def _open_image(data):
+    image = Image.open(BytesIO(data))
+    # JPEG sources decode straight to a 1/2, 1/4 or 1/8 scale when far larger than needed.
+    largest = IMAGE_VARIANTS[0][1]
+    image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def render_variants(data):
+    """Resize raw image bytes into every variant and format.
+
+    Returns ``{variant: {"width": px, fmt: bytes, ...}}``, or None if the data is
+    not a readable image.
+    """
+    try:
+        image = _open_image(data)
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+    rendered = {}
+    for name, edge in IMAGE_VARIANTS:
+        if max(image.size) > edge:
+            # reducing_gap lets Pillow box-reduce by an integer factor before the resample.
+            image = image.copy()
+            image.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=2.0)
+        rendered[name] = {"width": image.width}
+        for fmt, pil_format in IMAGE_FORMATS:
+            buffer = BytesIO()
+            image.save(buffer, pil_format, quality=IMAGE_QUALITY[fmt], optimize=True)
+            rendered[name][fmt] = buffer.getvalue()
+    return rendered
+
+
+def save_variants_local(rendered):
+    upload_dir = os.path.join(current_app.root_path, "static", "uploads", "products")
+    os.makedirs(upload_dir, exist_ok=True)
+    stem = uuid.uuid4().hex
+    paths = {}
+    for name, formats in rendered.items():
+        paths[name] = {"width": formats["width"]}
+        for fmt, _ in IMAGE_FORMATS:
+            payload = formats[fmt]
+            ext = "jpg" if fmt == "jpeg" else fmt
+            filename = f"{stem}-{name}.{ext}"
+            with open(os.path.join(upload_dir, filename), "wb") as handle:
+                handle.write(payload)
+            paths[name][fmt] = f"uploads/products/{filename}"
+    return paths
+
+
+def load_variants(product):
+    raw = getattr(product, "image_variants", None)
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return {}
+
+
+def dump_variants(paths):
+    return json.dumps(paths, separators=(",", ":")) if paths else None
+
+
+def image_url(path):
+    if path and path.startswith("uploads/"):
+        return url_for("static", filename=path)
+    return path or None
+
+
+def product_image(product, variant="card"):
+    """Template data for a product image: fallback ``src``, per-format ``srcset`` and a ``full`` URL."""
+    variants = load_variants(product)
+    if variant not in variants:
+        src = image_url(product.image_url) or url_for("static", filename=DEFAULT_PRODUCT_IMAGE)
+        return {"src": src, "full": src, "srcset": {}}
+
+    srcset = {}
+    for fmt, _ in IMAGE_FORMATS:
+        candidates = [
+            f"{image_url(paths[fmt])} {paths['width']}w"
+            for paths in variants.values()
+            if fmt in paths
+        ]
+        if candidates:
+            srcset[fmt] = ", ".join(candidates)
+    full = variants.get("detail", variants[variant])
+    return {
+        "src": image_url(variants[variant].get("jpeg")),
+        "full": image_url(full.get("jpeg")),
+        "srcset": srcset,
+    }
@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from extensions import db
+from models import Order, OrderItem, Product
+from activity import record_company_activity
+from catalog import catalog_changed, product_changed
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id, requested):
+        super().__init__(f"Product {product_id} has fewer than {requested} units in stock")
+        self.product_id = product_id
+        self.requested = requested
+
+
+def _take_stock(product_id, quantity):
+    result = db.session.execute(
+        Product.__table__.update()
+        .where(Product.id == product_id, Product.stock >= quantity)
+        .values(stock=Product.stock - quantity)
+    )
+    return result.rowcount == 1
+
+
+def _merge_quantities(lines):
+    quantities = {}
+    for product_id, quantity in lines:
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    # Fixed order keeps concurrent checkouts from deadlocking on row locks.
+    return sorted(quantities.items())
+
+
+def reservation_deadline():
+    minutes = current_app.config.get('STOCK_RESERVATION_MINUTES', 30)
+    return datetime.utcnow() + timedelta(minutes=minutes)
+
+
+def reserve_stock(lines):
+    """Decrement stock for ``(product_id, quantity)`` pairs in the caller's transaction.
+
+    Each decrement is a conditional UPDATE, so concurrent buyers can never take
+    more than is on hand. Raises OutOfStock on the first short product; the
+    caller must roll back to undo the decrements already applied, or commit
+    and then pass the product ids to ``stock_changed``.
+    """
+    for product_id, quantity in _merge_quantities(lines):
+        if quantity > 0 and not _take_stock(product_id, quantity):
+            raise OutOfStock(product_id, quantity)
+
+
+def _order_lines(order):
+    return db.session.query(OrderItem.product_id, OrderItem.quantity).filter(
+        OrderItem.order_id == order.id
+    ).all()
+
+
+def _claim_reservation(order):
+    # Only one caller (payment webhook, admin, expiry job) wins the reservation.
+    result = db.session.execute(
+        Order.__table__.update()
+        .where(Order.id == order.id, Order.reserved_until.isnot(None))
+        .values(reserved_until=None)
+    )
+    return result.rowcount == 1
+
+
+def release_stock(order, status=None):
+    """Return an unpaid order's reserved units to stock.
+
+    Safe to call more than once; returns the product ids restocked, which the
+    caller passes to ``stock_changed`` after committing.
+    """
+    if not _claim_reservation(order):
+        return []
+    lines = _merge_quantities(_order_lines(order))
+    for product_id, quantity in lines:
+        db.session.execute(
+            Product.__table__.update()
+            .where(Product.id == product_id)
+            .values(stock=Product.stock + quantity)
+        )
+    order.reserved_until = None
+    if status:
+        order.status = status
+    return [product_id for product_id, _ in lines]
+
+
+def confirm_stock(order):
+    """Make a paid order's reservation permanent.
+
+    If the reservation had already been released (payment landed after it
+    expired), stock is taken again where still available and any shortfall is
+    recorded for the company to resolve. Returns the product ids restocked.
+    """
+    if _claim_reservation(order):
+        order.reserved_until = None
+        return []
+    if order.status not in ('expired', 'payment_failed'):
+        return []
+
+    taken = []
+    for product_id, quantity in _merge_quantities(_order_lines(order)):
+        if _take_stock(product_id, quantity):
+            taken.append(product_id)
+        else:
+            record_company_activity(
+                company_id=order.company_id,
+                action='STOCK_SHORTFALL',
+                description=f'Order #{order.id} was paid after its reservation lapsed; '
+                            f'product {product_id} is short of {quantity} units'
+            )
+    return taken
+
+
+def stock_changed(product_ids):
+    """After committing stock changes: advance the catalog version and drop cached pages."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    catalog_changed()
+    for product_id in product_ids:
+        product_changed(product_id)
+
+
+def release_expired_reservations(now=None):
+    """Release every unpaid order whose reservation window has passed."""
+    now = now or datetime.utcnow()
+    orders = Order.query.filter(
+        Order.status == 'pending',
+        Order.reserved_until.isnot(None),
+        Order.reserved_until < now
+    ).all()
+    restocked = set()
+    for order in orders:
+        restocked.update(release_stock(order, status='expired'))
+    db.session.commit()
+    stock_changed(restocked)
+    return len(orders)
@@ -1,5 +1,5 @@
 # manager.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
@@ -7,8 +7,15 @@ import os
 import uuid
 
 from extensions import db
-from models import User, Product, Order, CompanyActivity, DiscountRequest, DiscountCustomer, DailyReport, PayoutRequest, Company
-from activity import log_activity
+from models import User, Product, Order, DiscountRequest, DiscountCustomer, DailyReport, PayoutRequest, Company
+from activity import log_activity, record_company_activity, mark_activity_seen
+from feeds import company_activity_feed
+from resolver import user_names
+from reports import store_report_pdf, commit_report_pdf, report_pdf_response
+from sales import daily_sales, recent_days, summary_line
+from search import index_product, remove_product
+from catalog import product_changed, bump_catalog_version
+from images import IMAGE_FORMATS, render_variants, save_variants_local, dump_variants
 from flask import send_file
 from io import BytesIO
 from reportlab.pdfgen import canvas
@@ -22,7 +29,7 @@ ALLOWED_PRODUCT_IMAGE_EXTS = {"png", "jpg", "jpeg", "gif", "webp"}
 ALLOWED_REPORT_EXTS = {"pdf"}
 
 
-def _upload_product_image_cloud(file_storage):
+def _upload_product_image_cloud(file_obj):
     cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME", "").strip()
     api_key = os.getenv("CLOUDINARY_API_KEY", "").strip()
     api_secret = os.getenv("CLOUDINARY_API_SECRET", "").strip()
@@ -38,7 +45,7 @@ def _upload_product_image_cloud(file_storage):
     )
     try:
         result = cloudinary.uploader.upload(
-            file_storage,
+            file_obj,
             folder=f"{base_folder}/products",
             resource_type="image",
             use_filename=True,
@@ -50,22 +57,41 @@ def _upload_product_image_cloud(file_storage):
         return None
 
 
+def _upload_product_variants_cloud(rendered):
+    paths = {}
+    for name, formats in rendered.items():
+        paths[name] = {"width": formats["width"]}
+        for fmt, _ in IMAGE_FORMATS:
+            url = _upload_product_image_cloud(BytesIO(formats[fmt]))
+            if not url:
+                return None
+            paths[name][fmt] = url
+    return paths
+
+
 def _save_product_image(file_storage):
+    """Store an upload plus its resized variants; returns ``(image_url, variants_json)``."""
     filename = secure_filename(file_storage.filename or "")
     ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
     if ext not in ALLOWED_PRODUCT_IMAGE_EXTS:
-        return None
+        return None, None
+
+    data = file_storage.read()
+    rendered = render_variants(data)
+    if rendered is None:
+        return None, None
 
-    cloud_url = _upload_product_image_cloud(file_storage)
+    cloud_url = _upload_product_image_cloud(BytesIO(data))
     if cloud_url:
-        return cloud_url
+        return cloud_url, dump_variants(_upload_product_variants_cloud(rendered))
 
     upload_dir = os.path.join(current_app.root_path, 'static', 'uploads', 'products')
     os.makedirs(upload_dir, exist_ok=True)
     unique_name = f"{uuid.uuid4().hex}.{ext}"
     full_path = os.path.join(upload_dir, unique_name)
-    file_storage.save(full_path)
-    return f"uploads/products/{unique_name}"
+    with open(full_path, 'wb') as handle:
+        handle.write(data)
+    return f"uploads/products/{unique_name}", dump_variants(save_variants_local(rendered))
 
 
 # =========================================
@@ -82,31 +108,10 @@ def dashboard():
     orders = Order.query.filter_by(company_id=current_user.company_id).all()
     pending_users = User.query.filter_by(company_id=current_user.company_id, is_verified=False).all()
     discount_requests = DiscountRequest.query.filter_by(company_id=current_user.company_id, status='pending').all()
-    buyer_ids = [req.buyer_id for req in discount_requests]
-    buyer_map = {u.id: u.username for u in User.query.filter(User.id.in_(buyer_ids)).all()} if buyer_ids else {}
+    buyer_map = user_names.lookup(req.buyer_id for req in discount_requests)
     company = Company.query.get(current_user.company_id)
 
-    last_seen_raw = session.get('manager_last_seen_activity')
-    last_seen = None
-    if last_seen_raw:
-        try:
-            last_seen = datetime.fromisoformat(last_seen_raw)
-        except ValueError:
-            session.pop('manager_last_seen_activity', None)
-
-    activities_query = CompanyActivity.query.filter(
-        CompanyActivity.company_id == current_user.company_id
-    ).order_by(CompanyActivity.created_at.desc())
-    activities = activities_query.limit(20).all()
-    if last_seen:
-        unread_count = CompanyActivity.query.filter(
-            CompanyActivity.company_id == current_user.company_id,
-            CompanyActivity.created_at > last_seen
-        ).count()
-    else:
-        unread_count = CompanyActivity.query.filter(
-            CompanyActivity.company_id == current_user.company_id
-        ).count()
+    activities, _ = company_activity_feed(current_user.company_id, page_size=20)
     return render_template(
         'manager_dashboard.html',
         products=products,
@@ -115,8 +120,7 @@ def dashboard():
         discount_requests=discount_requests,
         company=company,
         buyer_map=buyer_map,
-        activities=activities,
-        unread_count=unread_count
+        activities=activities
     )
 
 
@@ -155,32 +159,12 @@ def activities():
         flash('Access denied', 'danger')
         return redirect(url_for('auth.login'))
 
-    last_seen_raw = session.get('manager_last_seen_activity')
-    last_seen = None
-    if last_seen_raw:
-        try:
-            last_seen = datetime.fromisoformat(last_seen_raw)
-        except ValueError:
-            session.pop('manager_last_seen_activity', None)
-
-    activities_query = CompanyActivity.query.filter(
-        CompanyActivity.company_id == current_user.company_id
-    ).order_by(CompanyActivity.created_at.desc())
-    activities_list = activities_query.limit(200).all()
-    if last_seen:
-        unread_count = CompanyActivity.query.filter(
-            CompanyActivity.company_id == current_user.company_id,
-            CompanyActivity.created_at > last_seen
-        ).count()
-    else:
-        unread_count = CompanyActivity.query.filter(
-            CompanyActivity.company_id == current_user.company_id
-        ).count()
+    activities_list, next_cursor = company_activity_feed(current_user.company_id, request.args.get('cursor'))
 
     return render_template(
         'manager_activities.html',
         activities=activities_list,
-        unread_count=unread_count
+        next_cursor=next_cursor
     )
 
 
@@ -191,7 +175,8 @@ def mark_activities_seen():
         flash('Access denied', 'danger')
         return redirect(url_for('auth.login'))
 
-    session['manager_last_seen_activity'] = datetime.utcnow().isoformat()
+    mark_activity_seen(current_user)
+    db.session.commit()
     return redirect(url_for('manager.activities'))
 
 
@@ -216,10 +201,11 @@ def add_product():
         image_url = request.form.get('image_url', '').strip()
         is_new = bool(request.form.get('is_new'))
         is_hot = bool(request.form.get('is_hot'))
+        image_variants = None
 
         image_file = request.files.get('image_file')
         if image_file and image_file.filename:
-            saved_path = _save_product_image(image_file)
+            saved_path, image_variants = _save_product_image(image_file)
             if not saved_path:
                 flash("Product image must be png, jpg, jpeg, gif, or webp.", "danger")
                 return redirect(url_for('manager.add_product'))
@@ -232,6 +218,7 @@ def add_product():
             sale_price=sale_price,
             stock=stock,
             image_url=image_url,
+            image_variants=image_variants,
             is_new=is_new,
             is_hot=is_hot,
             weight_grams=weight_grams,
@@ -240,12 +227,16 @@ def add_product():
             manager_id=current_user.id
         )
         db.session.add(product)
-        db.session.add(CompanyActivity(
+        db.session.flush()
+        index_product(product)
+        bump_catalog_version()
+        record_company_activity(
             company_id=current_user.company_id,
             action='PRODUCT_ADDED',
             description=f'Product {name} added by manager {current_user.username}'
-        ))
+        )
         db.session.commit()
+        product_changed(product.id)
         log_activity(current_user.id, "PRODUCT_ADDED", f"Product {name} added", company_id=current_user.company_id)
         flash(f'Product "{name}" added successfully!', 'success')
         return redirect(url_for('manager.dashboard'))
@@ -284,20 +275,26 @@ def edit_product(product_id):
 
         image_file = request.files.get('image_file')
         if image_file and image_file.filename:
-            saved_path = _save_product_image(image_file)
+            saved_path, image_variants = _save_product_image(image_file)
             if not saved_path:
                 flash("Product image must be png, jpg, jpeg, gif, or webp.", "danger")
                 return redirect(url_for('manager.edit_product', product_id=product_id))
-            image_url = saved_path
-        if image_url:
+            product.image_url = saved_path
+            product.image_variants = image_variants
+        elif image_url and image_url != product.image_url:
+            # A pasted URL has no generated variants.
             product.image_url = image_url
+            product.image_variants = None
 
-        db.session.add(CompanyActivity(
+        index_product(product)
+        bump_catalog_version()
+        record_company_activity(
             company_id=current_user.company_id,
             action='PRODUCT_UPDATED',
             description=f'Product {product.name} updated by manager {current_user.username}'
-        ))
+        )
         db.session.commit()
+        product_changed(product.id)
         log_activity(current_user.id, "PRODUCT_UPDATED", f"Product {product.name} updated", company_id=current_user.company_id)
         flash(f'Product "{product.name}" updated successfully!', 'success')
         return redirect(url_for('manager.dashboard'))
@@ -335,13 +332,16 @@ def delete_product(product_id):
         return redirect(url_for('manager.dashboard'))
 
     product_name = product.name
+    remove_product(product.id)
+    bump_catalog_version()
     db.session.delete(product)
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=current_user.company_id,
         action='PRODUCT_DELETED',
         description=f'Product {product_name} deleted by manager {current_user.username}'
-    ))
+    )
     db.session.commit()
+    product_changed(product_id)
     log_activity(current_user.id, "PRODUCT_DELETED", f"Product {product_name} deleted", company_id=current_user.company_id)
     flash(f'Product "{product_name}" deleted successfully!', 'success')
     return redirect(url_for('manager.dashboard'))
@@ -362,11 +362,11 @@ def approve_user(user_id):
         return redirect(url_for('manager.dashboard'))
 
     user.is_verified = True
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=current_user.company_id,
         action='USER_APPROVED',
         description=f'User {user.username} approved as regular customer by manager {current_user.username}'
-    ))
+    )
     db.session.commit()
     log_activity(current_user.id, "USER_APPROVED", f"User {user.username} approved", company_id=current_user.company_id)
     flash(f'User "{user.username}" approved successfully!', 'success')
@@ -405,11 +405,11 @@ def approve_discount(request_id):
             discount_rate=discount_rate
         ))
 
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=current_user.company_id,
         action='DISCOUNT_APPROVED',
         description=f'Discount approved for buyer ID {request_item.buyer_id}'
-    ))
+    )
     db.session.commit()
     log_activity(current_user.id, "DISCOUNT_APPROVED", f"Discount approved for buyer {request_item.buyer_id}", company_id=current_user.company_id)
     flash('Discount request approved.', 'success')
@@ -459,26 +459,23 @@ def reports():
         if ext not in ALLOWED_REPORT_EXTS:
             flash('Report must be a PDF file.', 'danger')
             return redirect(url_for('manager.reports'))
-        pdf_data = report_file.read()
-        if not pdf_data:
-            flash('Uploaded PDF is empty.', 'danger')
-            return redirect(url_for('manager.reports'))
 
         report = DailyReport(
             company_id=current_user.company_id,
             manager_id=current_user.id,
             content=content,
-            pdf_filename=filename,
-            pdf_data=pdf_data,
-            pdf_mimetype=report_file.mimetype or "application/pdf"
+            pdf_filename=filename
         )
+        if not store_report_pdf(report, report_file.stream, report_file.mimetype):
+            flash('Uploaded PDF is empty.', 'danger')
+            return redirect(url_for('manager.reports'))
         db.session.add(report)
-        db.session.add(CompanyActivity(
+        record_company_activity(
             company_id=current_user.company_id,
             action='REPORT_SUBMITTED',
             description=f'Manager {current_user.username} submitted a daily report'
-        ))
-        db.session.commit()
+        )
+        commit_report_pdf(report, report_file.stream)
         log_activity(current_user.id, "REPORT_SUBMITTED", "Daily report submitted", company_id=current_user.company_id)
         flash('Report submitted.', 'success')
         return redirect(url_for('manager.reports'))
@@ -498,16 +495,11 @@ def download_report(report_id):
     if report.company_id != current_user.company_id:
         flash('Access denied', 'danger')
         return redirect(url_for('manager.reports'))
-    if not report.pdf_data:
+    response = report_pdf_response(report)
+    if response is None:
         flash('No PDF available for this report.', 'danger')
         return redirect(url_for('manager.reports'))
-
-    return send_file(
-        BytesIO(report.pdf_data),
-        as_attachment=True,
-        download_name=report.pdf_filename or "daily_report.pdf",
-        mimetype=report.pdf_mimetype or "application/pdf"
-    )
+    return response
 
 
 # =========================================
@@ -531,11 +523,11 @@ def request_payout():
         amount=amount
     )
     db.session.add(payout)
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=current_user.company_id,
         action='PAYOUT_REQUESTED',
         description=f'Manager {current_user.username} requested payout of {amount}'
-    ))
+    )
     db.session.commit()
     log_activity(current_user.id, "PAYOUT_REQUESTED", f"Payout {amount} requested", company_id=current_user.company_id)
     flash('Payout request submitted.', 'success')
@@ -555,9 +547,14 @@ def daily_statement_pdf():
     buffer = BytesIO()
     p = canvas.Canvas(buffer)
     p.setFont("Helvetica-Bold", 14)
-    p.drawString(50, 800, f"Daily Statement - {datetime.utcnow().date()}")
+    today = datetime.utcnow().date()
+    p.drawString(50, 800, f"Daily Statement - {today}")
     y = 770
     p.setFont("Helvetica", 11)
+    for row in reversed(daily_sales(recent_days(7, today), today, company_id=current_user.company_id)):
+        p.drawString(50, y, f"{row.day}: {summary_line(row)}")
+        y -= 15
+    y -= 10
     for order in Order.query.filter_by(company_id=current_user.company_id).order_by(Order.created_at.desc()).limit(50).all():
         p.drawString(50, y, f"Order #{order.id} - ₦{order.total_amount:,.0f} - {order.status}")
         y -= 15
@@ -0,0 +1,37 @@
+from io import BytesIO
+
+from app import create_app
+from extensions import db
+from models import DailyReport
+from blobstore import blob_store
+
+
+def main():
+    """Move DailyReport PDF bodies out of the table and into the blob store."""
+    app = create_app()
+    if not blob_store.durable:
+        # The instance/blobs default does not survive a redeploy; clearing
+        # pdf_data into it would lose every report.
+        raise SystemExit("BLOB_STORE_PATH is not set. Point it at persistent storage before migrating report PDFs.")
+    with app.app_context():
+        ids = [
+            report_id for (report_id,) in db.session.query(DailyReport.id).filter(
+                DailyReport.pdf_data.isnot(None), DailyReport.pdf_blob_key.is_(None)
+            ).order_by(DailyReport.id)
+        ]
+        moved = 0
+        for report_id in ids:
+            # One body in memory at a time.
+            pdf_data = db.session.query(DailyReport.pdf_data).filter(DailyReport.id == report_id).scalar()
+            key, size = blob_store.put(BytesIO(pdf_data))
+            DailyReport.query.filter_by(id=report_id).update(
+                {DailyReport.pdf_blob_key: key, DailyReport.pdf_size: size, DailyReport.pdf_data: None},
+                synchronize_session=False
+            )
+            db.session.commit()
+            moved += 1
+        print(f"Moved {moved} report PDFs to {blob_store.root}.")
+
+
+if __name__ == "__main__":
+    main()
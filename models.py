@@ -24,6 +24,7 @@ class User(UserMixin, db.Model):
     notify_email = db.Column(db.Boolean, default=True)
     notify_sms = db.Column(db.Boolean, default=True)
     avatar_path = db.Column(db.String(300))
+    avatar_exists = db.Column(db.Boolean)  # None: not checked yet
     commission_rate = db.Column(db.Float, default=5.0)
 
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'))  # managers only
@@ -78,12 +79,20 @@ class Product(db.Model):
     sale_price = db.Column(db.Float)
     stock = db.Column(db.Integer, default=0)
     image_url = db.Column(db.String(500))
+    image_variants = db.Column(db.Text)
     is_new = db.Column(db.Boolean, default=False)
     is_hot = db.Column(db.Boolean, default=False)
     weight_grams = db.Column(db.Integer, default=0)
     size_desc = db.Column(db.String(120))
     rating_avg = db.Column(db.Float, default=4.0)
     rating_count = db.Column(db.Integer, default=0)
+    # Running review aggregates, maintained by catalog.record_rating.
+    rating_sum = db.Column(db.Integer, default=0)
+    rating_1_count = db.Column(db.Integer, default=0)
+    rating_2_count = db.Column(db.Integer, default=0)
+    rating_3_count = db.Column(db.Integer, default=0)
+    rating_4_count = db.Column(db.Integer, default=0)
+    rating_5_count = db.Column(db.Integer, default=0)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -92,6 +101,20 @@ class Product(db.Model):
     price_logs = db.relationship('PriceHistory', backref='product', lazy=True)
     reviews = db.relationship('ProductReview', backref='product', lazy=True, cascade='all, delete-orphan')
 
+    @property
+    def rating_histogram(self):
+        """``[(stars, count), ...]`` from 5 stars down to 1."""
+        return [(stars, getattr(self, f'rating_{stars}_count') or 0) for stars in range(5, 0, -1)]
+
+
+# =========================
+# CATALOG STATE
+# =========================
+class CatalogState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 
 # =========================
 # PRODUCT REVIEWS
@@ -127,6 +150,37 @@ class CartItem(db.Model):
     quantity = db.Column(db.Integer, default=1)
 
 
+# =========================
+# CHECKOUT SESSION
+# =========================
+class CheckoutSession(db.Model):
+    """One buyer checkout, paid once, split into an Order per company."""
+    id = db.Column(db.Integer, primary_key=True)
+    buyer_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    total_amount = db.Column(db.Float, default=0.0)
+    status = db.Column(db.String(20), default='pending')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    orders = db.relationship('Order', backref='checkout_session', lazy=True)
+
+
+# =========================
+# SHIPPING RATES
+# =========================
+class ShippingRate(db.Model):
+    """One tier of the shipping rate table.
+
+    A tier covers shipments up to ``max_weight_grams`` and ``max_distance_km``
+    (NULL means no limit); the tightest tier that fits is used.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    max_weight_grams = db.Column(db.Integer)
+    max_distance_km = db.Column(db.Float)
+    base_fee = db.Column(db.Float, default=0.0, nullable=False)
+    rate_per_gram = db.Column(db.Float, default=0.0, nullable=False)
+    rate_per_km = db.Column(db.Float, default=0.0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 # =========================
 # ORDER
 # =========================
@@ -134,6 +188,7 @@ class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     buyer_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'))
+    checkout_session_id = db.Column(db.Integer, db.ForeignKey('checkout_session.id'), index=True)
     total_amount = db.Column(db.Float)
     status = db.Column(db.String(20), default='pending')
     payment_reference = db.Column(db.String(100))
@@ -146,7 +201,10 @@ class Order(db.Model):
     delivery_map_url = db.Column(db.String(500))
     delivery_distance_km = db.Column(db.Float)
     shipping_fee = db.Column(db.Float, default=0.0)
+    discount_amount = db.Column(db.Float, default=0.0)
     total_weight_grams = db.Column(db.Integer, default=0)
+    # Set while unpaid items hold stock; cleared on payment or release.
+    reserved_until = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     items = db.relationship('OrderItem', backref='order', lazy=True)
 
@@ -169,6 +227,8 @@ class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'))
+    # Set instead of order_id when one payment covers a whole checkout.
+    checkout_session_id = db.Column(db.Integer, db.ForeignKey('checkout_session.id'))
     amount = db.Column(db.Float)
     provider = db.Column(db.String(50))
     reference = db.Column(db.String(100))
@@ -207,11 +267,44 @@ class DailyReport(db.Model):
     manager_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     content = db.Column(db.Text)
     pdf_filename = db.Column(db.String(255))
-    pdf_data = db.Column(db.LargeBinary)
+    # Inline PDF body, used until a durable blob store is configured; migrate_report_blobs.py moves it out.
+    pdf_data = db.deferred(db.Column(db.LargeBinary))
+    pdf_blob_key = db.Column(db.String(64), index=True)
+    pdf_size = db.Column(db.Integer)
     pdf_mimetype = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# Tested in SQL so listing pages never load a PDF body.
+DailyReport.has_pdf = db.column_property(
+    db.or_(DailyReport.pdf_blob_key.isnot(None), DailyReport.pdf_data.isnot(None))
+)
+
+
+# =========================
+# DAILY SALES ROLLUP
+# =========================
+class DailyCompanySales(db.Model):
+    """Per-company, per-day sales totals, kept current as orders are placed and paid.
+
+    Orders count towards the day they were placed and payouts towards the
+    day they were requested, so ``rebuild_daily_sales.py`` can recompute
+    every row from the source tables.
+    """
+    __table_args__ = (db.UniqueConstraint('company_id', 'day', name='uq_daily_company_sales_company_day'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey('company.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    order_count = db.Column(db.Integer, default=0, nullable=False)
+    gmv = db.Column(db.Float, default=0.0, nullable=False)
+    shipping_total = db.Column(db.Float, default=0.0, nullable=False)
+    discount_total = db.Column(db.Float, default=0.0, nullable=False)
+    paid_count = db.Column(db.Integer, default=0, nullable=False)
+    paid_amount = db.Column(db.Float, default=0.0, nullable=False)
+    payout_total = db.Column(db.Float, default=0.0, nullable=False)
+
+
 # =========================
 # REFERRALS
 # =========================
@@ -271,10 +364,18 @@ class ActivityLog(db.Model):
     actor_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'))
     action = db.Column(db.String(100))
+    category = db.Column(db.String(20))
     detail = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class ActivityUnread(db.Model):
+    """A viewer's unread bell count, bumped as activity rows are written."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    unread = db.Column(db.Integer, default=0, nullable=False)
+    seen_at = db.Column(db.DateTime)
+
+
 # =========================
 # BANK TRANSFER DEPOSITS
 # =========================
@@ -334,3 +435,21 @@ class ManagerAccountRequest(db.Model):
     admin_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# =========================
+# IDEMPOTENCY KEYS
+# =========================
+class IdempotencyKey(db.Model):
+    """The stored response for a request that may be retried with the same key."""
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    request_path = db.Column(db.String(255), nullable=False)
+    # NULL while the first request is still running.
+    status_code = db.Column(db.Integer)
+    response_location = db.Column(db.String(2048))
+    response_body = db.Column(db.Text)
+    response_mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,91 @@
+from datetime import date, datetime, time
+
+from sqlalchemy import and_, or_, select
+
+from extensions import db
+from models import Company, Order, Payment, User
+from pagination import keyset_page
+
+ORDER_STATUSES = ('pending', 'pending_verification', 'paid', 'payment_failed', 'expired', 'refunded')
+PAYMENT_PROVIDERS = ('paystack', 'flutterwave', 'opay')
+
+
+def _parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_order_filters(args):
+    """Read the orders console filters from request args, silently dropping invalid values."""
+    filters = {}
+    if args.get('status') in ORDER_STATUSES:
+        filters['status'] = args['status']
+    if args.get('provider') in PAYMENT_PROVIDERS:
+        filters['provider'] = args['provider']
+    company = args.get('company', '')
+    if company.isdigit():
+        filters['company'] = int(company)
+    for key in ('date_from', 'date_to'):
+        day = _parse_day(args.get(key))
+        if day is not None:
+            filters[key] = day
+    return filters
+
+
+def order_filter_args(filters):
+    """Filters as URL args, for the pager links."""
+    return {key: value.isoformat() if isinstance(value, date) else value for key, value in filters.items()}
+
+
+def latest_payment_id():
+    """Correlated subquery for an order's newest payment, made for it or for its whole checkout."""
+    return (
+        select(Payment.id)
+        .where(or_(
+            Payment.order_id == Order.id,
+            and_(Order.checkout_session_id.isnot(None), Payment.checkout_session_id == Order.checkout_session_id)
+        ))
+        .order_by(Payment.id.desc())
+        .limit(1)
+        .correlate(Order)
+        .scalar_subquery()
+    )
+
+
+def order_listing(filters, cursor=None, page_size=50):
+    """One newest-first page of orders with buyer, company and latest payment.
+
+    Each page is a single query: buyer and company names are joined in and
+    the payment comes from a correlated subquery, so the cost depends on
+    the page size rather than on the number of orders. Returns
+    ``(rows, next_cursor)``; each row has ``Order``, ``buyer_name``,
+    ``company_name`` and ``provider``.
+    """
+    query = (
+        db.session.query(
+            Order,
+            User.username.label('buyer_name'),
+            Company.name.label('company_name'),
+            Payment.provider.label('provider'),
+        )
+        .outerjoin(User, User.id == Order.buyer_id)
+        .outerjoin(Company, Company.id == Order.company_id)
+        .outerjoin(Payment, Payment.id == latest_payment_id())
+    )
+    if 'status' in filters:
+        query = query.filter(Order.status == filters['status'])
+    if 'company' in filters:
+        query = query.filter(Order.company_id == filters['company'])
+    if 'date_from' in filters:
+        query = query.filter(Order.created_at >= datetime.combine(filters['date_from'], time.min))
+    if 'date_to' in filters:
+        # Inclusive end of day; adding a day would overflow on date.max.
+        query = query.filter(Order.created_at <= datetime.combine(filters['date_to'], time.max))
+    if 'provider' in filters:
+        query = query.filter(Payment.provider == filters['provider'])
+    return keyset_page(
+        query, Order.created_at, Order.id, cursor, page_size,
+        key=lambda row: (row.Order.created_at, row.Order.id)
+    )
@@ -0,0 +1,43 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(created_at, id)`` for a cursor token, or None when it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_raw, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return datetime.fromisoformat(created_raw), int(row_id)
+    except (ValueError, TypeError, json.JSONDecodeError):
+        return None
+
+
+def keyset_page(query, created_col, id_col, cursor=None, page_size=24, key=None):
+    """Fetch one newest-first page of ``query`` after ``cursor``.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    key = key or (lambda row: (row.created_at, row.id))
+    position = decode_cursor(cursor) if isinstance(cursor, str) else cursor
+    if position:
+        created_at, row_id = position
+        query = query.filter(or_(
+            created_col < created_at,
+            and_(created_col == created_at, id_col < row_id)
+        ))
+
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(page_size + 1).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(*key(rows[-1]))
+    return rows, next_cursor
@@ -3,11 +3,13 @@ import requests, os, uuid, json, hmac, hashlib
 from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from extensions import db
-from models import Order, CompanyActivity, Payment, Company, BankTransfer
+from models import Order, Payment, Company, BankTransfer, CheckoutSession
 from notifications import notify_user
 from activity import log_activity
 from opay_api import query_status as opay_query_status, refund as opay_refund
-from finance import distribute_order_amount
+from inventory import stock_changed
+from checkout import payable_orders, payment_orders, settle_orders, fail_orders, sync_checkout_status
+from idempotency import idempotent, request_idempotency_key
 
 payments_bp = Blueprint('payments', __name__, template_folder='templates', url_prefix='/payments')
 
@@ -25,23 +27,70 @@ def payment_page(order_id):
 
     if request.method == 'POST':
         method = request.form.get('payment_method')
+        # The start endpoints are idempotent on this key, so a refresh or a
+        # back-navigation replays the first attempt instead of starting another.
+        key = request_idempotency_key()
         if method == "paystack":
-            return redirect(url_for('payments.start_paystack', order_id=order.id))
+            return redirect(url_for('payments.start_paystack', order_id=order.id, idempotency_key=key))
         elif method == "flutterwave":
-            return redirect(url_for('payments.start_flutterwave', order_id=order.id))
+            return redirect(url_for('payments.start_flutterwave', order_id=order.id, idempotency_key=key))
         elif method == "opay":
-            return redirect(url_for('payments.start_opay', order_id=order.id))
+            return redirect(url_for('payments.start_opay', order_id=order.id, idempotency_key=key))
         elif method == "bank_transfer":
             return redirect(url_for('payments.bank_transfer', order_id=order.id))
 
     return render_template("payment_page.html", order=order)
 
 
+def _buyer_checkout_session(session_id):
+    checkout_session = CheckoutSession.query.get_or_404(session_id)
+    if checkout_session.buyer_id != current_user.id:
+        return None
+    return checkout_session
+
+
+# =========================================
+# CHECKOUT SESSION PAYMENT (ALL STORES AT ONCE)
+# =========================================
+@payments_bp.route('/checkout/<int:session_id>', methods=['GET', 'POST'])
+@login_required
+def checkout_payment_page(session_id):
+    checkout_session = _buyer_checkout_session(session_id)
+    if not checkout_session:
+        flash("Access denied", "danger")
+        return redirect(url_for('shop.products'))
+
+    orders = payable_orders(checkout_session)
+    if not orders:
+        flash("These orders have already been paid or closed.", "info")
+        return redirect(url_for('shop.orders'))
+
+    if request.method == 'POST':
+        method = request.form.get('payment_method')
+        key = request_idempotency_key()
+        if method == "paystack":
+            return redirect(url_for('payments.start_paystack_session', session_id=checkout_session.id, idempotency_key=key))
+        elif method == "flutterwave":
+            return redirect(url_for('payments.start_flutterwave_session', session_id=checkout_session.id, idempotency_key=key))
+        elif method == "opay":
+            return redirect(url_for('payments.start_opay_session', session_id=checkout_session.id, idempotency_key=key))
+        elif method == "bank_transfer":
+            return redirect(url_for('payments.bank_transfer_session', session_id=checkout_session.id))
+
+    return render_template(
+        "payment_page.html",
+        checkout_session=checkout_session,
+        orders=orders,
+        amount_due=sum(order.total_amount for order in orders)
+    )
+
+
 # =========================================
 # PAYSTACK START
 # =========================================
 @payments_bp.route('/paystack/start/<int:order_id>')
 @login_required
+@idempotent
 def start_paystack(order_id):
     order = Order.query.get_or_404(order_id)
     reference = str(uuid.uuid4())
@@ -75,6 +124,48 @@ def start_paystack(order_id):
     return redirect(url_for("payments.payment_page", order_id=order.id))
 
 
+@payments_bp.route('/paystack/checkout/<int:session_id>')
+@login_required
+@idempotent
+def start_paystack_session(session_id):
+    checkout_session = _buyer_checkout_session(session_id)
+    if not checkout_session:
+        flash("Access denied", "danger")
+        return redirect(url_for('shop.products'))
+    orders = payable_orders(checkout_session)
+    if not orders:
+        return redirect(url_for('shop.orders'))
+
+    if not current_app.config.get('PAYSTACK_SECRET_KEY'):
+        flash("Paystack key not configured.", "danger")
+        return redirect(url_for("payments.checkout_payment_page", session_id=checkout_session.id))
+
+    amount = sum(order.total_amount for order in orders)
+    reference = str(uuid.uuid4())
+    headers = {
+        "Authorization": f"Bearer {current_app.config['PAYSTACK_SECRET_KEY']}",
+        "Content-Type": "application/json"
+    }
+    data = {
+        "email": current_user.email,
+        "amount": int(amount * 100),
+        "reference": reference,
+        "callback_url": url_for('payments.verify_paystack', _external=True)
+    }
+
+    payment = Payment(checkout_session_id=checkout_session.id, amount=amount, provider='paystack', reference=reference)
+    db.session.add(payment)
+    db.session.commit()
+
+    res = requests.post("https://api.paystack.co/transaction/initialize", json=data, headers=headers)
+    response = res.json()
+
+    if response.get("status"):
+        return redirect(response["data"]["authorization_url"])
+    flash("Payment failed", "danger")
+    return redirect(url_for("payments.checkout_payment_page", session_id=checkout_session.id))
+
+
 @payments_bp.route('/paystack/verify')
 @login_required
 def verify_paystack():
@@ -89,30 +180,35 @@ def verify_paystack():
             flash("Payment record not found.", "danger")
             return redirect(url_for("shop.products"))
 
-        order = Order.query.get(payment.order_id)
-        if not order:
+        orders = payment_orders(payment)
+        if not orders:
             flash("Order not found.", "danger")
             return redirect(url_for("shop.products"))
 
-        order.status = "paid"
         payment.status = "paid"
-        distribute_order_amount(order)
-        db.session.add(CompanyActivity(
-            company_id=order.company_id,
-            action="PAYMENT_SUCCESS",
-            description=f"{current_user.username} paid order #{order.id} via Paystack"
-        ))
+        restocked = settle_orders(orders, current_user.username, "Paystack")
         db.session.commit()
-        log_activity(current_user.id, "PAYSTACK_PAYMENT", f"Order #{order.id} paid", company_id=order.company_id)
+        stock_changed(restocked)
+        for order in orders:
+            log_activity(current_user.id, "PAYSTACK_PAYMENT", f"Order #{order.id} paid", company_id=order.company_id)
         flash("Paystack payment successful", "success")
+        order_refs = ", ".join(f"#{order.id}" for order in orders)
         notify_user(
             current_user,
             "Payment Successful",
-            f"Payment received for order #{order.id}. Amount: ₦{order.total_amount:,.0f}.",
-            f"Payment success for order #{order.id}. Amount: ₦{order.total_amount:,.0f}."
+            f"Payment received for order {order_refs}. Amount: ₦{payment.amount:,.0f}.",
+            f"Payment success for order {order_refs}. Amount: ₦{payment.amount:,.0f}."
         )
         return redirect(url_for("shop.products"))
 
+    if data["data"]["status"] in ("failed", "abandoned", "reversed"):
+        payment = Payment.query.filter_by(reference=ref, provider='paystack').first()
+        if payment and payment.status != "paid":
+            payment.status = "failed"
+            restocked = fail_orders(payment_orders(payment))
+            db.session.commit()
+            stock_changed(restocked)
+
     flash("Payment verification failed", "danger")
     return redirect(url_for("shop.products"))
 
@@ -122,6 +218,7 @@ def verify_paystack():
 # =========================================
 @payments_bp.route('/flutterwave/start/<int:order_id>')
 @login_required
+@idempotent
 def start_flutterwave(order_id):
     order = Order.query.get_or_404(order_id)
     tx_ref = str(uuid.uuid4())
@@ -161,6 +258,55 @@ def start_flutterwave(order_id):
     return redirect(url_for("payments.payment_page", order_id=order.id))
 
 
+@payments_bp.route('/flutterwave/checkout/<int:session_id>')
+@login_required
+@idempotent
+def start_flutterwave_session(session_id):
+    checkout_session = _buyer_checkout_session(session_id)
+    if not checkout_session:
+        flash("Access denied", "danger")
+        return redirect(url_for('shop.products'))
+    orders = payable_orders(checkout_session)
+    if not orders:
+        return redirect(url_for('shop.orders'))
+
+    if not current_app.config.get('FLUTTERWAVE_SECRET_KEY'):
+        flash("Flutterwave key not configured.", "danger")
+        return redirect(url_for("payments.checkout_payment_page", session_id=checkout_session.id))
+
+    amount = sum(order.total_amount for order in orders)
+    tx_ref = str(uuid.uuid4())
+    payload = {
+        "tx_ref": tx_ref,
+        "amount": amount,
+        "currency": "NGN",
+        "redirect_url": url_for("payments.verify_flutterwave", _external=True),
+        "customer": {
+            "email": current_user.email,
+            "name": current_user.username
+        },
+        "customizations": {"title": "Abils Mall Payment"}
+    }
+
+    payment = Payment(checkout_session_id=checkout_session.id, amount=amount, provider='flutterwave', reference=tx_ref)
+    db.session.add(payment)
+    db.session.commit()
+
+    headers = {
+        "Authorization": f"Bearer {current_app.config['FLUTTERWAVE_SECRET_KEY']}",
+        "Content-Type": "application/json"
+    }
+
+    res = requests.post("https://api.flutterwave.com/v3/payments", json=payload, headers=headers)
+    response = res.json()
+
+    if response["status"] == "success":
+        return redirect(response["data"]["link"])
+
+    flash("Flutterwave init failed", "danger")
+    return redirect(url_for("payments.checkout_payment_page", session_id=checkout_session.id))
+
+
 @payments_bp.route('/flutterwave/verify')
 @login_required
 def verify_flutterwave():
@@ -177,27 +323,24 @@ def verify_flutterwave():
             flash("Payment record not found.", "danger")
             return redirect(url_for("shop.products"))
 
-        order = Order.query.get(payment.order_id)
-        if not order:
+        orders = payment_orders(payment)
+        if not orders:
             flash("Order not found.", "danger")
             return redirect(url_for("shop.products"))
 
-        order.status = "paid"
         payment.status = "paid"
-        distribute_order_amount(order)
-        db.session.add(CompanyActivity(
-            company_id=order.company_id,
-            action="PAYMENT_SUCCESS",
-            description=f"{current_user.username} paid order #{order.id} via Flutterwave"
-        ))
+        restocked = settle_orders(orders, current_user.username, "Flutterwave")
         db.session.commit()
-        log_activity(current_user.id, "FLUTTERWAVE_PAYMENT", f"Order #{order.id} paid", company_id=order.company_id)
+        stock_changed(restocked)
+        for order in orders:
+            log_activity(current_user.id, "FLUTTERWAVE_PAYMENT", f"Order #{order.id} paid", company_id=order.company_id)
         flash("Flutterwave payment successful", "success")
+        order_refs = ", ".join(f"#{order.id}" for order in orders)
         notify_user(
             current_user,
             "Payment Successful",
-            f"Payment received for order #{order.id}. Amount: ₦{order.total_amount:,.0f}.",
-            f"Payment success for order #{order.id}. Amount: ₦{order.total_amount:,.0f}."
+            f"Payment received for order {order_refs}. Amount: ₦{payment.amount:,.0f}.",
+            f"Payment success for order {order_refs}. Amount: ₦{payment.amount:,.0f}."
         )
         return redirect(url_for("shop.products"))
 
@@ -205,29 +348,23 @@ def verify_flutterwave():
 # =========================================
 # OPAY START (PLACEHOLDER INTEGRATION)
 # =========================================
-@payments_bp.route('/opay/start/<int:order_id>')
-@login_required
-def start_opay(order_id):
-    order = Order.query.get_or_404(order_id)
-    if not current_app.config.get('OPAY_PUBLIC_KEY') or not current_app.config.get('OPAY_SECRET_KEY'):
-        flash("OPay not configured. Add API keys in environment.", "danger")
-        return redirect(url_for("payments.payment_page", order_id=order.id))
-
+def _opay_create(reference, amount, title, return_url):
+    """Open an OPay cashier for ``amount``; returns OPay's JSON response."""
     payload = {
         "amount": {
             "currency": "NGN",
-            "total": int(order.total_amount)
+            "total": int(amount)
         },
         "callbackUrl": current_app.config.get('OPAY_CALLBACK_URL') or url_for('payments.opay_callback', _external=True),
-        "returnUrl": current_app.config.get('OPAY_RETURN_URL') or url_for('payments.payment_page', order_id=order.id, _external=True),
-        "cancelUrl": current_app.config.get('OPAY_CANCEL_URL') or url_for('payments.payment_page', order_id=order.id, _external=True),
+        "returnUrl": current_app.config.get('OPAY_RETURN_URL') or return_url,
+        "cancelUrl": current_app.config.get('OPAY_CANCEL_URL') or return_url,
         "country": "NG",
         "payMethod": current_app.config.get('OPAY_PAY_METHOD', 'BankCard'),
         "product": {
-            "name": f"Order #{order.id}",
+            "name": title,
             "description": "Abils Mall Order"
         },
-        "reference": str(order.id)
+        "reference": reference
     }
 
     payload_json = json.dumps(payload, separators=(',', ':'), sort_keys=True)
@@ -240,7 +377,22 @@ def start_opay(order_id):
 
     api_base = current_app.config.get('OPAY_API_BASE', 'https://testapi.opaycheckout.com')
     res = requests.post(f"{api_base}/api/v1/international/cashier/create", data=payload_json, headers=headers, timeout=30)
-    response = res.json()
+    return res.json()
+
+
+@payments_bp.route('/opay/start/<int:order_id>')
+@login_required
+@idempotent
+def start_opay(order_id):
+    order = Order.query.get_or_404(order_id)
+    if not current_app.config.get('OPAY_PUBLIC_KEY') or not current_app.config.get('OPAY_SECRET_KEY'):
+        flash("OPay not configured. Add API keys in environment.", "danger")
+        return redirect(url_for("payments.payment_page", order_id=order.id))
+
+    response = _opay_create(
+        str(order.id), order.total_amount, f"Order #{order.id}",
+        url_for('payments.payment_page', order_id=order.id, _external=True)
+    )
 
     if response.get("code") == "00000":
         data = response.get("data", {})
@@ -261,11 +413,54 @@ def start_opay(order_id):
     return redirect(url_for("payments.payment_page", order_id=order.id))
 
 
+@payments_bp.route('/opay/checkout/<int:session_id>')
+@login_required
+@idempotent
+def start_opay_session(session_id):
+    checkout_session = _buyer_checkout_session(session_id)
+    if not checkout_session:
+        flash("Access denied", "danger")
+        return redirect(url_for('shop.products'))
+    orders = payable_orders(checkout_session)
+    if not orders:
+        return redirect(url_for('shop.orders'))
+
+    if not current_app.config.get('OPAY_PUBLIC_KEY') or not current_app.config.get('OPAY_SECRET_KEY'):
+        flash("OPay not configured. Add API keys in environment.", "danger")
+        return redirect(url_for("payments.checkout_payment_page", session_id=checkout_session.id))
+
+    amount = sum(order.total_amount for order in orders)
+    # Prefixed so it never collides with the order-id references of single orders.
+    reference = f"checkout-{checkout_session.id}"
+    response = _opay_create(
+        reference, amount, f"Checkout #{checkout_session.id}",
+        url_for('payments.checkout_payment_page', session_id=checkout_session.id, _external=True)
+    )
+
+    if response.get("code") == "00000":
+        data = response.get("data", {})
+        payment = Payment(checkout_session_id=checkout_session.id, amount=amount, provider='opay', reference=reference, status='pending')
+        db.session.add(payment)
+        db.session.commit()
+
+        cashier_url = data.get("cashierUrl")
+        if cashier_url:
+            return redirect(cashier_url)
+
+        qr_code = data.get("nextAction", {}).get("qrCode", "")
+        if qr_code:
+            return render_template("opay_qr.html", orders=orders, amount_due=amount, qr_code=qr_code)
+
+    flash("OPay initialization failed. Please try another method.", "danger")
+    return redirect(url_for("payments.checkout_payment_page", session_id=checkout_session.id))
+
+
 # =========================================
 # BANK TRANSFER (MANUAL VERIFICATION)
 # =========================================
 @payments_bp.route('/bank-transfer/<int:order_id>', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def bank_transfer(order_id):
     order = Order.query.get_or_404(order_id)
     if order.buyer_id != current_user.id:
@@ -303,6 +498,58 @@ def bank_transfer(order_id):
     return render_template("bank_transfer.html", order=order, bank_info=bank_info)
 
 
+@payments_bp.route('/bank-transfer/checkout/<int:session_id>', methods=['GET', 'POST'])
+@login_required
+@idempotent
+def bank_transfer_session(session_id):
+    checkout_session = _buyer_checkout_session(session_id)
+    if not checkout_session:
+        flash("Access denied", "danger")
+        return redirect(url_for('shop.products'))
+    orders = payable_orders(checkout_session)
+    if not orders:
+        return redirect(url_for('shop.orders'))
+
+    if request.method == 'POST':
+        proof = request.files.get('proof')
+        proof_path = ''
+        if proof:
+            filename = f"transfer_s{checkout_session.id}_{uuid.uuid4().hex}.png"
+            upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+            proof.save(upload_path)
+            proof_path = upload_path.replace("\\", "/")
+
+        # One transfer covers every store; admins verify it per order as usual.
+        for order in orders:
+            db.session.add(BankTransfer(
+                order_id=order.id,
+                buyer_id=current_user.id,
+                company_id=order.company_id,
+                amount=order.total_amount,
+                proof_path=proof_path
+            ))
+            order.status = 'pending_verification'
+        sync_checkout_status(orders)
+        db.session.commit()
+        for order in orders:
+            log_activity(current_user.id, "BANK_TRANSFER_SUBMITTED", f"Transfer for order #{order.id} submitted", company_id=order.company_id)
+        flash("Bank transfer submitted. Await admin approval.", "success")
+        return redirect(url_for('shop.orders'))
+
+    bank_info = {
+        "bank": current_app.config['BANK_TRANSFER_BANK'],
+        "account_name": current_app.config['BANK_TRANSFER_ACCOUNT_NAME'],
+        "account_number": current_app.config['BANK_TRANSFER_ACCOUNT_NUMBER']
+    }
+    return render_template(
+        "bank_transfer.html",
+        checkout_session=checkout_session,
+        orders=orders,
+        amount_due=sum(order.total_amount for order in orders),
+        bank_info=bank_info
+    )
+
+
 # =========================================
 # OPAY CALLBACK
 # =========================================
@@ -329,33 +576,53 @@ def opay_callback():
         return "Invalid signature", 400
 
     reference = payload.get("reference")
-    order = None
-    if reference and str(reference).isdigit():
-        order = Order.query.get(int(reference))
-    if not order:
-        order = Order.query.filter_by(payment_reference=reference).first()
+    orders = []
+    payment = None
+    if reference:
+        payment = Payment.query.filter_by(reference=str(reference), provider='opay').order_by(Payment.id.desc()).first()
+    if payment and payment.checkout_session_id:
+        orders = payment_orders(payment)
+    else:
+        order = None
+        if reference and str(reference).isdigit():
+            order = Order.query.get(int(reference))
+        if not order:
+            order = Order.query.filter_by(payment_reference=reference).first()
+        if order:
+            orders = [order]
+            payment = Payment.query.filter_by(order_id=order.id, provider='opay').first()
 
-    if not order:
+    if not orders:
         return "Order not found", 404
 
     if payload.get("status") == "SUCCESS":
-        order.status = "paid"
-        payment = Payment.query.filter_by(order_id=order.id, provider='opay').first()
         if payment:
             payment.status = "paid"
-        distribute_order_amount(order)
+        buyer = orders[0].buyer
+        restocked = settle_orders(orders, buyer.username if buyer else "Buyer", "OPay")
         db.session.commit()
-        log_activity(order.buyer_id, "OPAY_PAYMENT", f"Order #{order.id} paid", company_id=order.company_id)
-        buyer = order.buyer
+        stock_changed(restocked)
+        for order in orders:
+            log_activity(order.buyer_id, "OPAY_PAYMENT", f"Order #{order.id} paid", company_id=order.company_id)
         if buyer:
+            order_refs = ", ".join(f"#{order.id}" for order in orders)
+            amount = sum(order.total_amount for order in orders)
             notify_user(
                 buyer,
                 "Payment Successful",
-                f"OPay payment received for order #{order.id}. Amount: ₦{order.total_amount:,.0f}.",
-                f"OPay payment success for order #{order.id}. Amount: ₦{order.total_amount:,.0f}."
+                f"OPay payment received for order {order_refs}. Amount: ₦{amount:,.0f}.",
+                f"OPay payment success for order {order_refs}. Amount: ₦{amount:,.0f}."
             )
         return "OK", 200
 
+    if payload.get("status") in ("FAIL", "CLOSE") and any(order.status == "pending" for order in orders):
+        if payment:
+            payment.status = "failed"
+        restocked = fail_orders(orders)
+        db.session.commit()
+        stock_changed(restocked)
+        return "OK", 200
+
     return "Ignored", 200
 
 
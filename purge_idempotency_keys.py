@@ -0,0 +1,14 @@
+from app import create_app
+from idempotency import purge_expired_keys
+
+
+def main():
+    """Delete idempotency keys past IDEMPOTENCY_KEY_TTL_HOURS; run from cron."""
+    app = create_app()
+    with app.app_context():
+        deleted = purge_expired_keys()
+        print(f"Deleted {deleted} expired idempotency keys.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+from app import create_app
+from extensions import db
+from sales import rebuild_daily_sales
+
+
+def main():
+    """Recompute the daily_company_sales rollup from orders and payouts."""
+    app = create_app()
+    with app.app_context():
+        rows = rebuild_daily_sales()
+        db.session.commit()
+        print(f"Rebuilt {rows} daily company sales rows.")
+
+
+if __name__ == "__main__":
+    main()
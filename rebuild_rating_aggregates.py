@@ -0,0 +1,54 @@
+from sqlalchemy import case, func
+
+from app import create_app
+from extensions import db
+from models import Product, ProductReview
+from catalog import bump_catalog_version
+
+
+def main():
+    """Recompute every product's rating sum, count, average and star histogram from its reviews."""
+    app = create_app()
+    with app.app_context():
+        star_columns = [
+            func.sum(case((ProductReview.rating == stars, 1), else_=0)) for stars in range(1, 6)
+        ]
+        rows = db.session.query(
+            ProductReview.product_id,
+            func.count(ProductReview.id),
+            func.sum(ProductReview.rating),
+            *star_columns
+        ).group_by(ProductReview.product_id).all()
+
+        updates = []
+        for product_id, count, total, *stars in rows:
+            mapping = {
+                "id": product_id,
+                "rating_count": count,
+                "rating_sum": total,
+                "rating_avg": round(total / count, 1),
+            }
+            for index, star_count in enumerate(stars, start=1):
+                mapping[f"rating_{index}_count"] = star_count
+            updates.append(mapping)
+
+        # Products whose reviews were all deleted still carry old aggregates.
+        stale = Product.query.with_entities(Product.id).filter(
+            Product.rating_count > 0,
+            ~Product.reviews.any()
+        ).all()
+        for (product_id,) in stale:
+            mapping = {"id": product_id, "rating_count": 0, "rating_sum": 0, "rating_avg": 4.0}
+            for index in range(1, 6):
+                mapping[f"rating_{index}_count"] = 0
+            updates.append(mapping)
+
+        db.session.bulk_update_mappings(Product, updates)
+        if updates:
+            bump_catalog_version()
+        db.session.commit()
+        print(f"Rebuilt rating aggregates for {len(updates)} products.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+from app import create_app
+from inventory import release_expired_reservations
+
+
+def main():
+    """Return stock held by unpaid orders past STOCK_RESERVATION_MINUTES; run from cron."""
+    app = create_app()
+    with app.app_context():
+        released = release_expired_reservations()
+        print(f"Released stock for {released} expired orders.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from io import BytesIO
+
+from flask import send_file
+
+from extensions import db
+from models import DailyReport
+from blobstore import blob_store
+
+
+def store_report_pdf(report, stream, mimetype):
+    """Stream an uploaded PDF into the blob store and point ``report`` at it.
+
+    Without a durable blob store the PDF stays in ``pdf_data``. Returns
+    False, storing nothing, when the upload is empty.
+    """
+    if not stream.read(1):
+        return False
+    stream.seek(0)
+    if blob_store.durable:
+        report.pdf_blob_key, report.pdf_size = blob_store.put(stream)
+    else:
+        report.pdf_data = stream.read()
+        report.pdf_size = len(report.pdf_data)
+    report.pdf_mimetype = mimetype or "application/pdf"
+    return True
+
+
+def commit_report_pdf(report, stream):
+    """Commit the session once ``report``'s blob is certain to exist.
+
+    ``put`` may have matched an existing blob that ``release_report_blobs``
+    deletes before this row is visible; re-checking under the store lock
+    and writing it again from ``stream`` closes that window.
+    """
+    if not report.pdf_blob_key:
+        db.session.commit()
+        return
+    with blob_store.lock():
+        if not blob_store.exists(report.pdf_blob_key):
+            stream.seek(0)
+            blob_store.put(stream)
+        db.session.commit()
+
+
+def report_pdf_response(report):
+    """Download response for a report's PDF, or None when it has none."""
+    download_name = report.pdf_filename or "daily_report.pdf"
+    mimetype = report.pdf_mimetype or "application/pdf"
+    if report.pdf_blob_key and blob_store.exists(report.pdf_blob_key):
+        return blob_store.response(report.pdf_blob_key, download_name, mimetype)
+    if report.pdf_data:
+        # Not migrated yet, or no durable blob store configured.
+        return send_file(BytesIO(report.pdf_data), as_attachment=True, download_name=download_name, mimetype=mimetype)
+    return None
+
+
+def release_report_blobs(keys):
+    """Delete the blobs in ``keys`` that no report points at any more; call after committing."""
+    keys = {key for key in keys if key}
+    if not keys:
+        return
+    # Under the lock an upload that reuses one of these blobs has either
+    # committed its row already or will write the blob again before it does.
+    with blob_store.lock():
+        still_used = {
+            key for (key,) in db.session.query(DailyReport.pdf_blob_key).filter(DailyReport.pdf_blob_key.in_(keys)).distinct()
+        }
+        for key in keys - still_used:
+            blob_store.delete(key)
@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+from extensions import db
+from models import Company, User
+from cache import LRUCache
+
+
+class NameResolver:
+    """Map ids to display values for the rows actually on a page.
+
+    Ids missing from the process-wide LRU are fetched in one ``IN`` query,
+    so labelling a page costs one small query at most however many rows the
+    table holds. With one column the values are plain; with several they
+    are namedtuples. Callers ``forget`` an id after committing a rename or
+    delete; other processes catch up within the TTL.
+    """
+
+    def __init__(self, model, *columns, maxsize=10000, ttl=300):
+        self.model = model
+        self.columns = columns
+        self._row = namedtuple(f"{model.__name__}Label", columns) if len(columns) > 1 else None
+        self._values = LRUCache(maxsize, ttl=ttl)
+
+    def init_app(self, app):
+        self._values.maxsize = app.config.get('NAME_CACHE_MAX_ENTRIES', 10000)
+        self._values.ttl = app.config.get('NAME_CACHE_TTL', 300)
+
+    def lookup(self, ids):
+        """``{id: value}`` for each known id in ``ids``; None and unknown ids are left out."""
+        found = {}
+        missing = set()
+        for row_id in ids:
+            if row_id is None or row_id in found:
+                continue
+            value = self._values.get(row_id)
+            if value is None:
+                missing.add(row_id)
+            else:
+                found[row_id] = value
+        if missing:
+            id_column = self.model.id
+            rows = db.session.query(id_column, *[getattr(self.model, column) for column in self.columns]).filter(
+                id_column.in_(missing)
+            )
+            for row_id, *values in rows:
+                value = self._row(*values) if self._row else values[0]
+                self._values.set(row_id, value)
+                found[row_id] = value
+        return found
+
+    def forget(self, row_id):
+        self._values.pop(row_id)
+
+    def clear(self):
+        self._values.clear()
+
+
+user_names = NameResolver(User, 'username')
+user_contacts = NameResolver(User, 'username', 'email')
+company_names = NameResolver(Company, 'name')
+
+
+def forget_user(user_id):
+    """Drop a renamed or deleted user from every user resolver."""
+    user_names.forget(user_id)
+    user_contacts.forget(user_id)
@@ -0,0 +1,152 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from models import DailyCompanySales, Order, PayoutRequest
+
+ROLLUP_COLUMNS = (
+    'order_count', 'gmv', 'shipping_total', 'discount_total', 'paid_count', 'paid_amount', 'payout_total'
+)
+UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _day(moment):
+    return (moment or datetime.utcnow()).date()
+
+
+def add_to_rollup(company_id, day, **deltas):
+    """Add ``deltas`` to one company's totals for ``day`` in the caller's transaction."""
+    if company_id is None:
+        return
+    table = DailyCompanySales.__table__
+    values = dict(dict.fromkeys(ROLLUP_COLUMNS, 0), **deltas)
+    insert = UPSERT_DIALECTS.get(db.engine.dialect.name)
+    if insert is not None:
+        statement = insert(table).values(company_id=company_id, day=day, **values)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.company_id, table.c.day],
+            set_={column: table.c[column] + statement.excluded[column] for column in deltas}
+        ))
+        return
+    updated = db.session.execute(
+        table.update()
+        .where(table.c.company_id == company_id, table.c.day == day)
+        .values({column: table.c[column] + amount for column, amount in deltas.items()})
+    ).rowcount
+    if not updated:
+        db.session.execute(table.insert().values(company_id=company_id, day=day, **values))
+
+
+def record_order_placed(order):
+    """Count a newly placed (and flushed) order."""
+    add_to_rollup(
+        order.company_id, _day(order.created_at),
+        order_count=1,
+        gmv=order.total_amount or 0.0,
+        shipping_total=order.shipping_fee or 0.0,
+        discount_total=order.discount_amount or 0.0,
+    )
+
+
+def record_order_paid(order):
+    """Count an order's payment against the day the order was placed."""
+    add_to_rollup(order.company_id, _day(order.created_at), paid_count=1, paid_amount=order.total_amount or 0.0)
+
+
+def record_payout(payout):
+    """Count an approved payout against the day it was requested."""
+    add_to_rollup(payout.company_id, _day(payout.created_at), payout_total=payout.amount or 0.0)
+
+
+def daily_sales(start, end=None, company_id=None):
+    """Totals per day from ``start`` to ``end`` inclusive, summed over companies unless one is given.
+
+    Returns ``(day, order_count, gmv, shipping_total, discount_total,
+    paid_count, paid_amount, payout_total)`` rows, oldest first; days
+    without sales are left out.
+    """
+    query = db.session.query(
+        DailyCompanySales.day,
+        *[func.sum(getattr(DailyCompanySales, column)).label(column) for column in ROLLUP_COLUMNS]
+    ).filter(DailyCompanySales.day >= start)
+    if end is not None:
+        query = query.filter(DailyCompanySales.day <= end)
+    if company_id is not None:
+        query = query.filter(DailyCompanySales.company_id == company_id)
+    return query.group_by(DailyCompanySales.day).order_by(DailyCompanySales.day).all()
+
+
+def company_sales(start, end=None):
+    """Totals per company over ``start`` to ``end`` inclusive, largest GMV first."""
+    query = db.session.query(
+        DailyCompanySales.company_id,
+        *[func.sum(getattr(DailyCompanySales, column)).label(column) for column in ROLLUP_COLUMNS]
+    ).filter(DailyCompanySales.day >= start)
+    if end is not None:
+        query = query.filter(DailyCompanySales.day <= end)
+    return query.group_by(DailyCompanySales.company_id).order_by(func.sum(DailyCompanySales.gmv).desc()).all()
+
+
+def summary_line(row):
+    """One statement line for a ``daily_sales``/``company_sales`` row."""
+    return (
+        f"{row.order_count} orders - GMV ₦{row.gmv:,.0f} - paid ₦{row.paid_amount:,.0f} ({row.paid_count}) - "
+        f"shipping ₦{row.shipping_total:,.0f} - discounts ₦{row.discount_total:,.0f} - payouts ₦{row.payout_total:,.0f}"
+    )
+
+
+def recent_days(days, today=None):
+    """The first day of a ``days``-long window ending today."""
+    return (today or datetime.utcnow().date()) - timedelta(days=days - 1)
+
+
+def _as_date(value):
+    # SQLite's date() returns text; Postgres returns a date.
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def rebuild_daily_sales():
+    """Recompute the whole rollup from orders and payouts; returns the number of rows written.
+
+    Runs in the caller's transaction. Orders placed or paid while it runs
+    may be missed, so run it when the shop is quiet.
+    """
+    totals = {}
+
+    def add(company_id, day, **values):
+        if company_id is None or day is None:
+            return
+        row = totals.setdefault((company_id, _as_date(day)), dict.fromkeys(ROLLUP_COLUMNS, 0))
+        row.update(values)
+
+    order_day = func.date(Order.created_at)
+    placed = db.session.query(
+        Order.company_id, order_day,
+        func.count(Order.id),
+        func.coalesce(func.sum(Order.total_amount), 0.0),
+        func.coalesce(func.sum(Order.shipping_fee), 0.0),
+        func.coalesce(func.sum(Order.discount_amount), 0.0),
+    ).group_by(Order.company_id, order_day)
+    for company_id, day, count, gmv, shipping, discount in placed:
+        add(company_id, day, order_count=count, gmv=gmv, shipping_total=shipping, discount_total=discount)
+
+    paid = db.session.query(
+        Order.company_id, order_day, func.count(Order.id), func.coalesce(func.sum(Order.total_amount), 0.0)
+    ).filter(Order.status == 'paid').group_by(Order.company_id, order_day)
+    for company_id, day, count, amount in paid:
+        add(company_id, day, paid_count=count, paid_amount=amount)
+
+    payout_day = func.date(PayoutRequest.created_at)
+    payouts = db.session.query(
+        PayoutRequest.company_id, payout_day, func.coalesce(func.sum(PayoutRequest.amount), 0.0)
+    ).filter(PayoutRequest.status == 'approved').group_by(PayoutRequest.company_id, payout_day)
+    for company_id, day, amount in payouts:
+        add(company_id, day, payout_total=amount)
+
+    DailyCompanySales.query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(DailyCompanySales, [
+        dict(values, company_id=company_id, day=day) for (company_id, day), values in totals.items()
+    ])
+    return len(totals)
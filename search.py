@@ -0,0 +1,145 @@
+import re
+from flask import current_app
+from sqlalchemy import column, select, table, text
+from sqlalchemy.exc import OperationalError
+
+from extensions import db
+from models import Product
+
+SEARCH_TABLE = "product_search"
+SEARCH_MAX_TERMS = 8
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+SEARCH_INDEX = table(SEARCH_TABLE, column("rowid"))
+
+# The Postgres index and the ranking query must use the exact same expression,
+# otherwise the planner cannot use the GIN index. Queries qualify the columns
+# (``table='product.'``) since the company name is joined in; that does not
+# change the expression.
+PG_DOCUMENT = "to_tsvector('simple', coalesce({table}name, '') || ' ' || coalesce({table}description, ''))"
+PG_RANKED_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce({table}name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce({table}description, '')), 'B')"
+)
+
+
+def ensure_search_index():
+    """Create the product full-text index for the active database and backfill it."""
+    dialect = db.engine.dialect.name
+    backend = "like"
+    try:
+        with db.engine.begin() as conn:
+            if dialect == "sqlite":
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                    "USING fts5(name, description, tokenize='unicode61 remove_diacritics 2')"
+                ))
+                conn.execute(text(
+                    f"INSERT INTO {SEARCH_TABLE}(rowid, name, description) "
+                    "SELECT id, name, coalesce(description, '') FROM product "
+                    f"WHERE id NOT IN (SELECT rowid FROM {SEARCH_TABLE})"
+                ))
+                backend = "fts5"
+            elif dialect == "postgresql":
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_product_search ON product USING GIN ({PG_DOCUMENT.format(table='')})"
+                ))
+                backend = "tsvector"
+    except OperationalError:
+        # SQLite builds without FTS5 keep working with the LIKE fallback.
+        backend = "like"
+    current_app.config['PRODUCT_SEARCH_BACKEND'] = backend
+    return backend
+
+
+def _backend():
+    return current_app.config.get('PRODUCT_SEARCH_BACKEND', 'like')
+
+
+def _search_terms(query):
+    return TOKEN_RE.findall((query or "").lower())[:SEARCH_MAX_TERMS]
+
+
+def index_product(product):
+    """Refresh the index row for a product inside the caller's transaction."""
+    if _backend() != "fts5" or product.id is None:
+        return
+    db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {"id": product.id})
+    db.session.execute(
+        text(f"INSERT INTO {SEARCH_TABLE}(rowid, name, description) VALUES (:id, :name, :description)"),
+        {"id": product.id, "name": product.name or "", "description": product.description or ""}
+    )
+
+
+def remove_product(product_id):
+    if _backend() != "fts5":
+        return
+    db.session.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {"id": product_id})
+
+
+def _fts_match(terms):
+    # Every term must match, each as a prefix so results follow the buyer
+    # while they type.
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def _tsquery(terms):
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def _like_condition(terms):
+    like = f"%{' '.join(terms)}%"
+    return Product.name.ilike(like) | Product.description.ilike(like)
+
+
+def match_condition(query):
+    """A filter for products matching ``query``, for counting facets; None without terms."""
+    terms = _search_terms(query)
+    if not terms:
+        return None
+    backend = _backend()
+    if backend == "fts5":
+        return Product.id.in_(
+            select(SEARCH_INDEX.c.rowid).where(
+                text(f"{SEARCH_TABLE} MATCH :match").bindparams(match=_fts_match(terms))
+            )
+        )
+    if backend == "tsvector":
+        return text(
+            f"{PG_DOCUMENT.format(table='product.')} @@ to_tsquery('simple', :tsquery)"
+        ).bindparams(tsquery=_tsquery(terms))
+    return _like_condition(terms)
+
+
+def search_products(query, limit=None, base_query=None):
+    """Return products matching ``query`` ordered by relevance.
+
+    ``base_query`` carries the storefront filters; they are applied in the
+    ranked query itself, so the limit counts only products that pass them.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    limit = limit or current_app.config.get('SEARCH_RESULT_LIMIT', 50)
+    base_query = base_query if base_query is not None else Product.query
+    backend = _backend()
+
+    if backend == "fts5":
+        # Name hits outrank description hits.
+        ranked = base_query.join(
+            SEARCH_INDEX, SEARCH_INDEX.c.rowid == Product.id
+        ).filter(
+            text(f"{SEARCH_TABLE} MATCH :match")
+        ).order_by(
+            text(f"bm25({SEARCH_TABLE}, 10.0, 1.0)")
+        ).params(match=_fts_match(terms))
+    elif backend == "tsvector":
+        ranked = base_query.filter(
+            text(f"{PG_DOCUMENT.format(table='product.')} @@ to_tsquery('simple', :tsquery)")
+        ).order_by(
+            text(f"ts_rank({PG_RANKED_DOCUMENT.format(table='product.')}, to_tsquery('simple', :tsquery)) DESC"),
+            Product.id.desc()
+        ).params(tsquery=_tsquery(terms))
+    else:
+        ranked = base_query.filter(_like_condition(terms)).order_by(Product.created_at.desc())
+    return ranked.limit(limit).all()
@@ -0,0 +1,209 @@
+import math
+import time
+from collections import namedtuple
+
+from extensions import db
+from models import ShippingRate
+from cache import LRUCache
+
+EARTH_RADIUS_KM = 6371.0
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+Quote = namedtuple("Quote", "distance_km fee")
+RateTier = namedtuple("RateTier", "max_weight_grams max_distance_km base_fee rate_per_gram rate_per_km")
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres."""
+    d_lat = math.radians(lat2 - lat1)
+    d_lng = math.radians(lng2 - lng1)
+    a = (math.sin(d_lat / 2) ** 2
+         + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng / 2) ** 2)
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def distances_km(origins, lat, lng):
+    """Haversine distance from each ``(lat, lng)`` origin to one destination.
+
+    The destination's terms are worked out once for the whole batch.
+    """
+    lat2 = math.radians(lat)
+    cos_lat2 = math.cos(lat2)
+    distances = []
+    for origin_lat, origin_lng in origins:
+        lat1 = math.radians(origin_lat)
+        a = (math.sin((lat2 - lat1) / 2) ** 2
+             + math.cos(lat1) * cos_lat2 * math.sin(math.radians(lng - origin_lng) / 2) ** 2)
+        distances.append(EARTH_RADIUS_KM * 2 * math.asin(math.sqrt(min(a, 1.0))))
+    return distances
+
+
+def geohash_cell(lat, lng, precision):
+    """Geohash of a point, plus the centre of the cell it names."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = bit_count = 0
+    use_lng = True
+    while len(chars) < precision:
+        span, value = (lng_range, lng) if use_lng else (lat_range, lat)
+        mid = (span[0] + span[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            span[0] = mid
+        else:
+            bits = bits * 2
+            span[1] = mid
+        use_lng = not use_lng
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = bit_count = 0
+    return "".join(chars), sum(lat_range) / 2, sum(lng_range) / 2
+
+
+def weight_band(weight_grams, band_grams):
+    """Round a weight up to the next multiple of ``band_grams``."""
+    weight_grams = int(math.ceil(weight_grams or 0))
+    if band_grams <= 1:
+        return weight_grams
+    return -(-weight_grams // band_grams) * band_grams
+
+
+class DeliveryPointRequired(Exception):
+    """A store with a pickup point can only be priced from a pinned delivery point."""
+
+    def __init__(self, company_id):
+        super().__init__(f"Company {company_id} needs a delivery point to price shipping")
+        self.company_id = company_id
+
+
+def pickup_point(company):
+    if company is None or company.pickup_lat is None or company.pickup_lng is None:
+        return None
+    return company.pickup_lat, company.pickup_lng
+
+
+def _tier_order(tier):
+    return (
+        tier.max_weight_grams if tier.max_weight_grams is not None else math.inf,
+        tier.max_distance_km if tier.max_distance_km is not None else math.inf,
+    )
+
+
+class ShippingQuotes:
+    """Price shipments from the ShippingRate table, caching quotes.
+
+    Quotes for a company with a pickup point are priced from the centre of
+    the delivery point's geohash cell and the shipment's weight band, so every
+    buyer in the same cell with a similar cart shares one cached quote, and
+    the quote endpoint and checkout always agree on the fee. Without rate
+    tiers (or when none fits) the flat ``SHIPPING_RATE_PER_*`` rates apply.
+    """
+
+    def __init__(self, maxsize=4096, ttl=600):
+        self.flat_rate = RateTier(None, None, 0.0, 0.5, 10.0)
+        self.geohash_precision = 7
+        self.weight_band_grams = 100
+        self.rates_ttl = 60
+        self._quotes = LRUCache(maxsize, ttl=ttl)
+        self._tiers = None
+        self._tiers_loaded_at = 0.0
+        self._generation = 0
+
+    def init_app(self, app):
+        self.flat_rate = RateTier(
+            None, None, 0.0,
+            app.config.get('SHIPPING_RATE_PER_GRAM', 0.5),
+            app.config.get('SHIPPING_RATE_PER_KM', 10.0),
+        )
+        self.geohash_precision = app.config.get('SHIPPING_GEOHASH_PRECISION', 7)
+        self.weight_band_grams = app.config.get('SHIPPING_WEIGHT_BAND_GRAMS', 100)
+        self.rates_ttl = app.config.get('SHIPPING_RATES_TTL', 60)
+        self._quotes.maxsize = app.config.get('SHIPPING_QUOTE_CACHE_MAX_ENTRIES', 4096)
+        self._quotes.ttl = app.config.get('SHIPPING_QUOTE_CACHE_TTL', 600)
+
+    def tiers(self):
+        """Rate tiers, tightest first, re-read from the database every ``rates_ttl`` seconds."""
+        now = time.monotonic()
+        if self._tiers is not None and now - self._tiers_loaded_at < self.rates_ttl:
+            return self._tiers
+        rows = db.session.query(
+            ShippingRate.max_weight_grams, ShippingRate.max_distance_km, ShippingRate.base_fee,
+            ShippingRate.rate_per_gram, ShippingRate.rate_per_km
+        ).all()
+        tiers = sorted((RateTier(*row) for row in rows), key=_tier_order)
+        if tiers != self._tiers:
+            # Quotes are keyed by generation, so ones priced from old rates are never served.
+            self._generation += 1
+            self._quotes.clear()
+        self._tiers = tiers
+        self._tiers_loaded_at = now
+        return tiers
+
+    def rates_changed(self):
+        """Reload the rate table on the next quote."""
+        self._tiers = None
+
+    def _rate_for(self, tiers, weight_grams, distance_km):
+        for tier in tiers:
+            if tier.max_weight_grams is not None and weight_grams > tier.max_weight_grams:
+                continue
+            if tier.max_distance_km is not None and distance_km > tier.max_distance_km:
+                continue
+            return tier
+        return self.flat_rate
+
+    def price(self, weight_grams, distance_km, tiers=None):
+        if tiers is None:
+            tiers = self.tiers()
+        distance_km = round(distance_km, 2)
+        tier = self._rate_for(tiers, weight_grams, distance_km)
+        fee = tier.base_fee + weight_grams * tier.rate_per_gram + distance_km * tier.rate_per_km
+        return Quote(distance_km, round(fee, 2))
+
+    def quote_many(self, shipments, lat, lng, fallback_km=0.0):
+        """Quote ``(company, weight_grams)`` shipments to one delivery point.
+
+        Only shipments from a store without a pickup point are priced at
+        ``fallback_km``, the buyer's typed distance, and are not cached. A
+        store with a pickup point is always measured, so without a delivery
+        point this raises DeliveryPointRequired.
+        """
+        tiers = self.tiers()
+        quotes = [None] * len(shipments)
+        cell = None
+        if lat is not None and lng is not None:
+            cell, cell_lat, cell_lng = geohash_cell(lat, lng, self.geohash_precision)
+
+        misses = []
+        for index, (company, weight_grams) in enumerate(shipments):
+            weight_grams = weight_band(weight_grams, self.weight_band_grams)
+            origin = pickup_point(company)
+            if origin is None:
+                quotes[index] = self.price(weight_grams, fallback_km, tiers)
+                continue
+            if cell is None:
+                raise DeliveryPointRequired(company.id)
+            # The pickup point is part of the key, so moving it needs no invalidation.
+            key = (self._generation, origin, cell, weight_grams)
+            quotes[index] = self._quotes.get(key)
+            if quotes[index] is None:
+                misses.append((index, key))
+
+        if misses:
+            distances = distances_km([key[1] for _, key in misses], cell_lat, cell_lng)
+            for (index, key), distance_km in zip(misses, distances):
+                quotes[index] = self.price(key[3], distance_km, tiers)
+                self._quotes.set(key, quotes[index])
+        return quotes
+
+    def quote(self, company, lat, lng, weight_grams, fallback_km=0.0):
+        return self.quote_many([(company, weight_grams)], lat, lng, fallback_km)[0]
+
+    def clear(self):
+        self._quotes.clear()
+        self._tiers = None
+
+
+shipping_quotes = ShippingQuotes()
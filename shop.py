@@ -1,13 +1,20 @@
 # shop.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
-import os
 from sqlalchemy import func
 
 from extensions import db
-from models import Product, ProductReview, CartItem, Order, OrderItem, CompanyActivity, DiscountCustomer, DiscountRequest, WalletTransaction, User, ActivityLog, ReferralWallet, ManagerAccountRequest
+from models import Product, ProductReview, CartItem, Order, DiscountRequest, WalletTransaction, User, ActivityLog, ReferralWallet, ManagerAccountRequest
 from notifications import notify_user, send_email
-from activity import log_activity
+from activity import log_activity, record_company_activity
+from cart import load_cart
+from inventory import OutOfStock, stock_changed
+from checkout import place_orders, quote_shipping, delivery_point, manual_distance_km
+from shipping import DeliveryPointRequired
+from idempotency import idempotent
+from catalog import catalog_query, catalog_page_size, product_listing, product_detail_query, page_tags, product_changed, bump_catalog_version, record_rating, parse_filters, apply_filters, filter_args, facet_counts
+from cache import page_cache
+from pagination import decode_cursor
 
 shop_bp = Blueprint('shop', __name__, template_folder='templates', url_prefix='/shop')
 
@@ -54,14 +61,47 @@ def dashboard():
 # =========================================
 @shop_bp.route('/products')
 def products():
-    all_products = Product.query.order_by(Product.created_at.desc()).all()
-    return render_template('shop_products.html', products=all_products)
+    cached = page_cache.lookup()
+    if cached is not None:
+        return cached
+
+    cursor = request.args.get('cursor')
+    head = decode_cursor(cursor) is None
+    filters = parse_filters(request.args)
+    page_size = catalog_page_size()
+    page_products, next_cursor = product_listing(cursor, page_size, base_query=apply_filters(catalog_query(), filters))
+    html = render_template(
+        'shop_products.html',
+        products=page_products,
+        next_cursor=next_cursor,
+        per_page=page_size,
+        filters=filters,
+        filter_args=filter_args(filters),
+        facets=facet_counts(filters) if head else None
+    )
+    return page_cache.store(html, page_tags(page_products, head=head))
+
+
+@shop_bp.route('/products/feed')
+def products_feed():
+    filters = parse_filters(request.args)
+    page_products, next_cursor = product_listing(
+        request.args.get('cursor'),
+        base_query=apply_filters(catalog_query(), filters)
+    )
+    html = render_template('shop_product_cards.html', products=page_products)
+    return jsonify({"html": html, "next_cursor": next_cursor})
 
 
 @shop_bp.route('/products/<int:product_id>')
 def product_detail(product_id):
-    product = Product.query.get_or_404(product_id)
-    return render_template('shop_product_detail.html', product=product)
+    cached = page_cache.lookup()
+    if cached is not None:
+        return cached
+
+    product = product_detail_query().filter(Product.id == product_id).first_or_404()
+    html = render_template('shop_product_detail.html', product=product)
+    return page_cache.store(html, page_tags([product]))
 
 
 # =========================================
@@ -80,11 +120,11 @@ def add_to_cart(product_id):
         cart_item = CartItem(user_id=current_user.id, product_id=product_id, quantity=quantity)
         db.session.add(cart_item)
 
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=product.company_id,
         action='CART_ADD',
         description=f'User {current_user.username} added {quantity} x {product.name} to cart'
-    ))
+    )
 
     db.session.commit()
     flash(f'Added {quantity} x "{product.name}" to cart.', 'success')
@@ -97,14 +137,13 @@ def add_to_cart(product_id):
 @shop_bp.route('/cart')
 @login_required
 def cart():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    subtotal = sum((item.product.sale_price or item.product.price) * item.quantity for item in cart_items)
+    summary = load_cart(current_user.id)
     shipping_fee = 0.0
-    total = subtotal + shipping_fee
+    total = summary.subtotal + shipping_fee
     return render_template(
         'shop_cart.html',
-        cart_items=cart_items,
-        subtotal=subtotal,
+        cart_items=summary.lines,
+        subtotal=summary.subtotal,
         shipping_fee=shipping_fee,
         total=total
     )
@@ -145,11 +184,11 @@ def remove_from_cart(item_id):
         return redirect(url_for('shop.cart'))
 
     db.session.delete(cart_item)
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=cart_item.product.company_id,
         action='CART_REMOVE',
         description=f'User {current_user.username} removed {cart_item.product.name} from cart'
-    ))
+    )
 
     db.session.commit()
     flash('Item removed from cart.', 'info')
@@ -161,100 +200,82 @@ def remove_from_cart(item_id):
 # =========================================
 @shop_bp.route('/checkout', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def checkout():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    if not cart_items:
+    summary = load_cart(current_user.id)
+    if not summary:
         flash('Your cart is empty.', 'warning')
         return redirect(url_for('shop.products'))
 
     if request.method == 'POST':
-        company_id = cart_items[0].product.company_id
-        if any(item.product.company_id != company_id for item in cart_items):
-            flash('Please checkout items from one company at a time.', 'danger')
+        try:
+            checkout_session, orders = place_orders(current_user, summary, request.form)
+        except OutOfStock as exc:
+            db.session.rollback()
+            product = Product.query.get(exc.product_id)
+            name = product.name if product else 'An item'
+            available = product.stock if product else 0
+            flash(f'{name} only has {available} left in stock. Please update your cart.', 'danger')
             return redirect(url_for('shop.cart'))
-
-        subtotal = sum((item.product.sale_price or item.product.price) * item.quantity for item in cart_items)
-        total_weight_grams = sum((item.product.weight_grams or 0) * item.quantity for item in cart_items)
-        distance_km = float(request.form.get('distance_km', 0) or 0)
-        rate_per_gram = float(os.getenv("SHIPPING_RATE_PER_GRAM", "0.5") or 0.5)
-        rate_per_km = float(os.getenv("SHIPPING_RATE_PER_KM", "10") or 10)
-        shipping_fee = (total_weight_grams * rate_per_gram) + (distance_km * rate_per_km)
-        discount = 0.0
-        discount_customer = DiscountCustomer.query.filter_by(
-            buyer_id=current_user.id,
-            company_id=company_id,
-            approved=True
-        ).first()
-        if discount_customer and discount_customer.discount_rate:
-            discount = subtotal * (discount_customer.discount_rate / 100.0)
-
-        total_amount = max(subtotal - discount, 0) + shipping_fee
-        order = Order(
-            buyer_id=current_user.id,
-            company_id=company_id,
-            total_amount=total_amount,
-            delivery_country=request.form.get('country', '').strip(),
-            delivery_state=request.form.get('state', '').strip(),
-            delivery_area=request.form.get('area', '').strip(),
-            delivery_bus_stop=request.form.get('bus_stop', '').strip(),
-            delivery_address=request.form.get('address', '').strip(),
-            delivery_phone=request.form.get('delivery_phone', '').strip(),
-            delivery_map_url=request.form.get('map_url', '').strip(),
-            delivery_distance_km=distance_km,
-            shipping_fee=shipping_fee,
-            total_weight_grams=total_weight_grams
-        )
-        db.session.add(order)
-        db.session.commit()
-
-        for item in cart_items:
-            item_price = item.product.sale_price or item.product.price
-            order_item = OrderItem(order_id=order.id, product_id=item.product.id,
-                                   quantity=item.quantity, price=item_price)
-            db.session.add(order_item)
-            db.session.delete(item)  # Remove item from cart
-
-        db.session.add(CompanyActivity(
-            company_id=order.company_id,
-            action='ORDER_PLACED',
-            description=f'User {current_user.username} placed order #{order.id}'
-        ))
+        except DeliveryPointRequired:
+            db.session.rollback()
+            flash('Please pin your delivery location on the map so shipping can be priced.', 'danger')
+            return redirect(url_for('shop.checkout'))
 
         db.session.commit()
+        stock_changed(line.product_id for line in summary.lines)
+        order_refs = ", ".join(f"#{order.id}" for order in orders)
+        for order in orders:
+            log_activity(current_user.id, "ORDER_PLACED", f"Order #{order.id} placed", company_id=order.company_id)
         flash('Order placed successfully! Proceed to payment.', 'success')
-        log_activity(current_user.id, "ORDER_PLACED", f"Order #{order.id} placed", company_id=order.company_id)
         notify_user(
             current_user,
             "Order Placed",
-            f"Your order #{order.id} was placed successfully. Total: ₦{order.total_amount:,.0f}.",
-            f"Order #{order.id} placed. Total: ₦{order.total_amount:,.0f}."
+            f"Your order {order_refs} was placed successfully. Total: ₦{checkout_session.total_amount:,.0f}.",
+            f"Order {order_refs} placed. Total: ₦{checkout_session.total_amount:,.0f}."
         )
-        return redirect(url_for('payments.payment_page', order_id=order.id))
+        if len(orders) == 1:
+            return redirect(url_for('payments.payment_page', order_id=orders[0].id))
+        return redirect(url_for('payments.checkout_payment_page', session_id=checkout_session.id))
 
-    subtotal = sum((item.product.sale_price or item.product.price) * item.quantity for item in cart_items)
-    total_weight_grams = sum((item.product.weight_grams or 0) * item.quantity for item in cart_items)
-    rate_per_gram = float(os.getenv("SHIPPING_RATE_PER_GRAM", "0.5") or 0.5)
-    rate_per_km = float(os.getenv("SHIPPING_RATE_PER_KM", "10") or 10)
     shipping_fee = 0.0
-    total = subtotal + shipping_fee
-    company = cart_items[0].product.company if cart_items else None
-    store_lat = company.pickup_lat if company and company.pickup_lat is not None else 0
-    store_lng = company.pickup_lng if company and company.pickup_lng is not None else 0
+    total = summary.subtotal + shipping_fee
+    groups = list(summary.groups.values())
+    company = groups[0].company if len(groups) == 1 else None
     return render_template(
         'checkout.html',
-        cart_items=cart_items,
-        subtotal=subtotal,
+        cart_items=summary.lines,
+        groups=groups,
+        subtotal=summary.subtotal,
         shipping_fee=shipping_fee,
         total=total,
-        total_weight_grams=total_weight_grams,
-        rate_per_gram=rate_per_gram,
-        rate_per_km=rate_per_km,
-        store_lat=store_lat,
-        store_lng=store_lng,
+        total_weight_grams=summary.total_weight_grams,
         company=company
     )
 
 
+@shop_bp.route('/shipping/quote')
+@login_required
+def shipping_quote():
+    """Shipping for the current cart, priced exactly as checkout will charge it."""
+    summary = load_cart(current_user.id)
+    lat, lng = delivery_point(request.args)
+    try:
+        quotes = quote_shipping(summary, lat, lng, manual_distance_km(request.args))
+    except DeliveryPointRequired:
+        return jsonify({'error': 'Pin your delivery location on the map to price shipping.'}), 400
+    shipping_fee = sum(quote.fee for quote in quotes.values())
+    return jsonify({
+        'groups': [
+            {'company_id': company_id, 'distance_km': quote.distance_km, 'shipping_fee': quote.fee}
+            for company_id, quote in quotes.items()
+        ],
+        'subtotal': summary.subtotal,
+        'shipping_fee': shipping_fee,
+        'total': summary.subtotal + shipping_fee,
+    })
+
+
 # =========================================
 # BUYER: ORDERS
 # =========================================
@@ -292,11 +313,11 @@ def request_discount(company_id):
 
     request_item = DiscountRequest(buyer_id=current_user.id, company_id=company_id)
     db.session.add(request_item)
-    db.session.add(CompanyActivity(
+    record_company_activity(
         company_id=company_id,
         action='DISCOUNT_REQUESTED',
         description=f'Buyer {current_user.username} requested discount'
-    ))
+    )
     db.session.commit()
     log_activity(current_user.id, "DISCOUNT_REQUESTED", f"Discount requested for company {company_id}", company_id=company_id)
     flash('Discount request submitted.', 'success')
@@ -334,9 +355,11 @@ def submit_review():
         user_id=current_user.id
     ).first()
     if existing_review:
+        previous_rating = existing_review.rating
         existing_review.rating = int(rating)
         existing_review.review_text = review
     else:
+        previous_rating = None
         db.session.add(ProductReview(
             product_id=product.id,
             user_id=current_user.id,
@@ -344,14 +367,9 @@ def submit_review():
             review_text=review
         ))
 
-    avg_rating, review_count = db.session.query(
-        func.avg(ProductReview.rating),
-        func.count(ProductReview.id)
-    ).filter(ProductReview.product_id == product.id).first()
-    product.rating_avg = round(float(avg_rating or 4.0), 1)
-    product.rating_count = int(review_count or 0)
+    record_rating(product.id, int(rating), previous_rating)
+    bump_catalog_version()
 
-    admins = User.query.filter_by(role='admin').all()
     subject = f"New Product Review: {product.name}"
     body = (
         f"Product: {product.name}\n"
@@ -361,10 +379,14 @@ def submit_review():
         f"Rating: {rating}/5\n\n"
         f"Review:\n{review}\n"
     )
-    for admin in admins:
-        send_email(admin.email, subject, body, enabled=True)
-
+    # Commit before mailing: the rating UPDATE and the catalog version bump
+    # hold row locks that checkouts and product edits also need.
     db.session.commit()
+    product_changed(product.id)
+
+    admin_emails = [email for (email,) in db.session.query(User.email).filter(User.role == 'admin')]
+    for email in admin_emails:
+        send_email(email, subject, body, enabled=True)
     flash('Review submitted. Thank you!', 'success')
     if next_url.startswith('/'):
         return redirect(next_url)
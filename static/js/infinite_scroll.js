@@ -0,0 +1,53 @@
+// ==============================
+// infinite_scroll.js
+// Appends catalog pages from the JSON feed endpoints as the buyer scrolls
+// ==============================
+
+(function () {
+    document.querySelectorAll('.catalog-load-more').forEach((holder) => {
+        const grid = document.getElementById(holder.dataset.grid);
+        const link = holder.querySelector('a');
+        if (!grid || !holder.dataset.feedUrl) return;
+
+        let loading = false;
+        const loadNext = async () => {
+            const cursor = holder.dataset.nextCursor;
+            if (loading || !cursor) return;
+            loading = true;
+            try {
+                const url = new URL(holder.dataset.feedUrl, window.location.origin);
+                url.searchParams.set('cursor', cursor);
+                const res = await fetch(url, { headers: { 'Accept': 'application/json' } });
+                if (!res.ok) return;
+                const data = await res.json();
+                grid.insertAdjacentHTML('beforeend', data.html || '');
+                // Background refreshes only know about the first page.
+                grid.dataset.extended = '1';
+                if (data.next_cursor) {
+                    holder.dataset.nextCursor = data.next_cursor;
+                } else {
+                    holder.remove();
+                    if (observer) observer.disconnect();
+                }
+            } catch (e) {
+                // keep the plain "Load more" link as a fallback
+            } finally {
+                loading = false;
+            }
+        };
+
+        if (link) {
+            link.addEventListener('click', (event) => {
+                event.preventDefault();
+                loadNext();
+            });
+        }
+
+        const observer = 'IntersectionObserver' in window
+            ? new IntersectionObserver((entries) => {
+                if (entries.some((entry) => entry.isIntersecting)) loadNext();
+            }, { rootMargin: '400px 0px' })
+            : null;
+        if (observer) observer.observe(holder);
+    });
+})();
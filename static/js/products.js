@@ -4,62 +4,59 @@
 // ==============================
 
 // ==============================
-// Product Data (24 items example, add remaining items as needed)
+// Product Data (loaded from the JSON catalog API)
 // ==============================
-window.productsData = [
-    {
-        id: 1,
-        name: "Wireless Bluetooth Headphones with Noise Cancellation",
-        price: 6985,
-        originalPrice: 134985,
-        image: "/static/images/headphones.jpg", // optional local path
-        images: [
-            "/static/images/headphones.jpg",
-            "/static/images/headphones1.jpg",
-            "/static/images/headphones2.jpg"
-        ],
-        category: "Electronics",
-        badge: "Bestseller",
-        rating: 4.5,
-        ratingCount: 1243,
-        description: "Premium wireless headphones with active noise cancellation, 30-hour battery life, and superior sound quality. Perfect for music lovers and professionals.",
+window.productsData = [];
+
+const CATALOG_API_URL = '/api/v1/products?per_page=96';
+const CATALOG_POLL_MS = 60000;
+
+function toProductData(item) {
+    const image = item.image_url || '/static/images/headphones.jpg';
+    const variants = item.images || {};
+    return {
+        id: item.id,
+        name: item.name,
+        price: item.effective_price,
+        originalPrice: item.sale_price ? item.price : null,
+        image: (variants.card && (variants.card.webp || variants.card.jpeg)) || image,
+        images: [(variants.detail && (variants.detail.webp || variants.detail.jpeg)) || image],
+        category: item.company_name || 'All',
+        badge: item.is_new ? 'New' : (item.is_hot ? 'Hot' : ''),
+        rating: item.rating_avg || 0,
+        ratingCount: item.rating_count || 0,
+        description: item.description || '',
         specifications: {
-            "Battery Life": "30 hours",
-            "Connectivity": "Bluetooth 5.0",
-            "Noise Cancellation": "Active",
-            "Water Resistance": "IPX4",
-            "Weight": "250g",
-            "Color": "Black"
+            "Weight": item.weight_grams ? `${item.weight_grams}g` : 'N/A',
+            "Size": item.size_desc || 'N/A',
+            "Sold by": item.company_name || 'N/A'
         },
-        stock: 45
-    },
-    {
-        id: 2,
-        name: "Smart Watch Fitness Tracker with Heart Rate Monitor",
-        price: 14985,
-        originalPrice: 194985,
-        image: "/static/images/smartwatch.jpg",
-        images: [
-            "/static/images/smartwatch.jpg",
-            "/static/images/smartwatch1.jpg"
-        ],
-        category: "Electronics",
-        badge: "New",
-        rating: 4.2,
-        ratingCount: 856,
-        description: "Advanced smartwatch with fitness tracking, heart rate monitoring, sleep tracking, and smartphone notifications.",
-        specifications: {
-            "Display": "1.3\" AMOLED",
-            "Battery Life": "7 days",
-            "Water Resistance": "5 ATM",
-            "GPS": "Built-in",
-            "Sensors": "Heart Rate, SpO2, Accelerometer",
-            "Compatibility": "iOS & Android"
-        },
-        stock: 32
-    },
-    // Add remaining 22 products here following the same format
-];
+        stock: item.stock
+    };
+}
+
+// The browser revalidates with If-None-Match, so polls that find no
+// catalog change come back as an empty 304.
+window.loadCatalog = async function() {
+    try {
+        const res = await fetch(CATALOG_API_URL, { cache: 'no-cache', headers: { 'Accept': 'application/json' } });
+        if (!res.ok) return;
+        const data = await res.json();
+        window.productsData = (data.products || []).map(toProductData);
+        if (typeof window.renderProducts === 'function') {
+            window.renderProducts(window.productsData);
+        }
+    } catch (e) {
+        // keep the last rendered catalog on network errors
+    }
+};
+
+document.addEventListener('DOMContentLoaded', () => {
+    window.loadCatalog();
+    setInterval(() => {
+        if (!document.hidden) window.loadCatalog();
+    }, CATALOG_POLL_MS);
+});
 
 // ==============================
 // Utility Functions
@@ -93,7 +90,7 @@ window.renderProducts = function(filteredProducts = window.productsData) {
         card.className = 'product-card';
         card.innerHTML = `
             ${product.badge ? `<div class="product-badge ${product.badge.toLowerCase().includes('sale') ? 'sale' : product.badge.toLowerCase().includes('new') ? 'new' : 'hot'}">${product.badge}</div>` : ''}
-            <img src="${product.image}" alt="${product.name}" class="product-img" onclick="openProductModal(${product.id})">
+            <img src="${product.image}" alt="${product.name}" class="product-img" loading="lazy" onclick="openProductModal(${product.id})">
             <div class="product-info">
                 <h3 class="product-title" onclick="openProductModal(${product.id})" style="cursor:pointer;">${product.name}</h3>
                 <div class="product-price">
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import re
+import stat
+
+from flask import send_from_directory
+
+from cache import LRUCache
+
+MANIFEST_NAME = "manifest.json"
+# User uploads get uuid names and are never rewritten, so they need no hash.
+UPLOADS_PREFIX = "uploads/"
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 31536000
+HASHED_NAME = re.compile(r"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<ext>\.[^./]+)$" % HASH_LENGTH)
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(filename, digest):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest}{ext}"
+
+
+def build_manifest(static_folder):
+    """Map every file under ``static_folder`` to its content-hashed name."""
+    manifest = {}
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            full_path = os.path.join(root, name)
+            filename = os.path.relpath(full_path, static_folder).replace(os.sep, "/")
+            if filename == MANIFEST_NAME or filename.startswith(UPLOADS_PREFIX):
+                continue
+            manifest[filename] = hashed_name(filename, file_digest(full_path))
+    return manifest
+
+
+class StaticAssets:
+    """Content-hashed ``url_for('static')`` URLs served with long-lived caching.
+
+    Hashes come from ``static/manifest.json`` when it exists (see
+    build_static_manifest.py, run by the deploy build). Other files are hashed
+    on first use and kept in a bounded LRU; in debug mode every file is, so
+    edits show up at once. Uploads keep their plain URLs.
+    """
+
+    def __init__(self):
+        self.static_folder = None
+        self.trust_manifest = False
+        self._manifest = {}
+        self._computed = LRUCache(4096)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.trust_manifest = not app.debug
+        self._computed.maxsize = app.config.get('STATIC_DIGEST_CACHE_MAX_ENTRIES', 4096)
+        manifest_path = os.path.join(app.static_folder, MANIFEST_NAME)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as handle:
+                self._manifest = json.load(handle)
+        app.url_defaults(self._hash_static_url)
+        app.view_functions["static"] = self.serve
+
+    def digest_for(self, filename):
+        """Current content hash of a static file, or None if it does not exist."""
+        if self.trust_manifest and filename in self._manifest:
+            return HASHED_NAME.match(self._manifest[filename]).group("digest")
+        full_path = os.path.join(self.static_folder, filename)
+        try:
+            file_stat = os.stat(full_path)
+        except (OSError, ValueError):
+            return None
+        if not stat.S_ISREG(file_stat.st_mode):
+            return None
+        signature = (file_stat.st_mtime_ns, file_stat.st_size)
+        cached = self._computed.get(filename)
+        if cached and cached[0] == signature:
+            return cached[1]
+        digest = file_digest(full_path)
+        self._computed.set(filename, (signature, digest))
+        return digest
+
+    def _hash_static_url(self, endpoint, values):
+        if endpoint != "static" or "filename" not in values:
+            return
+        filename = values["filename"]
+        if filename.startswith(UPLOADS_PREFIX) or ".." in filename.split("/"):
+            return
+        digest = self.digest_for(filename)
+        if digest:
+            values["filename"] = hashed_name(filename, digest)
+
+    def serve(self, filename):
+        match = HASHED_NAME.match(filename)
+        if match:
+            original = match.group("stem") + match.group("ext")
+            digest = self.digest_for(original)
+            if digest is not None:
+                response = send_from_directory(self.static_folder, original, max_age=IMMUTABLE_MAX_AGE)
+                if digest == match.group("digest"):
+                    response.cache_control.public = True
+                    response.cache_control.immutable = True
+                else:
+                    # A stale hash from an older page: serve the current file, but don't pin it.
+                    self._revalidate(response)
+                return response
+        response = send_from_directory(self.static_folder, filename, max_age=0)
+        self._revalidate(response)
+        return response
+
+    @staticmethod
+    def _revalidate(response):
+        response.cache_control.max_age = None
+        response.cache_control.public = False
+        response.cache_control.no_cache = True
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,70 @@
+from collections import namedtuple
+
+from sqlalchemy import func, select
+
+from extensions import db
+from models import Company, Order, Payment, Product
+from cache import LRUCache
+
+CompanyBalance = namedtuple("CompanyBalance", "id name wallet_balance")
+AdminTotals = namedtuple(
+    "AdminTotals",
+    "total_sales total_payments total_company_balance company_count product_count order_count top_companies"
+)
+
+
+def _sum(column):
+    return select(func.coalesce(func.sum(column), 0.0)).scalar_subquery()
+
+
+def _count(column):
+    return select(func.count(column)).scalar_subquery()
+
+
+class DashboardStats:
+    """Admin dashboard totals, computed in the database and cached briefly.
+
+    Only sums, counts and the ``ADMIN_DASHBOARD_TOP_COMPANIES`` largest
+    balances leave the database, so the page costs the same however many
+    orders have been placed. Results are plain tuples, safe to share between
+    requests, and are reused for ``ADMIN_STATS_TTL`` seconds.
+    """
+
+    def __init__(self, ttl=30, top_n=20):
+        self.top_n = top_n
+        self._cache = LRUCache(maxsize=1, ttl=ttl)
+
+    def init_app(self, app):
+        self._cache.ttl = app.config.get('ADMIN_STATS_TTL', 30)
+        self.top_n = app.config.get('ADMIN_DASHBOARD_TOP_COMPANIES', 20)
+
+    def admin_totals(self):
+        totals = self._cache.get('admin')
+        if totals is None:
+            totals = self._compute()
+            self._cache.set('admin', totals)
+        return totals
+
+    def _compute(self):
+        # One round trip for every total.
+        row = db.session.execute(select(
+            _sum(Order.total_amount),
+            _sum(Payment.amount),
+            _sum(Company.wallet_balance),
+            _count(Company.id),
+            _count(Product.id),
+            _count(Order.id),
+        )).one()
+        top_companies = [
+            CompanyBalance(*company)
+            for company in db.session.query(Company.id, Company.name, Company.wallet_balance)
+            .order_by(func.coalesce(Company.wallet_balance, 0.0).desc(), Company.id)
+            .limit(self.top_n)
+        ]
+        return AdminTotals(*row, top_companies=top_companies)
+
+    def invalidate(self):
+        self._cache.clear()
+
+
+dashboard_stats = DashboardStats()
@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# app.py builds an app at import time; keep it off the developer database.
+_scratch = tempfile.mkdtemp(prefix="abils-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_scratch, "import.db")
+os.environ["UPLOAD_FOLDER"] = os.path.join(_scratch, "uploads")
+os.environ["ACTIVITY_SPOOL_PATH"] = os.path.join(_scratch, "activity.jsonl")
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import Company, User  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """A fresh app on its own SQLite file, with the page cache and activity buffer off."""
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("PAGE_CACHE_ENABLED", "0")
+    monkeypatch.setenv("BLOB_STORE_PATH", str(tmp_path / "blobs"))
+    monkeypatch.setenv("ACTIVITY_SPOOL_PATH", str(tmp_path / "activity.jsonl"))
+    # Write activity rows in the request; test_activity_writer.py covers the buffer.
+    monkeypatch.setenv("ACTIVITY_BUFFER_ENABLED", "0")
+    app = create_app()
+    app.config["TESTING"] = True
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_company(name="Acme", **fields):
+    company = Company(name=name, description=f"{name} store", **fields)
+    db.session.add(company)
+    db.session.commit()
+    return company
+
+
+def make_user(username, role="buyer", **fields):
+    user = User(
+        username=username,
+        email=f"{username}@example.com",
+        # A cheap hash keeps suites that create many users fast.
+        password_hash=generate_password_hash("pw", method="pbkdf2:sha256:1000"),
+        role=role,
+        is_verified=True,
+        **fields
+    )
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, username):
+    response = client.post("/login", data={"email_or_username": username, "password": "pw"})
+    assert response.status_code == 302
+    return response
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from extensions import db
+from models import ActivityLog, CompanyActivity
+from activity import activity_writer, log_activity, record_company_activity
+from conftest import make_company
+
+
+@pytest.fixture
+def writer(app, monkeypatch):
+    """The activity writer with buffering on and no flusher thread; tests flush by hand."""
+    app.config["ACTIVITY_BUFFER_ENABLED"] = True
+    activity_writer.init_app(app)
+    monkeypatch.setattr(activity_writer, "_ensure_thread", lambda: None)
+    activity_writer._take()
+    yield activity_writer
+    activity_writer._take()
+
+
+def test_flush_writes_committed_events_only(app, writer):
+    with app.app_context():
+        company_id = make_company().id
+        record_company_activity(company_id, "KEPT", "committed")
+        db.session.commit()
+        record_company_activity(company_id, "DROPPED", "rolled back")
+        db.session.rollback()
+        log_activity(None, "USER_LOGIN", "buffered", company_id=company_id)
+        assert ActivityLog.query.count() == 0
+
+        assert writer.flush() == 2
+        assert [row.action for row in CompanyActivity.query] == ["KEPT"]
+        assert [(row.action, row.category) for row in ActivityLog.query] == [("USER_LOGIN", "auth")]
+
+
+def test_bad_row_falls_back_to_savepoints(app, writer):
+    with app.app_context():
+        log_activity(None, "FIRST", "written")
+        writer.flush()
+        taken_id = ActivityLog.query.one().id
+        writer.enqueue(ActivityLog.__table__, {"id": taken_id, "action": "CLASH"})
+        writer.enqueue(ActivityLog.__table__, {"id": taken_id + 1, "action": "GOOD"})
+
+        writer.flush()
+        assert sorted(row.action for row in ActivityLog.query) == ["FIRST", "GOOD"]
+
+
+def test_failed_flush_spools_and_replays(app, writer, monkeypatch):
+    def database_down(entries):
+        raise RuntimeError("database unavailable")
+
+    with app.app_context():
+        log_activity(None, "PAYMENT_RECEIVED", "spooled")
+        with monkeypatch.context() as patch:
+            patch.setattr(writer, "_insert", database_down)
+            assert writer.flush() == 0
+        assert os.path.exists(writer.spool_path)
+        assert ActivityLog.query.count() == 0
+
+        writer._replay_spool()
+        assert not os.path.exists(writer.spool_path)
+        assert [(row.action, row.category) for row in ActivityLog.query] == [("PAYMENT_RECEIVED", "money")]
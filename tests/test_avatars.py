@@ -0,0 +1,27 @@
+import os
+from types import SimpleNamespace
+
+from avatars import DEFAULT_AVATAR, avatar_resolver
+
+
+def count_stats(monkeypatch):
+    calls = []
+    real_stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        calls.append(path)
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "stat", counting_stat)
+    return calls
+
+
+def test_flagged_avatars_are_resolved_once(app, monkeypatch):
+    # Any existing static file will do; its path only has to resolve.
+    user = SimpleNamespace(avatar_path=DEFAULT_AVATAR, avatar_exists=True)
+    with app.test_request_context():
+        avatar_resolver.clear()
+        calls = count_stats(monkeypatch)
+        urls = {avatar_resolver.url(user) for _ in range(100)}
+    assert len(urls) == 1
+    assert len(calls) <= 1
@@ -0,0 +1,22 @@
+from extensions import db
+from models import Product
+from catalog import parse_filters
+from conftest import make_company
+
+
+def test_non_finite_numbers_are_dropped():
+    args = {"min_price": "nan", "max_price": "inf", "min_rating": "-inf"}
+    assert parse_filters(args) == {}
+    assert parse_filters({"min_price": "1500", "max_price": "nope"}) == {"min_price": 1500.0}
+
+
+def test_nan_price_does_not_hide_the_catalog(app, client):
+    with app.app_context():
+        company = make_company()
+        db.session.add(Product(name="Gadget", description="A gadget", price=1000, stock=5, company_id=company.id))
+        db.session.commit()
+    response = client.get("/marketplace?min_price=nan")
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    assert "Gadget" in body
+    assert "min_price=nan" not in body
@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from extensions import db
+from models import Product
+from conftest import make_company
+
+
+@contextmanager
+def count_queries(app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def add_products(app, count):
+    with app.app_context():
+        start = Product.query.count()
+        # One store per product, so lazy-loading stores would grow with the page.
+        for index in range(start, start + count):
+            company = make_company(f"Store {index}")
+            db.session.add(Product(
+                name=f"Gadget {index}",
+                description="A gadget",
+                price=1000 + index,
+                stock=5,
+                company_id=company.id
+            ))
+        db.session.commit()
+        return Product.query.order_by(Product.id).first().id
+
+
+def page_query_counts(app, client, product_id):
+    urls = ["/shop/products", "/marketplace", "/marketplace?q=gadget", f"/shop/products/{product_id}"]
+    counts = {}
+    for url in urls:
+        with count_queries(app) as statements:
+            response = client.get(url)
+        assert response.status_code == 200, url
+        counts[url] = len(statements)
+    return counts
+
+
+def test_catalog_pages_use_a_fixed_number_of_queries(app, client):
+    product_id = add_products(app, 3)
+    page_query_counts(app, client, product_id)  # warm per-process caches
+    few = page_query_counts(app, client, product_id)
+
+    add_products(app, 60)
+    many = page_query_counts(app, client, product_id)
+
+    assert few == many
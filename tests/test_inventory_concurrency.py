@@ -0,0 +1,88 @@
+import threading
+
+from extensions import db
+from models import CartItem, Order, OrderItem, Product
+from inventory import OutOfStock, reserve_stock
+from conftest import login, make_company, make_user
+
+BUYERS = 20
+STOCK = 5
+
+
+def add_hot_product(app, stock=STOCK):
+    with app.app_context():
+        company = make_company("Hot Store", pickup_lat=6.5, pickup_lng=3.3)
+        product = Product(name="Hot item", price=1000, stock=stock, company_id=company.id)
+        db.session.add(product)
+        db.session.commit()
+        return product.id
+
+
+def run_together(workers):
+    """Start every worker at once and wait for all of them."""
+    barrier = threading.Barrier(len(workers))
+    errors = []
+
+    def run(worker):
+        barrier.wait()
+        try:
+            worker()
+        except Exception as exc:  # surfaced in the main thread below
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+
+
+def test_concurrent_reservations_never_oversell(app):
+    product_id = add_hot_product(app)
+    reserved = []
+
+    def buy():
+        with app.app_context():
+            try:
+                reserve_stock([(product_id, 1)])
+            except OutOfStock:
+                db.session.rollback()
+                return
+            db.session.commit()
+            reserved.append(1)
+
+    run_together([buy] * BUYERS)
+
+    with app.app_context():
+        assert len(reserved) == STOCK
+        assert db.session.get(Product, product_id).stock == 0
+
+
+def test_concurrent_checkouts_never_oversell(app):
+    product_id = add_hot_product(app)
+    clients = []
+    with app.app_context():
+        for index in range(BUYERS):
+            buyer = make_user(f"buyer{index}")
+            db.session.add(CartItem(user_id=buyer.id, product_id=product_id, quantity=1))
+        db.session.commit()
+    for index in range(BUYERS):
+        client = app.test_client()
+        login(client, f"buyer{index}")
+        clients.append(client)
+
+    def checkout(client):
+        def post():
+            response = client.post("/shop/checkout", data={"delivery_lat": "6.6", "delivery_lng": "3.4"})
+            assert response.status_code == 302
+        return post
+
+    run_together([checkout(client) for client in clients])
+
+    with app.app_context():
+        stock = db.session.get(Product, product_id).stock
+        sold = db.session.query(db.func.sum(OrderItem.quantity)).filter(OrderItem.product_id == product_id).scalar()
+        assert stock == 0
+        assert sold == STOCK
+        assert Order.query.count() == STOCK
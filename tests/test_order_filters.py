@@ -0,0 +1,33 @@
+from datetime import date, datetime
+
+from extensions import db
+from models import Order
+from orders import order_listing, parse_order_filters
+from conftest import login, make_company, make_user
+
+
+def add_order(created_at):
+    company = make_company(f"Store {created_at:%Y%m%d}")
+    order = Order(company_id=company.id, total_amount=1000, created_at=created_at)
+    db.session.add(order)
+    db.session.commit()
+    return order.id
+
+
+def test_date_to_includes_the_whole_day(app):
+    with app.app_context():
+        late = add_order(datetime(2026, 3, 1, 23, 59, 59))
+        add_order(datetime(2026, 3, 2, 0, 0, 0))
+        rows, _ = order_listing(parse_order_filters({"date_to": "2026-03-01"}))
+        assert [row.Order.id for row in rows] == [late]
+
+
+def test_date_to_accepts_the_last_representable_day(app, client):
+    with app.app_context():
+        make_user("admin", role="admin")
+        order_id = add_order(datetime(2026, 3, 1, 12, 0, 0))
+        assert parse_order_filters({"date_to": "9999-12-31"}) == {"date_to": date.max}
+    login(client, "admin")
+    response = client.get("/admin/orders?date_to=9999-12-31")
+    assert response.status_code == 200
+    assert f"<td>{order_id}</td>" in response.get_data(as_text=True)
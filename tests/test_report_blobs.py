@@ -0,0 +1,70 @@
+import threading
+from io import BytesIO
+
+from extensions import db
+from models import DailyReport
+from blobstore import blob_store
+from reports import commit_report_pdf, release_report_blobs, store_report_pdf
+from conftest import make_company
+
+PDF = b"%PDF-1.4 same report body"
+
+
+def add_report(company_id, stream):
+    report = DailyReport(company_id=company_id, content="daily", pdf_filename="report.pdf")
+    store_report_pdf(report, stream, "application/pdf")
+    db.session.add(report)
+    return report
+
+
+def test_identical_upload_survives_concurrent_release(app):
+    with app.app_context():
+        company_id = make_company().id
+        old = add_report(company_id, BytesIO(PDF))
+        db.session.commit()
+        old_id, key = old.id, old.pdf_blob_key
+
+    uploaded = threading.Event()
+    released = threading.Event()
+    errors = []
+
+    def upload():
+        with app.app_context():
+            try:
+                stream = BytesIO(PDF)
+                report = add_report(company_id, stream)
+                # put() matched the old report's blob, which is deleted below
+                # before this row is committed.
+                uploaded.set()
+                released.wait(5)
+                commit_report_pdf(report, stream)
+            except Exception as exc:  # surfaced in the main thread below
+                errors.append(exc)
+                uploaded.set()
+
+    thread = threading.Thread(target=upload)
+    thread.start()
+    uploaded.wait(5)
+    with app.app_context():
+        db.session.delete(db.session.get(DailyReport, old_id))
+        db.session.commit()
+        release_report_blobs([key])
+    released.set()
+    thread.join()
+
+    assert not errors, errors
+    with app.app_context():
+        assert DailyReport.query.one().pdf_blob_key == key
+        assert blob_store.exists(key)
+
+
+def test_reports_stay_in_the_database_without_a_durable_store(app, monkeypatch):
+    monkeypatch.setattr(blob_store, "durable", False)
+    with app.app_context():
+        company_id = make_company().id
+        report = add_report(company_id, BytesIO(PDF))
+        db.session.commit()
+        report = db.session.get(DailyReport, report.id)
+        assert report.pdf_blob_key is None
+        assert report.pdf_data == PDF
+        assert report.has_pdf
@@ -0,0 +1,23 @@
+import os
+
+from flask import url_for
+
+from static_assets import static_assets
+
+
+def test_uploads_keep_plain_urls_without_a_stat(app, monkeypatch):
+    calls = []
+    monkeypatch.setattr(os, "stat", lambda *args, **kwargs: calls.append(args))
+    with app.test_request_context():
+        url = url_for("static", filename="uploads/products/0f8e2c.webp")
+    assert url == "/static/uploads/products/0f8e2c.webp"
+    assert calls == []
+
+
+def test_computed_digests_are_bounded(app, monkeypatch):
+    static_assets._computed.clear()
+    monkeypatch.setattr(static_assets._computed, "maxsize", 2)
+    with app.test_request_context():
+        for filename in ("css/style.css", "images/default_avatar.svg", "abils_logo.png"):
+            assert url_for("static", filename=filename) != f"/static/{filename}"
+    assert len(static_assets._computed._data) == 2